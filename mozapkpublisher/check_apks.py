@@ -24,6 +24,8 @@ def main():
         config.skip_check_multiple_locales,
         config.skip_check_same_locales,
         config.skip_check_ordered_version_codes,
+        jobs=config.jobs,
+        metadata_cache_dir=config.metadata_cache_dir,
     )
 
 
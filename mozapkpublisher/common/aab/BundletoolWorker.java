@@ -0,0 +1,53 @@
+import com.android.tools.build.bundletool.commands.DumpCommand;
+import com.android.tools.build.bundletool.flags.FlagParser;
+import com.android.tools.build.bundletool.flags.ParsedFlags;
+
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.nio.charset.StandardCharsets;
+
+/**
+ * Keeps a JVM with bundletool loaded and runs one bundletool command per line read on stdin.
+ *
+ * Arguments of a command are separated by NUL characters. Once a command is done, the sentinel
+ * given as first argument is printed on its own line, followed by a space and the exit status of
+ * the command, so the caller knows where the output ends and whether the command failed.
+ *
+ * Commands are run through their classes rather than BundleToolMain.main(), because the latter
+ * exits the JVM once the command is done. Only the commands used by mozapkpublisher are supported.
+ *
+ * Run with: java -cp bundletool.jar BundletoolWorker.java SENTINEL
+ */
+public class BundletoolWorker {
+    public static void main(String[] args) throws Exception {
+        String sentinel = args[0];
+        BufferedReader stdin = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+
+        String line;
+        while ((line = stdin.readLine()) != null) {
+            int status = run(line.split("\0", -1));
+            System.out.flush();
+            System.out.println(sentinel + " " + status);
+            System.out.flush();
+        }
+    }
+
+    private static int run(String[] args) {
+        try {
+            ParsedFlags flags = new FlagParser().parse(args);
+            String command = flags.getMainCommand().orElse("");
+            switch (command) {
+                case DumpCommand.COMMAND_NAME:
+                    DumpCommand.fromFlags(flags).execute();
+                    return 0;
+                default:
+                    System.err.println("Unsupported bundletool command: \"" + command + "\"");
+                    return 2;
+            }
+        } catch (Exception e) {
+            System.err.println("bundletool error: " + e.getMessage());
+            e.printStackTrace();
+            return 1;
+        }
+    }
+}
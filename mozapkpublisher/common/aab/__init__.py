@@ -1,19 +1,69 @@
 import argparse
+import logging
+import queue
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+
+from mozapkpublisher.common.aab.bundletool import BundletoolWorker
 from mozapkpublisher.common.aab.extractor import extract_metadata
+from mozapkpublisher.common.metadata_cache import add_metadata_cache_arguments, MetadataCache
+from mozapkpublisher.common.utils import collect_results_in_order
+
+logger = logging.getLogger(__name__)
 
 
 def add_aab_checks_arguments(parser):
     parser.add_argument('aabs', metavar='path_to_aab', type=argparse.FileType(mode='rb'), nargs='+',
                         help='The path to the AAB to upload.')
+    parser.add_argument('--use-bundletool', action='store_true',
+                        help='Read the manifest of the AABs with bundletool instead of the builtin reader. '
+                             'Requires java and $BUNDLETOOL_PATH')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of threads used to extract the metadata of the AABs in parallel (default: 1)')
+    add_metadata_cache_arguments(parser)
 
 
 def extract_aabs_metadata(
     aabs,
+    metadata_cache_dir=None,
+    use_bundletool=False,
+    jobs=1,
 ):
-    aabs_metadata = {
-        aab: extract_metadata(aab.name)
-        for aab in aabs
-    }
+    jobs = max(1, min(jobs, len(aabs)))
+    metadata_cache = None if metadata_cache_dir is None else MetadataCache(metadata_cache_dir)
+
+    with ExitStack() as stack:
+        # Each thread borrows its own bundletool process, so that JVMs start at most `jobs` times.
+        # They start lazily, thus AABs found in the cache don't start any.
+        bundletool_workers = queue.Queue()
+        if use_bundletool:
+            for _ in range(jobs):
+                bundletool_workers.put(stack.enter_context(BundletoolWorker()))
+
+        extract = partial(_extract_metadata, metadata_cache, use_bundletool, bundletool_workers)
+        if jobs == 1:
+            return {aab: extract(aab.name) for aab in aabs}
+
+        # Extraction is bound by I/O and bundletool subprocesses, so threads are enough
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(extract, aab.name) for aab in aabs]
+            results = collect_results_in_order(
+                executor, zip(aabs, futures), 'Could not extract metadata from "{}"'
+            )
+
+    return dict(zip(aabs, results))
+
+
+def _extract_metadata(metadata_cache, use_bundletool, bundletool_workers, aab_path):
+    bundletool_worker = bundletool_workers.get() if use_bundletool else None
+    try:
+        extract = partial(extract_metadata, aab_path, use_bundletool, bundletool_worker)
+        if metadata_cache is None:
+            return extract()
 
-    return aabs_metadata
+        return metadata_cache.get_or_extract(aab_path, ('aab', use_bundletool), extract)
+    finally:
+        if bundletool_worker is not None:
+            bundletool_workers.put(bundletool_worker)
@@ -0,0 +1,151 @@
+import logging
+import os
+import queue
+import secrets
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+
+_WORKER_SOURCE = os.path.join(os.path.dirname(__file__), 'BundletoolWorker.java')
+_STOP_GRACE_PERIOD = 5
+
+
+def get_bundletool_path():
+    return os.environ.get('BUNDLETOOL_PATH', './bundletool.jar')
+
+
+class _WorkerDied(Exception):
+    def __init__(self, returncode):
+        super().__init__(returncode)
+        self.returncode = returncode
+
+
+class BundletoolWorker:
+    """Long-lived bundletool process, so that the JVM starts only once for many commands
+
+    The process is started on the first command. It's killed if a command takes longer than
+    `timeout` seconds, and restarted (then the command retried once) if it dies during a command.
+    A command that fails is reported right away, like a bundletool process exiting with an error.
+    """
+
+    def __init__(self, bundletool_path=None, timeout=DEFAULT_TIMEOUT):
+        self._bundletool_path = get_bundletool_path() if bundletool_path is None else bundletool_path
+        self._timeout = timeout
+        # Commands are sent one at a time, because their outputs would interleave otherwise
+        self._lock = threading.Lock()
+        self._process = None
+        self._output_lines = None
+        self._sentinel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, bundletool_args):
+        for arg in bundletool_args:
+            if '\n' in arg or '\0' in arg:
+                raise ValueError('bundletool argument "{}" cannot be sent to the worker'.format(arg))
+
+        with self._lock:
+            try:
+                return self._run(bundletool_args)
+            except _WorkerDied as e:
+                logger.warning('bundletool worker died (exit code {}), restarting it...'.format(e.returncode))
+
+            try:
+                return self._run(bundletool_args)
+            except _WorkerDied as e:
+                raise subprocess.CalledProcessError(e.returncode, ['bundletool'] + list(bundletool_args))
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _get_worker_command(self):
+        return ['java', '-cp', self._bundletool_path, _WORKER_SOURCE, self._sentinel]
+
+    def _start(self):
+        self._sentinel = 'BUNDLETOOL_WORKER_DONE_{}'.format(secrets.token_hex(16))
+        cmd = self._get_worker_command()
+        logger.debug(f'Starting bundletool worker: {cmd}')
+        self._process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8', bufsize=1,
+        )
+
+        # Output is read by a thread, so that a stuck command can be timed out
+        self._output_lines = queue.Queue()
+        threading.Thread(
+            target=_forward_lines, args=(self._process.stdout, self._output_lines), daemon=True,
+        ).start()
+
+    def _stop(self, kill=False):
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        if not kill:
+            try:
+                process.wait(timeout=_STOP_GRACE_PERIOD)
+            except subprocess.TimeoutExpired:
+                kill = True
+
+        if kill:
+            process.kill()
+            process.wait()
+
+    def _run(self, bundletool_args):
+        if self._process is None:
+            self._start()
+
+        logger.debug(f'Running bundletool command: {bundletool_args}')
+        try:
+            self._process.stdin.write('\0'.join(bundletool_args) + '\n')
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            raise self._on_death()
+
+        lines = []
+        deadline = time.monotonic() + self._timeout
+        while True:
+            try:
+                line = self._output_lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._stop(kill=True)
+                raise subprocess.TimeoutExpired(['bundletool'] + list(bundletool_args), self._timeout)
+
+            if line is None:
+                raise self._on_death()
+            # The worker ends the output of each command with "<sentinel> <exit status>"
+            sentinel, _, status = line.rstrip('\n').partition(' ')
+            if sentinel == self._sentinel:
+                break
+            lines.append(line)
+
+        out = ''.join(lines).strip('\n')
+        logger.debug(f'Output: {out}')
+        if status != '0':
+            raise subprocess.CalledProcessError(int(status), ['bundletool'] + list(bundletool_args), output=out)
+        return out
+
+    def _on_death(self):
+        process = self._process
+        self._stop(kill=True)
+        return _WorkerDied(process.returncode)
+
+
+def _forward_lines(stream, lines):
+    for line in iter(stream.readline, ''):
+        lines.put(line)
+    # End of stream: the worker died
+    lines.put(None)
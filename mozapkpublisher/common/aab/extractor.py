@@ -1,32 +1,71 @@
 import logging
-import os
-import shutil
 import subprocess
-import tempfile
 
+from xml.etree import ElementTree
+from zipfile import BadZipFile, ZipFile
+
+from mozapkpublisher.common.aab.bundletool import get_bundletool_path
+from mozapkpublisher.common.exceptions import BadAab
 
 logger = logging.getLogger(__name__)
 
 
-def extract_metadata(aab_path):
+_ANDROID_NAMESPACE = '{http://schemas.android.com/apk/res/android}'
+
+_MANIFEST_LOCATION = 'base/manifest/AndroidManifest.xml'
+_DIRECTORY_WITH_ARCHITECTURE_METADATA = 'base/lib/'     # For instance: base/lib/x86/ or base/lib/armeabi-v7a/
+
+# Field numbers of the messages used by aapt2 to serialize XML files. See
+# https://android.googlesource.com/platform/frameworks/base/+/refs/heads/main/tools/aapt2/Resources.proto
+_XML_NODE_ELEMENT = 1
+_XML_ELEMENT_NAMESPACE_URI = 2
+_XML_ELEMENT_NAME = 3
+_XML_ELEMENT_ATTRIBUTE = 4
+_XML_ELEMENT_CHILD = 5
+_XML_ATTRIBUTE_NAMESPACE_URI = 1
+_XML_ATTRIBUTE_NAME = 2
+_XML_ATTRIBUTE_VALUE = 3
+_XML_ATTRIBUTE_COMPILED_ITEM = 6
+_ITEM_STR = 2
+_ITEM_RAW_STR = 3
+_ITEM_PRIM = 7
+_STRING_VALUE = 1
+_PRIMITIVE_INT_DECIMAL_VALUE = 6
+_PRIMITIVE_INT_HEXADECIMAL_VALUE = 7
+
+_WIRE_TYPE_VARINT = 0
+_WIRE_TYPE_64_BIT = 1
+_WIRE_TYPE_LENGTH_DELIMITED = 2
+_WIRE_TYPE_32_BIT = 5
+
+
+def extract_metadata(aab_path, use_bundletool=False, bundletool_worker=None):
     logger.info('Extracting metadata from "{}"...'.format(aab_path))
-    metadata = {}
 
-    with tempfile.NamedTemporaryFile() as aab_copy:
-        shutil.copy(aab_path, aab_copy.name)
-        aab_copy.seek(0)
+    try:
+        with ZipFile(aab_path) as aab_zip:
+            if use_bundletool:
+                manifest_element = _parse_xml_manifest(_dump_manifest(aab_path, bundletool_worker), aab_path)
+            else:
+                manifest_element = _read_proto_manifest(aab_zip, aab_path)
 
-        metadata['package_name'] = _extract_package_name(aab_copy.name)
-        logger.info('Found package name "{}"'.format(metadata['package_name']))
-        metadata['version_code'] = _extract_version_code(aab_copy.name)
-        logger.info('Found version code "{}"'.format(metadata['version_code']))
+            architectures = _extract_architectures(aab_zip)
+    except BadZipFile as e:
+        raise BadAab('"{}" is not a valid AAB: {}'.format(aab_path, e))
+
+    metadata = _extract_metadata_from_manifest(manifest_element, aab_path)
+    metadata['architectures'] = architectures
+    logger.info('Found package name "{}"'.format(metadata['package_name']))
+    logger.info('Found version code "{}"'.format(metadata['version_code']))
 
     return metadata
 
 
-def _run_bundletool(bundletool_args):
-    bundletool_path = os.environ.get("BUNDLETOOL_PATH", "./bundletool.jar")
-    cmd = ['java', '-jar', bundletool_path] + bundletool_args
+def _run_bundletool(bundletool_args, bundletool_worker=None):
+    if bundletool_worker is not None:
+        return bundletool_worker.run(bundletool_args)
+
+    cmd = ['java', '-jar', get_bundletool_path()] + bundletool_args
     logger.debug(f'Running command: {cmd}')
     out = subprocess.check_output(cmd, text=True)
     out = out.strip('\n')
@@ -34,13 +73,176 @@ def _run_bundletool(bundletool_args):
     return out
 
 
-def _extract_package_name(aab_path):
-    args = ['dump', 'manifest', f'--bundle={aab_path}', '--xpath=/manifest/@package']
-    out = _run_bundletool(args)
-    return out
+def _dump_manifest(aab_path, bundletool_worker=None):
+    # Each bundletool call pays for the startup of a JVM, so the whole manifest is dumped at once.
+    # bundletool only reads the AAB, so it's given the original file rather than a copy.
+    args = ['dump', 'manifest', f'--bundle={aab_path}']
+    return _run_bundletool(args, bundletool_worker)
 
 
-def _extract_version_code(aab_path):
-    args = ['dump', 'manifest', f'--bundle={aab_path}', '--xpath=/manifest/@android:versionCode']
-    out = _run_bundletool(args)
-    return out
+def _parse_xml_manifest(manifest, aab_path):
+    try:
+        return ElementTree.fromstring(manifest)
+    except ElementTree.ParseError as e:
+        raise BadAab('Could not parse the manifest of "{}": {}'.format(aab_path, e))
+
+
+def _read_proto_manifest(aab_zip, aab_path):
+    try:
+        manifest = aab_zip.read(_MANIFEST_LOCATION)
+    except KeyError:
+        raise BadAab('"{}" does not contain "{}"'.format(aab_path, _MANIFEST_LOCATION))
+
+    try:
+        manifest_element = _decode_xml_node(memoryview(manifest))
+    except (IndexError, UnicodeDecodeError, ValueError) as e:
+        raise BadAab('Could not decode the manifest of "{}": {}'.format(aab_path, e))
+
+    if manifest_element is None or manifest_element.tag != 'manifest':
+        raise BadAab('"{}" in "{}" does not start with a <manifest> element'.format(_MANIFEST_LOCATION, aab_path))
+
+    return manifest_element
+
+
+def _extract_metadata_from_manifest(manifest_element, aab_path):
+    uses_sdk_element = manifest_element.find('uses-sdk')
+    min_sdk_version = None if uses_sdk_element is None else uses_sdk_element.get(f'{_ANDROID_NAMESPACE}minSdkVersion')
+
+    api_level = None
+    if min_sdk_version is not None:
+        try:
+            api_level = int(min_sdk_version)
+        except ValueError:
+            # e.g.: the codename of a preview SDK
+            raise BadAab('"{}" has a non-numeric minSdkVersion: "{}"'.format(aab_path, min_sdk_version))
+
+    return {
+        'package_name': manifest_element.get('package'),
+        'version_code': manifest_element.get(f'{_ANDROID_NAMESPACE}versionCode'),
+        'version_name': manifest_element.get(f'{_ANDROID_NAMESPACE}versionName'),
+        'api_level': api_level,
+    }
+
+
+def _extract_architectures(aab_zip):
+    architectures = {
+        zip_info.filename[len(_DIRECTORY_WITH_ARCHITECTURE_METADATA):].split('/')[0]
+        for zip_info in aab_zip.infolist()
+        if zip_info.filename.startswith(_DIRECTORY_WITH_ARCHITECTURE_METADATA)
+    }
+    return tuple(sorted(architecture for architecture in architectures if architecture))
+
+
+def _decode_xml_node(data):
+    # Text nodes are dropped, the manifest only carries data in elements and attributes
+    for field_number, _, value in _iter_protobuf_fields(data):
+        if field_number == _XML_NODE_ELEMENT:
+            return _decode_xml_element(value)
+
+    return None
+
+
+def _decode_xml_element(data):
+    namespace_uri = ''
+    name = ''
+    attributes = {}
+    children = []
+    for field_number, _, value in _iter_protobuf_fields(data):
+        if field_number == _XML_ELEMENT_NAMESPACE_URI:
+            namespace_uri = _decode_string(value)
+        elif field_number == _XML_ELEMENT_NAME:
+            name = _decode_string(value)
+        elif field_number == _XML_ELEMENT_ATTRIBUTE:
+            attributes.update([_decode_xml_attribute(value)])
+        elif field_number == _XML_ELEMENT_CHILD:
+            child = _decode_xml_node(value)
+            if child is not None:
+                children.append(child)
+
+    element = ElementTree.Element(_qualify_name(namespace_uri, name), attributes)
+    element.extend(children)
+    return element
+
+
+def _decode_xml_attribute(data):
+    namespace_uri = ''
+    name = ''
+    value = ''
+    compiled_value = None
+    for field_number, _, field_value in _iter_protobuf_fields(data):
+        if field_number == _XML_ATTRIBUTE_NAMESPACE_URI:
+            namespace_uri = _decode_string(field_value)
+        elif field_number == _XML_ATTRIBUTE_NAME:
+            name = _decode_string(field_value)
+        elif field_number == _XML_ATTRIBUTE_VALUE:
+            value = _decode_string(field_value)
+        elif field_number == _XML_ATTRIBUTE_COMPILED_ITEM:
+            compiled_value = _decode_item(field_value)
+
+    # aapt2 keeps the original string of most attributes, but values set by tools (e.g.: the
+    # versionCode set by bundletool) may only exist in their compiled form.
+    if not value and compiled_value is not None:
+        value = compiled_value
+
+    return _qualify_name(namespace_uri, name), value
+
+
+def _decode_item(data):
+    for field_number, _, value in _iter_protobuf_fields(data):
+        if field_number in (_ITEM_STR, _ITEM_RAW_STR):
+            for string_field_number, _, string_value in _iter_protobuf_fields(value):
+                if string_field_number == _STRING_VALUE:
+                    return _decode_string(string_value)
+        elif field_number == _ITEM_PRIM:
+            for primitive_field_number, wire_type, primitive_value in _iter_protobuf_fields(value):
+                if primitive_field_number == _PRIMITIVE_INT_DECIMAL_VALUE:
+                    # int32 are encoded as 64-bit two's complement varints
+                    return str(primitive_value - (1 << 64) if primitive_value >= 1 << 63 else primitive_value)
+                elif primitive_field_number == _PRIMITIVE_INT_HEXADECIMAL_VALUE:
+                    return hex(primitive_value)
+
+    return None
+
+
+def _qualify_name(namespace_uri, name):
+    return '{{{}}}{}'.format(namespace_uri, name) if namespace_uri else name
+
+
+def _decode_string(data):
+    return bytes(data).decode('utf-8')
+
+
+def _iter_protobuf_fields(data):
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        field_number, wire_type = key >> 3, key & 0x7
+
+        if wire_type == _WIRE_TYPE_VARINT:
+            value, position = _read_varint(data, position)
+        elif wire_type == _WIRE_TYPE_64_BIT:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == _WIRE_TYPE_LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+            value, position = data[position:position + length], position + length
+        elif wire_type == _WIRE_TYPE_32_BIT:
+            value, position = data[position:position + 4], position + 4
+        else:
+            raise ValueError('Unsupported protobuf wire type {} for field {}'.format(wire_type, field_number))
+
+        if position > len(data):
+            raise ValueError('Truncated protobuf field {}'.format(field_number))
+
+        yield field_number, wire_type, value
+
+
+def _read_varint(data, position):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
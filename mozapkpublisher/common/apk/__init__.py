@@ -1,9 +1,17 @@
 import argparse
+import logging
+
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from functools import partial
 
 from mozapkpublisher.common.apk.checker import (
+    check_apk,
     cross_check_apks,
 )
 from mozapkpublisher.common.apk.extractor import extract_metadata
+from mozapkpublisher.common.metadata_cache import add_metadata_cache_arguments, MetadataCache
+
+logger = logging.getLogger(__name__)
 
 
 def add_apk_checks_arguments(parser):
@@ -20,10 +28,13 @@ def add_apk_checks_arguments(parser):
     parser.add_argument('--skip-checks-fennec', action='store_true',
                         help='Skip checks that are Fennec-specific (ini-checking, checking '
                              'version-to-package-name compliance)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes used to extract the metadata of the APKs in parallel (default: 1)')
     parser.add_argument('--expected-package-name', dest='expected_package_names',
                         action='append',
                         help='Package names apks are expected to match',
                         required=True)
+    add_metadata_cache_arguments(parser)
 
 
 def extract_and_check_apks_metadata(
@@ -33,12 +44,18 @@ def extract_and_check_apks_metadata(
     skip_check_multiple_locales,
     skip_check_same_locales,
     skip_check_ordered_version_codes,
+    jobs=1,
+    metadata_cache_dir=None,
 ):
-    apks_metadata = {
-        apk: extract_metadata(apk.name, not skip_check_same_locales and not skip_check_multiple_locales,
-                              not skip_checks_fennec)
-        for apk in apks
-    }
+    extracted_apks_metadata = dict(_iter_extracted_apks_metadata(
+        apks,
+        extract_locale_metadata=not skip_check_same_locales and not skip_check_multiple_locales,
+        extract_firefox_metadata=not skip_checks_fennec,
+        jobs=jobs,
+        metadata_cache_dir=metadata_cache_dir,
+    ))
+    # Metadata is extracted in whatever order it completes, the checks expect the given order
+    apks_metadata = {apk: extracted_apks_metadata[apk] for apk in apks}
     cross_check_apks(
         apks_metadata,
         expected_package_names,
@@ -49,3 +66,80 @@ def extract_and_check_apks_metadata(
     )
 
     return apks_metadata
+
+
+def iter_checked_apks_metadata(
+    apks,
+    expected_package_names,
+    skip_checks_fennec,
+    skip_check_multiple_locales,
+    skip_check_same_locales,
+    skip_check_ordered_version_codes,
+    jobs=1,
+    metadata_cache_dir=None,
+):
+    """Yields `(apk, metadata)` as soon as an APK is extracted and passes the checks of its own
+
+    APKs are yielded in the order their extraction completes. Checks across APKs are run after the
+    last one is yielded, so the caller must exhaust the generator before trusting any of them.
+    """
+    apks_metadata = {}
+    for apk, metadata in _iter_extracted_apks_metadata(
+        apks,
+        extract_locale_metadata=not skip_check_same_locales and not skip_check_multiple_locales,
+        extract_firefox_metadata=not skip_checks_fennec,
+        jobs=jobs,
+        metadata_cache_dir=metadata_cache_dir,
+    ):
+        check_apk(apk, metadata, expected_package_names, skip_checks_fennec, skip_check_multiple_locales)
+        apks_metadata[apk] = metadata
+        yield apk, metadata
+
+    cross_check_apks(
+        {apk: apks_metadata[apk] for apk in apks},
+        expected_package_names,
+        skip_checks_fennec,
+        skip_check_multiple_locales,
+        skip_check_same_locales,
+        skip_check_ordered_version_codes,
+    )
+
+
+def _iter_extracted_apks_metadata(apks, extract_locale_metadata, extract_firefox_metadata, jobs, metadata_cache_dir):
+    if jobs <= 1 or len(apks) <= 1:
+        for apk in apks:
+            yield apk, _extract_metadata(apk.name, extract_locale_metadata, extract_firefox_metadata, metadata_cache_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(apks))) as executor:
+        apks_per_future = {
+            executor.submit(
+                _extract_metadata, apk.name, extract_locale_metadata, extract_firefox_metadata, metadata_cache_dir
+            ): apk
+            for apk in apks
+        }
+        try:
+            for future in as_completed(apks_per_future):
+                apk = apks_per_future[future]
+                try:
+                    metadata = future.result()
+                except Exception:
+                    logger.error('Could not extract metadata from "{}"'.format(apk.name))
+                    raise
+                yield apk, metadata
+        except BaseException:
+            # Includes the consumer giving up on the generator (e.g.: an APK failed its checks)
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def _extract_metadata(apk_path, extract_locale_metadata, extract_firefox_metadata, metadata_cache_dir):
+    # Module-level function, so that it can be sent to worker processes
+    if metadata_cache_dir is None:
+        return extract_metadata(apk_path, extract_locale_metadata, extract_firefox_metadata)
+
+    return MetadataCache(metadata_cache_dir).get_or_extract(
+        apk_path,
+        ('apk', extract_locale_metadata, extract_firefox_metadata),
+        partial(extract_metadata, apk_path, extract_locale_metadata, extract_firefox_metadata),
+    )
@@ -42,6 +42,20 @@ def cross_check_apks(apks_metadata, expected_package_names, skip_checks_fennec,
     logger.info('APKs are sane!')
 
 
+def check_apk(apk, metadata, expected_package_names, skip_checks_fennec, skip_check_multiple_locales):
+    """Runs the checks that don't need the metadata of other APKs. cross_check_apks() runs them too."""
+    if metadata['package_name'] not in expected_package_names:
+        raise BadApk('"{}" has package name "{}", expected one of {}'.format(
+            apk.name, metadata['package_name'], expected_package_names
+        ))
+
+    if not skip_checks_fennec:
+        _check_version_matches_package_name(metadata['firefox_version'], metadata['package_name'])
+
+    if not skip_check_multiple_locales:
+        _check_apk_is_multi_locales(apk, metadata)
+
+
 def _check_package_names(expected_package_names, apks_metadata):
     types = set([metadata['package_name'] for metadata in apks_metadata.values()])
 
@@ -123,17 +137,21 @@ def _check_apks_version_codes_are_correctly_ordered(apks_metadata):
 
 def _check_all_apks_are_multi_locales(apks_metadata):
     for apk, metadata in apks_metadata.items():
-        locales = metadata['locales']
+        _check_apk_is_multi_locales(apk, metadata)
+
+
+def _check_apk_is_multi_locales(apk, metadata):
+    locales = metadata['locales']
 
-        if not isinstance(locales, tuple):
-            raise BadApk('Locale list is not either a tuple. "{}" has: {}'.format(apk.name, locales))
+    if not isinstance(locales, tuple):
+        raise BadApk('Locale list is not either a tuple. "{}" has: {}'.format(apk.name, locales))
 
-        number_of_locales = len(locales)
+    number_of_locales = len(locales)
 
-        if number_of_locales <= 1:
-            raise NotMultiLocaleApk(apk.name, locales)
+    if number_of_locales <= 1:
+        raise NotMultiLocaleApk(apk.name, locales)
 
-        logger.info('"{}" is multilocale.'.format(apk.name))
+    logger.info('"{}" is multilocale.'.format(apk.name))
 
 
 def _check_all_architectures_and_api_levels_are_present(apks_metadata):
@@ -1,12 +1,16 @@
 import codecs
+import io
 import logging
+import mmap
+import os
 import pyaxmlparser
 import re
 import shutil
+import struct
 import tempfile
 
-from io import BytesIO
-from zipfile import ZipFile
+from contextlib import contextmanager
+from zipfile import ZIP_STORED, ZipFile
 
 
 from mozapkpublisher.common.exceptions import BadApk, NoLocaleFound
@@ -25,28 +29,52 @@ _LOCALE_LINE_PATTERN = re.compile(r'^locale \S+ (\S+) .+')
 _OMNI_JA_LOCATION = 'assets/omni.ja'
 _CHROME_MANIFEST_LOCATION = 'chrome/chrome.manifest'
 
-
-def extract_metadata(original_apk_path, extract_locale_metadata, extract_firefox_metadata):
-    logger.info('Extracting metadata from a copy of "{}"...'.format(original_apk_path))
+# Only the signature and the lengths of the variable-size fields are needed to find the data
+_LOCAL_FILE_HEADER_FORMAT = '<4s22xHH'
+_LOCAL_FILE_HEADER_SIZE = struct.calcsize(_LOCAL_FILE_HEADER_FORMAT)
+_LOCAL_FILE_HEADER_SIGNATURE = b'PK\x03\x04'
+_SPOOLED_FILE_MAX_SIZE = 1024 * 1024
+
+_NETWORK_FILESYSTEM_TYPES = frozenset((
+    '9p', 'afs', 'ceph', 'cifs', 'fuse.gcsfuse', 'fuse.sshfs', 'glusterfs', 'lustre', 'ncpfs', 'nfs', 'nfs4',
+    'smb3', 'smbfs',
+))
+
+
+def extract_metadata(original_apk_path, extract_locale_metadata, extract_firefox_metadata, zero_copy=None):
+    """Extract metadata from an APK without ever writing to it
+
+    Args:
+        original_apk_path (str): path to the APK
+        extract_locale_metadata (bool): whether to extract the locales embedded in omni.ja
+        extract_firefox_metadata (bool): whether to extract the Firefox version and build ID
+        zero_copy (bool): `True` to parse a read-only memory map of the APK, `False` to parse a
+            temporary copy of it. By default, the APK is memory mapped unless it lives on a
+            network filesystem.
+    """
+    if zero_copy is None:
+        zero_copy = _is_on_local_filesystem(original_apk_path)
+
+    logger.info('Extracting metadata from {} "{}"...'.format(
+        'a read-only view of' if zero_copy else 'a copy of', original_apk_path
+    ))
     metadata = {}
 
-    # We make a copy so a potentially malicious library doesn't stain the real APK
-    with tempfile.NamedTemporaryFile() as apk_copy:
-        shutil.copy(original_apk_path, apk_copy.name)
-        apk_copy.seek(0)
-
-        parsed_apk = pyaxmlparser.APK(apk_copy.name)
+    with _open_isolated_apk(original_apk_path, zero_copy) as apk_file:
+        parsed_apk = pyaxmlparser.APK(apk_file)
         package_name = parsed_apk.get_package()
         metadata['package_name'] = package_name
         metadata['api_level'] = int(parsed_apk.get_min_sdk_version())
         metadata['version_code'] = parsed_apk.get_androidversion_code()
         metadata['version_name'] = parsed_apk.get_androidversion_name()
 
-        with ZipFile(apk_copy.name) as apk_zip:
+        # pyaxmlparser already parsed the central directory of the APK to read AndroidManifest.xml.
+        # Reuse it instead of having another ZipFile parse it once more.
+        with parsed_apk.zip as apk_zip:
             metadata['architecture'] = _extract_architecture(apk_zip, original_apk_path)
 
             if extract_locale_metadata:
-                metadata['locales'] = _extract_locales(apk_zip)
+                metadata['locales'] = _extract_locales(apk_zip, original_apk_path)
 
             if extract_firefox_metadata:
                 metadata['firefox_version'] = _extract_firefox_version(apk_zip)
@@ -55,10 +83,66 @@ def extract_metadata(original_apk_path, extract_locale_metadata, extract_firefox
     return metadata
 
 
+class _ReadOnlyMemoryMap(mmap.mmap):
+    # ZipFile expects file objects to tell whether they're seekable, which mmap doesn't
+    def seekable(self):
+        return True
+
+
+@contextmanager
+def _open_isolated_apk(original_apk_path, zero_copy):
+    # Either way, a potentially malicious library can't stain the real APK
+    if zero_copy:
+        with open(original_apk_path, 'rb') as apk_file:
+            if os.fstat(apk_file.fileno()).st_size == 0:
+                raise BadApk('"{}" is empty'.format(original_apk_path))
+
+            with _ReadOnlyMemoryMap(apk_file.fileno(), 0, access=mmap.ACCESS_READ) as apk_view:
+                yield apk_view
+    else:
+        with tempfile.NamedTemporaryFile() as apk_copy:
+            shutil.copy(original_apk_path, apk_copy.name)
+            apk_copy.seek(0)
+            yield apk_copy.name
+
+
+def _is_on_local_filesystem(path):
+    # Memory maps of files on network filesystems may be slower than copies and raise SIGBUS
+    # if the file gets truncated by another host.
+    try:
+        mount_points = _read_mount_points()
+    except OSError:
+        # /proc/self/mounts only exists on Linux. Other platforms are only used by developers,
+        # who keep their APKs on local disks.
+        return True
+
+    real_path = os.path.realpath(path)
+    filesystem_type_per_mount_point = {
+        mount_point: filesystem_type
+        for mount_point, filesystem_type in mount_points
+        if real_path == mount_point or real_path.startswith(mount_point.rstrip('/') + '/')
+    }
+    if not filesystem_type_per_mount_point:
+        return True
+
+    closest_mount_point = max(filesystem_type_per_mount_point, key=len)
+    return filesystem_type_per_mount_point[closest_mount_point] not in _NETWORK_FILESYSTEM_TYPES
+
+
+def _read_mount_points():
+    with open('/proc/self/mounts') as mounts:
+        return [
+            # Spaces in mount points are escaped as "\040"
+            (fields[1].replace('\\040', ' '), fields[2])
+            for fields in (line.split() for line in mounts)
+        ]
+
+
 def _extract_architecture(apk_zip, original_apk_path):
+    # infolist() returns the already-parsed index, unlike namelist() which builds a new list
     files_with_architecture_in_path = [
-        name for name in apk_zip.namelist()
-        if name.startswith(_DIRECTORY_WITH_ARCHITECTURE_METADATA)
+        zip_info.filename for zip_info in apk_zip.infolist()
+        if zip_info.filename.startswith(_DIRECTORY_WITH_ARCHITECTURE_METADATA)
     ]
 
     if not files_with_architecture_in_path:
@@ -102,26 +186,89 @@ def _extract_value_from_application_ini(apk_zip, full_key):
     return config.get(section, key)
 
 
-def _extract_locales(apk_zip):
-    omni_ja_data = BytesIO(apk_zip.read(_OMNI_JA_LOCATION))
-    with ZipFile(omni_ja_data) as omni_ja:
-        with omni_ja.open(_CHROME_MANIFEST_LOCATION) as manifest:
-            manifest_raw_lines = manifest.readlines()
-
-    locales = _get_unique_locales(manifest_raw_lines)
+def _extract_locales(apk_zip, original_apk_path):
+    with _open_archived_file(apk_zip, _OMNI_JA_LOCATION) as omni_ja_file:
+        with ZipFile(omni_ja_file) as omni_ja:
+            with omni_ja.open(_CHROME_MANIFEST_LOCATION) as manifest:
+                locales = _get_unique_locales(manifest)
 
     if len(locales) == 0:
-        raise NoLocaleFound(apk_zip, _OMNI_JA_LOCATION, _CHROME_MANIFEST_LOCATION)
+        raise NoLocaleFound(original_apk_path, _OMNI_JA_LOCATION, _CHROME_MANIFEST_LOCATION)
 
     return locales
 
 
 def _get_unique_locales(manifest_raw_lines):
-    manifest_lines = [line.decode('utf-8') for line in manifest_raw_lines]
-
-    locales = [
-        _LOCALE_LINE_PATTERN.match(line).group(1) for line in manifest_lines
-        if _LOCALE_LINE_PATTERN.match(line) is not None
-    ]
-
-    return tuple(sorted(filter_out_identical_values(locales)))
+    matches = (_LOCALE_LINE_PATTERN.match(line.decode('utf-8')) for line in manifest_raw_lines)
+    locales = {match.group(1) for match in matches if match is not None}
+
+    return tuple(sorted(locales))
+
+
+@contextmanager
+def _open_archived_file(apk_zip, file_name):
+    # omni.ja weighs tens of MB, we don't want to load it in memory just to read a small manifest
+    zip_info = apk_zip.getinfo(file_name)
+    if zip_info.compress_type == ZIP_STORED:
+        data_offset = _get_data_offset(apk_zip, zip_info)
+        yield _FileSlice(apk_zip.fp, data_offset, zip_info.file_size)
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOLED_FILE_MAX_SIZE) as file_copy:
+            with apk_zip.open(zip_info) as archived_file:
+                shutil.copyfileobj(archived_file, file_copy)
+            file_copy.seek(0)
+            yield file_copy
+
+
+def _get_data_offset(apk_zip, zip_info):
+    apk_zip.fp.seek(zip_info.header_offset)
+    signature, file_name_length, extra_field_length = struct.unpack(
+        _LOCAL_FILE_HEADER_FORMAT, apk_zip.fp.read(_LOCAL_FILE_HEADER_SIZE)
+    )
+    if signature != _LOCAL_FILE_HEADER_SIGNATURE:
+        raise BadApk('Bad local file header for "{}"'.format(zip_info.filename))
+
+    return zip_info.header_offset + _LOCAL_FILE_HEADER_SIZE + file_name_length + extra_field_length
+
+
+class _FileSlice(io.RawIOBase):
+    """Read-only and seekable view over a part of a file"""
+
+    def __init__(self, file, start, size):
+        self._file = file
+        self._start = start
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError('Invalid whence: {}'.format(whence))
+
+        self._position = max(position, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._position)
+        if size <= 0:
+            return 0
+
+        self._file.seek(self._start + self._position)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
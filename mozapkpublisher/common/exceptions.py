@@ -8,6 +8,17 @@ class LoggedError(Exception):
         logger.fatal(msg)
         super(LoggedError, self).__init__(msg)
 
+    def __reduce__(self):
+        # Subclasses don't share this constructor signature and we don't want to log the error
+        # once more when it's unpickled (e.g.: when it's sent back by a worker process).
+        return (_unpickle_logged_error, (type(self), self.args), self.__dict__)
+
+
+def _unpickle_logged_error(cls, args):
+    error = cls.__new__(cls)
+    Exception.__init__(error, *args)
+    return error
+
 
 class WrongArgumentGiven(LoggedError):
     pass
@@ -41,3 +52,34 @@ class BadApk(LoggedError):
 
 class BadSetOfApks(LoggedError):
     pass
+
+
+class BadAab(LoggedError):
+    pass
+
+
+class VersionCodeConflict(LoggedError):
+    def __init__(self, file_path, version_code, existing_sha256, file_sha256):
+        super(VersionCodeConflict, self).__init__(
+            'Version code {} of "{}" was already uploaded with another file (SHA-256 "{}" instead of "{}")'.format(
+                version_code, file_path, existing_sha256, file_sha256
+            )
+        )
+
+
+class PushFailed(LoggedError):
+    def __init__(self, failures):
+        self.failures = failures
+        super(PushFailed, self).__init__(
+            'Could not push {} package name(s): {}'.format(
+                len(failures),
+                '; '.join('"{}": {!r}'.format(package_name, error) for package_name, error in failures.items())
+            )
+        )
+
+
+class PushAborted(LoggedError):
+    def __init__(self, package_name):
+        super(PushAborted, self).__init__(
+            'Not committing "{}", since pushing another package name failed'.format(package_name)
+        )
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from mozapkpublisher.common.utils import file_sha512sum
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_DIR_ENV_VAR = 'MOZAPKPUBLISHER_METADATA_CACHE_DIR'
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+# Bump this whenever extractors change the metadata they return, so stale entries aren't reused
+_CACHE_FORMAT_VERSION = 3
+_CACHE_ENTRY_SUFFIX = '.json'
+
+
+def add_metadata_cache_arguments(parser):
+    parser.add_argument('--metadata-cache-dir', default=os.environ.get(METADATA_CACHE_DIR_ENV_VAR),
+                        help='Directory where extracted metadata is cached, keyed by the SHA-512 of each file. '
+                             'Defaults to ${}. No cache is used if neither is set.'.format(METADATA_CACHE_DIR_ENV_VAR))
+
+
+class MetadataCache:
+    """On-disk cache of the metadata extracted from APKs and AABs
+
+    Entries are keyed by the SHA-512 of the file and the flags given to the extractor. The least
+    recently used entries are removed once the cache grows bigger than `max_size` bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_or_extract(self, file_path, flags, extract):
+        entry_path = self._get_entry_path(file_path, flags)
+
+        metadata = self._load(entry_path)
+        if metadata is not None:
+            logger.info('Using cached metadata of "{}"'.format(file_path))
+            return metadata
+
+        metadata = extract()
+        self._store(entry_path, metadata)
+        self._evict()
+        return metadata
+
+    def _get_entry_path(self, file_path, flags):
+        flags_digest = hashlib.sha256(
+            json.dumps([_CACHE_FORMAT_VERSION, flags], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(
+            self._cache_dir, '{}-{}{}'.format(file_sha512sum(file_path), flags_digest[:16], _CACHE_ENTRY_SUFFIX)
+        )
+
+    def _load(self, entry_path):
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning('Ignoring corrupted cache entry "{}"'.format(entry_path))
+            return None
+
+        # Marks the entry as recently used
+        os.utime(entry_path)
+
+        metadata = entry['metadata']
+        # JSON doesn't know about tuples, but checks rely on them (e.g.: locales)
+        for key in entry['tuple_keys']:
+            metadata[key] = tuple(metadata[key])
+        return metadata
+
+    def _store(self, entry_path, metadata):
+        entry = {
+            'metadata': metadata,
+            'tuple_keys': sorted(key for key, value in metadata.items() if isinstance(value, tuple)),
+        }
+        # Write then rename, so that concurrent processes never read a partial entry
+        fd, temporary_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def _evict(self):
+        entries = []
+        for dir_entry in os.scandir(self._cache_dir):
+            if not dir_entry.name.endswith(_CACHE_ENTRY_SUFFIX):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except FileNotFoundError:
+                # Another process evicted it in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+
+            logger.debug('Evicting cache entry "{}"'.format(path))
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -1,21 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from functools import lru_cache, partial
 
 import json
 import logging
+import random
+import threading
+import time
 
+import google_auth_httplib2
 import httplib2
 
 from apiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http, MediaFileUpload
 from google.oauth2 import service_account
 # HACK: importing mock in production is useful for option `--do-not-contact-google-play`
 from unittest.mock import MagicMock
 
-from mozapkpublisher.common.exceptions import WrongArgumentGiven
+from mozapkpublisher.common.exceptions import VersionCodeConflict, WrongArgumentGiven
+from mozapkpublisher.common.utils import collect_results_in_order, file_sha256sum
 
 logger = logging.getLogger(__name__)
 
 NUM_RETRIES = 3
+UPLOAD_MIME_TYPE = 'application/octet-stream'
+# Reasons of the 403 responses that googleapiclient retries
+_RATE_LIMIT_REASONS = frozenset(('rateLimitExceeded', 'userRateLimitExceeded'))
+
+# Services hold an httplib2 object, which isn't thread-safe. Hence, they're cached per thread.
+_services = threading.local()
 
 
 def add_general_google_play_arguments(parser):
@@ -31,12 +45,19 @@ without any valid credentials nor valid APKs. In fact, Google Play may error out
 
 
 class _ExecuteDummy:
+    # Read when uploads are traced
+    resumable_uri = None
+    resumable_progress = 0
+
     def __init__(self, return_value):
         self._return_value = return_value
 
     def execute(self, **kwargs):
         return self._return_value
 
+    def next_chunk(self, **kwargs):
+        return None, self._return_value
+
 
 class GooglePlayEdit:
     """Represents an "edit" to an app on the Google Play store
@@ -48,24 +69,57 @@ class GooglePlayEdit:
     E.g.: `with GooglePlayEdit.transaction() as google_play:`
     """
 
-    def __init__(self, edit_resource, edit_id, package_name):
+    def __init__(self, edit_resource, edit_id, package_name, http_factory=None, upload_jobs=1, upload_chunk_size=None,
+                 upload_tracer=None, upload_journal=None, request_jobs=1):
         self._edit_resource = edit_resource
         self._edit_id = edit_id
         self._package_name = package_name
+        self._http_factory = http_factory
+        self._upload_jobs = upload_jobs
+        self._upload_chunk_size = upload_chunk_size
+        self._upload_tracer = upload_tracer
+        self._upload_journal = upload_journal
+        self._request_jobs = request_jobs
+        self._thread_local = threading.local()
+        self._existing_files_lock = threading.Lock()
+        self._existing_files = {}
 
     def update_app(self, extracted_apks, track, rollout_percentage=None):
-        for apk, _ in extracted_apks:
-            self.upload_apk(apk)
+        self._upload_files(self.upload_apk, extracted_apks)
 
         version_codes = [metadata['version_code'] for _, metadata in extracted_apks]
-        self._update_track(track, version_codes, rollout_percentage)
+        self.update_track(track, version_codes, rollout_percentage)
 
     def update_aab(self, extracted_aabs, track, rollout_percentage=None):
-        for aab, _ in extracted_aabs:
-            self.upload_aab(aab)
+        self._upload_files(self.upload_aab, extracted_aabs)
 
         version_codes = [metadata['version_code'] for _, metadata in extracted_aabs]
-        self._update_track(track, version_codes, rollout_percentage)
+        self.update_track(track, version_codes, rollout_percentage)
+
+    def _upload_files(self, upload, extracted_files):
+        if self._upload_jobs <= 1 or len(extracted_files) <= 1:
+            for file, metadata in extracted_files:
+                upload(file, version_code=metadata['version_code'])
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self._upload_jobs, len(extracted_files))) as executor:
+            futures = [
+                executor.submit(upload, file, version_code=metadata['version_code'])
+                for file, metadata in extracted_files
+            ]
+            # Every upload must succeed before the track is updated
+            files = [file for file, _ in extracted_files]
+            collect_results_in_order(executor, zip(files, futures), 'Could not upload "{}"')
+
+    def _get_http(self):
+        # httplib2 isn't thread-safe, so each thread gets its own authorized HTTP object.
+        # `None` makes requests use the one of the service.
+        if self._http_factory is None:
+            return None
+
+        if not hasattr(self._thread_local, 'http'):
+            self._thread_local.http = self._http_factory()
+        return self._thread_local.http
 
     def get_track_status(self, track):
         response = self._edit_resource.tracks().get(
@@ -76,19 +130,49 @@ class GooglePlayEdit:
         logger.debug('Track "{}" has status: {}'.format(track, response))
         return response
 
-    def upload_apk(self, apk):
+    def _get_existing_files(self, kind):
+        # Listed once per edit: they include what's already on Google Play, not only this edit.
+        # The lock prevents concurrent uploads from listing them several times.
+        with self._existing_files_lock:
+            if kind not in self._existing_files:
+                resource = self._edit_resource.apks() if kind == 'apks' else self._edit_resource.bundles()
+                response = resource.list(
+                    editId=self._edit_id, packageName=self._package_name
+                ).execute(num_retries=NUM_RETRIES, http=self._get_http())
+
+                files = response.get(kind, [])
+                # APKs nest their hashes under "binary", bundles don't
+                sha256_by_version_code = {
+                    str(file['versionCode']): file.get('binary', file).get('sha256') for file in files
+                }
+                self._existing_files[kind] = (
+                    sha256_by_version_code,
+                    set(sha256_by_version_code.values()) - {None},
+                )
+                logger.debug('Existing {} of "{}": {}'.format(kind, self._package_name, self._existing_files[kind]))
+
+            return self._existing_files[kind]
+
+    def _is_already_uploaded(self, kind, file_path, get_file_sha256, version_code):
+        existing_sha256_by_version_code, existing_sha256s = self._get_existing_files(kind)
+        if version_code is not None and str(version_code) in existing_sha256_by_version_code:
+            # The version code may have been taken by another build (e.g.: by a previous run that
+            # uploaded into the same edit), which must never get committed in place of this file
+            existing_sha256 = existing_sha256_by_version_code[str(version_code)]
+            if existing_sha256 is not None and existing_sha256 != get_file_sha256():
+                raise VersionCodeConflict(file_path, version_code, existing_sha256, get_file_sha256())
+            return True
+        return bool(existing_sha256s) and get_file_sha256() in existing_sha256s
+
+    def upload_apk(self, apk, version_code=None):
         apk_path = apk.name
-        logger.info('Uploading "{}" ...'.format(apk_path))
+        get_apk_sha256 = _get_file_sha256_once(apk_path)
+        if self._is_already_uploaded('apks', apk_path, get_apk_sha256, version_code):
+            logger.warning('APK "{}" has already been uploaded on Google Play. Skipping...'.format(apk_path))
+            return
+
         try:
-            response = self._edit_resource.apks().upload(
-                editId=self._edit_id,
-                packageName=self._package_name,
-                media_body=apk_path,
-                # Seems like mime type need not be specified for apk files:
-                # media_mime_type='application/octet-stream',
-            ).execute(num_retries=NUM_RETRIES)
-            logger.info('"{}" uploaded'.format(apk_path))
-            logger.debug('Upload response: {}'.format(response))
+            self._upload_file(self._edit_resource.apks(), apk_path, get_apk_sha256)
         except HttpError as e:
             if e.resp['status'] == '403':
                 # XXX This is really how data is returned by the googleapiclient.
@@ -105,29 +189,133 @@ class GooglePlayEdit:
                     return
             raise
 
-    def upload_aab(self, aab):
-        # try to get extra network diagnostics during upload
-        debuglevel = httplib2.debuglevel
-        httplib2.debuglevel = 4
-
+    def upload_aab(self, aab, version_code=None):
         aab_path = aab.name
-        logger.info('Uploading "{}" ...'.format(aab_path))
-        try:
-            response = self._edit_resource.bundles().upload(
-                editId=self._edit_id,
-                packageName=self._package_name,
-                media_body=aab_path,
-                media_mime_type='application/octet-stream',
-            ).execute(num_retries=NUM_RETRIES)
-            logger.info('"{}" uploaded'.format(aab_path))
-            logger.debug('Upload response: {}'.format(response))
-        except Exception:
-            logger.exception("caught exception in upload_aab:")
-            raise
-        finally:
-            httplib2.debuglevel = debuglevel
+        get_aab_sha256 = _get_file_sha256_once(aab_path)
+        if self._is_already_uploaded('bundles', aab_path, get_aab_sha256, version_code):
+            logger.warning('AAB "{}" has already been uploaded on Google Play. Skipping...'.format(aab_path))
+            return
+
+        self._upload_file(self._edit_resource.bundles(), aab_path, get_aab_sha256)
+
+    def _upload_file(self, resource, file_path, get_file_sha256):
+        media_upload_kwargs = {} if self._upload_chunk_size is None else {'chunksize': self._upload_chunk_size}
+        media = MediaFileUpload(file_path, mimetype=UPLOAD_MIME_TYPE, resumable=True, **media_upload_kwargs)
+        request = resource.upload(editId=self._edit_id, packageName=self._package_name, media_body=media)
+
+        file_sha256 = None
+        resumed = False
+        if self._upload_journal is not None:
+            file_sha256 = get_file_sha256()
+            resumed = self._resume_upload(request, file_path, file_sha256)
+
+        logger.info('Uploading "{}" ...'.format(file_path))
+        trace = None
+        if self._upload_tracer is not None:
+            trace = partial(
+                self._upload_tracer.record, package_name=self._package_name, edit_id=self._edit_id, file=file_path
+            )
+            trace('upload_started', size=media.size())
+
+        start_time = time.monotonic()
+        # Like googleapiclient, each chunk gets its own NUM_RETRIES. The total is only reported.
+        chunk_retries = 0
+        retries = 0
+        response = None
+        while response is None:
+            if trace is not None:
+                chunk_start_time = time.monotonic()
+                start_offset = request.resumable_progress
+
+            try:
+                status, response = request.next_chunk(http=self._get_http())
+            except Exception as e:
+                if trace is not None:
+                    trace(
+                        'chunk_failed', resumable_uri=request.resumable_uri, start_offset=start_offset,
+                        duration=time.monotonic() - chunk_start_time, retries=retries, error=repr(e),
+                    )
+
+                if resumed and _is_expired_upload_session_error(e):
+                    logger.warning('Upload session of "{}" has expired, uploading it from the start...'.format(
+                        file_path
+                    ))
+                    request.resumable_uri = None
+                    request.resumable_progress = 0
+                    request._in_error_state = False
+                    resumed = False
+                    continue
+
+                # Retries are done here rather than by googleapiclient, so they can be counted.
+                # After a failure, next_chunk() asks Google Play how much it got before resuming.
+                if chunk_retries >= NUM_RETRIES or not _is_retriable_upload_error(e):
+                    if trace is not None:
+                        trace('upload_failed', duration=time.monotonic() - start_time, retries=retries, error=repr(e))
+                    raise
+                chunk_retries += 1
+                retries += 1
+                logger.warning('Chunk upload of "{}" failed ({!r}), retrying ({}/{})...'.format(
+                    file_path, e, chunk_retries, NUM_RETRIES
+                ))
+                time.sleep(random.random() * 2 ** chunk_retries)
+                continue
+
+            chunk_retries = 0
+
+            if trace is not None:
+                trace(
+                    'chunk_uploaded', resumable_uri=request.resumable_uri, start_offset=start_offset,
+                    end_offset=request.resumable_progress if response is None else media.size(),
+                    duration=time.monotonic() - chunk_start_time, retries=retries,
+                )
+
+            if file_sha256 is not None and response is None:
+                self._upload_journal.set_upload(
+                    self._package_name, file_sha256, file_path, request.resumable_uri, request.resumable_progress
+                )
+
+            if status is not None:
+                logger.info('"{}": {}/{} bytes uploaded ({:.0%})'.format(
+                    file_path, status.resumable_progress, status.total_size, status.progress()
+                ))
+
+        if file_sha256 is not None:
+            self._upload_journal.forget_upload(self._package_name, file_sha256)
+
+        elapsed_time = time.monotonic() - start_time
+        if trace is not None:
+            trace('upload_finished', duration=elapsed_time, retries=retries, size=media.size())
+
+        size_in_mb = media.size() / 1000 / 1000
+        logger.info('"{}" uploaded: {:.1f} MB in {:.1f}s ({:.2f} MB/s, {} retries)'.format(
+            file_path, size_in_mb, elapsed_time, size_in_mb / elapsed_time if elapsed_time else 0, retries
+        ))
+        logger.debug('Upload response: {}'.format(response))
+        return response
+
+    def _resume_upload(self, request, file_path, file_sha256):
+        upload = self._upload_journal.get_upload(self._package_name, file_sha256)
+        if upload is None:
+            return False
 
-    def _update_track(self, track, version_codes, rollout_percentage=None):
+        logger.info('Resuming upload of "{}" ({} bytes were acknowledged)'.format(
+            file_path, upload['resumable_progress']
+        ))
+        # The journal may be behind what Google Play got, if the previous run died mid-chunk. In
+        # the error state, next_chunk() first asks Google Play how much it has, then sends the rest.
+        request.resumable_uri = upload['resumable_uri']
+        request.resumable_progress = upload['resumable_progress']
+        request._in_error_state = True
+        return True
+
+    def _stop_journaling_edit(self):
+        # Uploads are done once tracks or listings get staged. A rerun must not commit these
+        # changes by reusing this edit, so it starts a fresh one instead.
+        if self._upload_journal is not None:
+            self._upload_journal.forget_edit(self._package_name)
+
+    def update_track(self, track, version_codes, rollout_percentage=None):
+        self._stop_journaling_edit()
         if track == 'rollout' and rollout_percentage is None:
             raise WrongArgumentGiven("To perform a rollout, you must provide the target track "
                                      "(probably 'production') and a rollout_percentage")
@@ -165,6 +353,7 @@ class GooglePlayEdit:
         logger.debug('Track update response: {}'.format(response))
 
     def update_listings(self, language, title, full_description, short_description):
+        self._stop_journaling_edit()
         body = {
             'fullDescription': full_description,
             'shortDescription': short_description,
@@ -172,63 +361,208 @@ class GooglePlayEdit:
         }
         response = self._edit_resource.listings().update(
             editId=self._edit_id, packageName=self._package_name, language=language, body=body
-        ).execute(num_retries=NUM_RETRIES)
+        ).execute(http=self._get_http(), num_retries=NUM_RETRIES)
         logger.info(u'Listing for language "{}" has been updated with: {}'.format(language, body))
         logger.debug(u'Listing response: {}'.format(response))
 
     def update_whats_new(self, language, apk_version_code, whats_new):
+        self._stop_journaling_edit()
         response = self._edit_resource.apklistings().update(
             editId=self._edit_id, packageName=self._package_name, language=language,
             apkVersionCode=apk_version_code, body={'recentChanges': whats_new}
-        ).execute(num_retries=NUM_RETRIES)
+        ).execute(http=self._get_http(), num_retries=NUM_RETRIES)
         logger.info(u'What\'s new listing for ("{}", "{}") has been updated to: "{}"'.format(
             language, apk_version_code, whats_new
         ))
         logger.debug(u'Apk listing response: {}'.format(response))
 
+    def update_listings_bulk(self, listings_per_language):
+        """Updates the listings of many languages, `request_jobs` of them at a time
+
+        Args:
+            listings_per_language (dict): keyword arguments of `update_listings()` (`title`, `full_description`
+                and `short_description`), per language
+
+        Returns:
+            dict: the exception raised for each language that couldn't be updated. Other languages are
+                updated nonetheless
+        """
+        return self._update_per_language(
+            lambda language, listing: self.update_listings(language, **listing), listings_per_language
+        )
+
+    def update_whats_new_bulk(self, apk_version_code, whats_new_per_language):
+        """Updates the "what's new" of many languages, `request_jobs` of them at a time
+
+        Returns:
+            dict: the exception raised for each language that couldn't be updated. Other languages are
+                updated nonetheless
+        """
+        return self._update_per_language(
+            lambda language, whats_new: self.update_whats_new(language, apk_version_code, whats_new),
+            whats_new_per_language,
+        )
+
+    def _update_per_language(self, update, values_per_language):
+        failures = {}
+
+        def _update(language, value):
+            try:
+                update(language, value)
+            except Exception as e:
+                logger.error(u'Could not update language "{}": {!r}'.format(language, e))
+                failures[language] = e
+
+        if self._request_jobs <= 1 or len(values_per_language) <= 1:
+            for language, value in values_per_language.items():
+                _update(language, value)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self._request_jobs, len(values_per_language))) as executor:
+                for language, value in values_per_language.items():
+                    executor.submit(_update, language, value)
+
+        # Reported in the order languages were given, whichever thread failed first
+        return {language: failures[language] for language in values_per_language if language in failures}
+
     @staticmethod
     @contextmanager
-    def transaction(credentials_file_name, package_name, *, contact_server, dry_run):
+    def transaction(credentials_file_name, package_name, *, contact_server, dry_run, upload_jobs=1,
+                    upload_chunk_size=None, upload_tracer=None, upload_journal=None, request_jobs=1):
+        if dry_run and upload_journal is not None:
+            # Edits of dry runs are never committed, a later run must not pick them up
+            logger.warning('Not using the upload journal, since `dry_run` was `True`')
+            upload_journal = None
+
         edit_resource = _create_google_edit_resource(contact_server, credentials_file_name)
-        edit_id = edit_resource.insert(body={}, packageName=package_name).execute(num_retries=NUM_RETRIES)['id']
-        google_play = GooglePlayEdit(edit_resource, edit_id, package_name)
+        edit_id = _get_journaled_edit_id(edit_resource, package_name, upload_journal)
+        if edit_id is None:
+            edit_id = edit_resource.insert(body={}, packageName=package_name).execute(num_retries=NUM_RETRIES)['id']
+        if upload_journal is not None:
+            upload_journal.set_edit_id(package_name, edit_id)
+        http_factory = None
+        if contact_server and max(upload_jobs, request_jobs) > 1:
+            http_factory = _create_authorized_http_factory(credentials_file_name)
+        google_play = GooglePlayEdit(
+            edit_resource, edit_id, package_name, http_factory, upload_jobs, upload_chunk_size, upload_tracer,
+            upload_journal, request_jobs,
+        )
         yield google_play
         if not dry_run:
             edit_resource.commit(editId=edit_id, packageName=package_name).execute(num_retries=NUM_RETRIES)
             logger.info('Changes committed')
+            if upload_journal is not None:
+                upload_journal.forget_edit(package_name)
             logger.debug('edit_id "{}" for "{}" has been committed'.format(edit_id, package_name))
         else:
             logger.warning('Transaction not committed, since `dry_run` was `True`')
 
 
-def _create_google_edit_resource(contact_google_play, credentials_file_name):
-    if contact_google_play:
-        scope = 'https://www.googleapis.com/auth/androidpublisher'
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_file_name,
-            scopes=[scope],
+def _is_retriable_upload_error(error):
+    # Same as googleapiclient: server errors, 429 and 403 caused by rate limits
+    if isinstance(error, HttpError):
+        if error.resp.status == 403:
+            return bool(_get_http_error_reasons(error) & _RATE_LIMIT_REASONS)
+        return error.resp.status == 429 or error.resp.status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError, httplib2.ServerNotFoundError))
+
+
+def _get_http_error_reasons(error):
+    try:
+        errors = json.loads(error.content)['error']['errors']
+        return {e['reason'] for e in errors}
+    except (KeyError, TypeError, ValueError):
+        return set()
+
+
+def _get_file_sha256_once(file_path):
+    # The SHA-256 is needed by both the duplicate check and the upload journal, but only computed
+    # if one of them actually needs it
+    return lru_cache(maxsize=None)(partial(file_sha256sum, file_path))
+
+
+def _is_expired_upload_session_error(error):
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+
+def _get_journaled_edit_id(edit_resource, package_name, upload_journal):
+    if upload_journal is None:
+        return None
+
+    edit_id = upload_journal.get_edit_id(package_name)
+    if edit_id is None:
+        return None
+
+    try:
+        edit_resource.get(editId=edit_id, packageName=package_name).execute(num_retries=NUM_RETRIES)
+    except HttpError as e:
+        # Edits expire, and get deleted once another edit of the same app is committed
+        if e.resp.status >= 500:
+            raise
+        logger.warning('Edit "{}" of "{}" from the upload journal is gone, creating a new one'.format(
+            edit_id, package_name
+        ))
+        return None
+
+    logger.info('Reusing edit "{}" of "{}" from the upload journal'.format(edit_id, package_name))
+    return edit_id
+
+
+@lru_cache(maxsize=None)
+def _create_google_credentials(credentials_file_name):
+    # Shared by every transaction of the process, so access tokens are fetched only when they expire
+    scope = 'https://www.googleapis.com/auth/androidpublisher'
+    return service_account.Credentials.from_service_account_file(
+        credentials_file_name,
+        scopes=[scope],
+    )
+
+
+def _create_authorized_http_factory(credentials_file_name):
+    # Credentials are shared, only the underlying connections are per-thread. build_http() configures
+    # httplib2 like the service does (e.g.: it doesn't follow the 308 used by resumable uploads).
+    credentials = _create_google_credentials(credentials_file_name)
+    return lambda: google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+
+
+def _get_google_service(credentials_file_name):
+    services_per_credentials = getattr(_services, 'per_credentials', None)
+    if services_per_credentials is None:
+        services_per_credentials = _services.per_credentials = {}
+
+    if credentials_file_name not in services_per_credentials:
+        # The discovery document comes from the ones bundled in googleapiclient (static_discovery
+        # is the default), so building only costs its parsing. That's done once per thread.
+        services_per_credentials[credentials_file_name] = build(
+            serviceName='androidpublisher', version='v3',
+            credentials=_create_google_credentials(credentials_file_name),
+            cache_discovery=False,
+            static_discovery=True,
+            num_retries=NUM_RETRIES,
         )
 
-        service = build(serviceName='androidpublisher', version='v3',
-                        credentials=credentials,
-                        cache_discovery=False,
-                        num_retries=NUM_RETRIES)
+    return services_per_credentials[credentials_file_name]
+
 
-        return service.edits()
+def _create_google_edit_resource(contact_google_play, credentials_file_name):
+    if contact_google_play:
+        return _get_google_service(credentials_file_name).edits()
     else:
         logger.warning('Not a single request to Google Play will be made, since `contact_google_play` was set to `False`')
         edit_resource_mock = MagicMock()
 
         edit_resource_mock.insert = lambda *args, **kwargs: _ExecuteDummy(
             {'id': 'fake-transaction-id'})
+        edit_resource_mock.get = lambda *args, **kwargs: _ExecuteDummy({'id': 'fake-transaction-id'})
         edit_resource_mock.commit = lambda *args, **kwargs: _ExecuteDummy(None)
 
         apks_mock = MagicMock()
+        apks_mock.list = lambda *args, **kwargs: _ExecuteDummy({'apks': []})
         apks_mock.upload = lambda *args, **kwargs: _ExecuteDummy(
             {'versionCode': 'fake-version-code'})
         edit_resource_mock.apks = lambda *args, **kwargs: apks_mock
 
         bundles_mock = MagicMock()
+        bundles_mock.list = lambda *args, **kwargs: _ExecuteDummy({'bundles': []})
         bundles_mock.upload = lambda *args, **kwargs: _ExecuteDummy(
             {'versionCode': 'fake-version-code'})
         edit_resource_mock.bundles = lambda *args, **kwargs: bundles_mock
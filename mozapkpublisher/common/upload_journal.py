@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the layout of the journal changes, so older journals are ignored
+_JOURNAL_FORMAT_VERSION = 1
+
+
+class UploadJournal:
+    """Local record of the ongoing Google Play edits and of their resumable uploads
+
+    It stores the edit ID of each package name and, for each file being uploaded in that edit,
+    the resumable session URI and how many bytes Google Play acknowledged. A rerun after a crash
+    can then reuse the edit and resume uploads instead of starting over.
+
+    Files are identified by their SHA-256, so a rebuilt file never resumes an outdated upload.
+    The journal may be updated by several upload threads, so it's written under a lock.
+    """
+
+    def __init__(self, journal_path):
+        self._journal_path = journal_path
+        self._lock = threading.Lock()
+        self._edits = self._load()
+
+    def get_edit_id(self, package_name):
+        with self._lock:
+            edit = self._edits.get(package_name)
+            return None if edit is None else edit['edit_id']
+
+    def set_edit_id(self, package_name, edit_id):
+        with self._lock:
+            edit = self._edits.get(package_name)
+            if edit is not None and edit['edit_id'] == edit_id:
+                return
+            # Upload sessions belong to an edit, those of a previous one can't be resumed
+            self._edits[package_name] = {'edit_id': edit_id, 'uploads': {}}
+            self._save()
+
+    def forget_edit(self, package_name):
+        with self._lock:
+            if self._edits.pop(package_name, None) is not None:
+                self._save()
+
+    def get_upload(self, package_name, file_sha256):
+        with self._lock:
+            edit = self._edits.get(package_name)
+            if edit is None:
+                return None
+            return edit['uploads'].get(file_sha256)
+
+    def set_upload(self, package_name, file_sha256, file_path, resumable_uri, resumable_progress):
+        with self._lock:
+            edit = self._edits.get(package_name)
+            if edit is None:
+                # The edit isn't resumable anymore, see `GooglePlayEdit`
+                return
+            edit['uploads'][file_sha256] = {
+                'file': file_path,
+                'resumable_uri': resumable_uri,
+                'resumable_progress': resumable_progress,
+            }
+            self._save()
+
+    def forget_upload(self, package_name, file_sha256):
+        with self._lock:
+            edit = self._edits.get(package_name)
+            if edit is not None and edit['uploads'].pop(file_sha256, None) is not None:
+                self._save()
+
+    def _load(self):
+        try:
+            with open(self._journal_path) as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('Ignoring corrupted upload journal "{}"'.format(self._journal_path))
+            return {}
+
+        if journal.get('version') != _JOURNAL_FORMAT_VERSION:
+            logger.warning('Ignoring upload journal "{}" written in another format'.format(self._journal_path))
+            return {}
+        return journal['edits']
+
+    def _save(self):
+        journal = {'version': _JOURNAL_FORMAT_VERSION, 'edits': self._edits}
+        # Write then rename, so that a crash never leaves a partial journal behind
+        fd, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._journal_path)), suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(journal, f, indent=2, sort_keys=True)
+            os.replace(temporary_path, self._journal_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
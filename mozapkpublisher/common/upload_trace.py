@@ -0,0 +1,34 @@
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class UploadTracer:
+    """Writes one JSON object per line, for each event of the uploads to Google Play
+
+    Several uploads may run in parallel, so lines are written under a lock. Each of them is
+    flushed right away, so the trace remains usable if the process dies mid-upload.
+    """
+
+    def __init__(self, trace_file):
+        self._trace_file = trace_file
+        self._lock = threading.Lock()
+
+    def record(self, event, **fields):
+        line = json.dumps({'event': event, 'timestamp': time.time(), **fields}, sort_keys=True)
+        with self._lock:
+            self._trace_file.write(line + '\n')
+            self._trace_file.flush()
+
+
+@contextmanager
+def open_upload_tracer(trace_file_path):
+    # `None` disables tracing: uploads then skip every tracing call
+    if trace_file_path is None:
+        yield None
+        return
+
+    with open(trace_file_path, 'a') as trace_file:
+        yield UploadTracer(trace_file)
@@ -1,17 +1,37 @@
+import argparse
+import asyncio
+import concurrent.futures
 import hashlib
 import logging
+import os
 import requests
+import threading
+
+from mozapkpublisher.common.exceptions import PushAborted, PushFailed
 
 logger = logging.getLogger(__name__)
 
+FAIL_FAST = 'fail-fast'
+BEST_EFFORT = 'best-effort'
+PACKAGE_FAILURE_POLICIES = (FAIL_FAST, BEST_EFFORT)
+
+CONTENT_ID_CACHE_FILE_ENV_VAR = 'MOZAPKPUBLISHER_SGS_CONTENT_ID_CACHE_FILE'
+
 
 def load_json_url(url):
     return requests.get(url).json()
 
 
 def file_sha512sum(file_path):
+    return _file_hexdigest(file_path, hashlib.sha512())
+
+
+def file_sha256sum(file_path):
+    return _file_hexdigest(file_path, hashlib.sha256())
+
+
+def _file_hexdigest(file_path, hasher):
     bs = 65536
-    hasher = hashlib.sha512()
     with open(file_path, 'rb') as fh:
         buf = fh.read(bs)
         while len(buf) > 0:
@@ -29,6 +49,10 @@ def add_push_arguments(parser):
     parser.add_argument('--secret', help='File that contains google credentials (json). This is only required if the store is google.')
     parser.add_argument('--sgs-service-account-id', help='The service account ID for the samsung galaxy store. This is only required if the store is samsung')
     parser.add_argument('--sgs-access-token', help='The access token for the samsung galaxy store. This is only required if the store is samsung')
+    parser.add_argument('--sgs-content-id-cache-file', default=os.environ.get(CONTENT_ID_CACHE_FILE_ENV_VAR),
+                        help='File where the content ID of each package name on the samsung galaxy store is cached, '
+                             'so that they are not looked up at every run. Defaults to ${}. No cache is used if neither '
+                             'is set. This has no effect if the store is not samsung'.format(CONTENT_ID_CACHE_FILE_ENV_VAR))
     parser.add_argument('--submit', help='Submit the submission for review. This doesn\'t change anything unless the store is samsung', action='store_true')
     parser.add_argument('--do-not-contact-server', action='store_false', dest='contact_server',
                         help='''Prevent any request to reach the APK server. Use this option if
@@ -45,6 +69,32 @@ still be provided (you can pass a random file name).''')
     )
     parser.add_argument('--commit', action='store_false', dest='dry_run',
                         help='Commit new release on Google Play. This action cannot be reverted. This has no effect if the store is not google')
+    parser.add_argument('--upload-jobs', type=int, default=1,
+                        help='Number of files uploaded in parallel within a Google Play edit (default: 1). '
+                             'This has no effect if the store is not google')
+    parser.add_argument('--upload-chunk-size', type=_mebibytes, default=None, metavar='MiB',
+                        help='Size of the chunks of resumable uploads to Google Play, in MiB. Defaults to the one of '
+                             'googleapiclient (100 MiB). This has no effect if the store is not google')
+    parser.add_argument('--upload-trace-file', default=None, metavar='PATH',
+                        help='Append a JSON line per event of the uploads to Google Play (chunk timings, retries, '
+                             'resumable session URIs) to this file. It grants access to ongoing uploads, so keep it '
+                             'private. This has no effect if the store is not google')
+    parser.add_argument('--upload-journal-file', default=None, metavar='PATH',
+                        help='JSON file where the ongoing Google Play edits and uploads are recorded. If a push dies, '
+                             'rerunning it with the same file reuses its edits and resumes its uploads. Edits are '
+                             'only reused until tracks or listings get updated, and never with --commit unset. This '
+                             'has no effect if the store is not google')
+    parser.add_argument('--package-failure-policy', choices=PACKAGE_FAILURE_POLICIES, default=FAIL_FAST,
+                        help='What to do when pushing one package name fails, while others are pushed concurrently. '
+                             '"{}" stops pushing the other package names, "{}" pushes all of them then reports every '
+                             'failure (default: "{}")'.format(FAIL_FAST, BEST_EFFORT, FAIL_FAST))
+
+
+def _mebibytes(value):
+    mebibytes = int(value)
+    if mebibytes <= 0:
+        raise argparse.ArgumentTypeError('must be a positive number of MiB, got {}'.format(value))
+    return mebibytes * 1024 * 1024
 
 
 def check_push_arguments(parser, config):
@@ -65,3 +115,77 @@ def metadata_by_package_name(metadata_dict):
         package_names[package_name].append((file, metadata))
 
     return package_names
+
+
+def collect_results_in_order(executor, futures_per_file, failure_message):
+    """Returns the results of the `(file, future)` pairs of `futures_per_file`, in their order
+
+    As soon as a future fails, the futures of `executor` that haven't started yet are cancelled.
+    Once the running ones are done, the failure of the first file (in the given order) is logged
+    with `failure_message` (formatted with the name of the file) and raised. So neither the results
+    nor the error raised depend on which worker finished first.
+    """
+    futures_per_file = list(futures_per_file)
+    futures = [future for _, future in futures_per_file]
+    _, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+    if not_done:
+        executor.shutdown(wait=False, cancel_futures=True)
+        concurrent.futures.wait(not_done)
+
+    for file, future in futures_per_file:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(failure_message.format(file.name))
+            raise future.exception()
+
+    return [future.result() for future in futures]
+
+
+async def run_per_package_name(files_by_package_name, push, failure_policy=FAIL_FAST):
+    """Runs `await push(package_name, files, aborted)` concurrently for every package name
+
+    With FAIL_FAST, the first failure cancels the other package names and is re-raised. Pushes that
+    run in threads can't be cancelled, and pushes must not be cancelled halfway through changing the
+    store. So every push must check the `aborted` event (a `threading.Event`) before committing or
+    changing anything, then not let itself be interrupted. With BEST_EFFORT, every package name is pushed and all failures are
+    raised at once in a PushFailed.
+    """
+    aborted = threading.Event()
+    package_names_per_task = {
+        asyncio.ensure_future(push(package_name, files, aborted)): package_name
+        for package_name, files in files_by_package_name.items()
+    }
+    failures = {}
+
+    pending = set(package_names_per_task)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                package_name = package_names_per_task[task]
+                error = task.exception()
+                if error is None:
+                    logger.info('"{}" pushed'.format(package_name))
+                    continue
+
+                logger.error('Could not push "{}": {!r}'.format(package_name, error))
+                failures[package_name] = error
+
+            if failures and failure_policy == FAIL_FAST:
+                raise next(iter(failures.values()))
+    finally:
+        if pending:
+            aborted.set()
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
+            for task in pending:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error('Could not push "{}": {!r}'.format(package_names_per_task[task], task.exception()))
+
+    if failures:
+        raise PushFailed(failures)
+
+
+def raise_if_aborted(package_name, aborted):
+    if aborted.is_set():
+        raise PushAborted(package_name)
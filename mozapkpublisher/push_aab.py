@@ -7,7 +7,16 @@ import logging
 from mozapkpublisher.common import main_logging
 from mozapkpublisher.common.aab import add_aab_checks_arguments, extract_aabs_metadata
 from mozapkpublisher.common.store import GooglePlayEdit
-from mozapkpublisher.common.utils import add_push_arguments, metadata_by_package_name, check_push_arguments
+from mozapkpublisher.common.upload_journal import UploadJournal
+from mozapkpublisher.common.upload_trace import open_upload_tracer
+from mozapkpublisher.common.utils import (
+    add_push_arguments,
+    check_push_arguments,
+    FAIL_FAST,
+    metadata_by_package_name,
+    raise_if_aborted,
+    run_per_package_name,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +28,14 @@ async def push_aab(
     rollout_percentage=None,
     dry_run=True,
     contact_server=True,
+    metadata_cache_dir=None,
+    use_bundletool=False,
+    jobs=1,
+    upload_jobs=1,
+    upload_chunk_size=None,
+    upload_trace_file=None,
+    upload_journal_file=None,
+    package_failure_policy=FAIL_FAST,
 ):
     """
     Args:
@@ -31,11 +48,27 @@ async def push_aab(
         dry_run (bool): `True` to do a dry-run
         contact_server (bool): `False` to avoid communicating with the Google Play server.
             Useful if you're using mock credentials.
+        metadata_cache_dir (str): directory where extracted metadata is cached. `None` disables
+            the cache
+        use_bundletool (bool): `True` to read the manifest of the AABs with bundletool instead of
+            the builtin reader
+        jobs (int): number of threads used to extract the metadata of the AABs in parallel
+        upload_jobs (int): number of AABs uploaded in parallel within a Google Play edit
+        upload_chunk_size (int): size in bytes of the chunks of resumable uploads to Google Play. `None` uses
+            the default of googleapiclient
+        upload_trace_file (str): file where events of the uploads to Google Play are appended as JSON lines.
+            `None` disables tracing
+        upload_journal_file (str): file where ongoing edits and uploads are recorded, so that a rerun resumes
+            them. `None` disables the journal
+        package_failure_policy (str): `FAIL_FAST` to stop pushing other package names as soon as one
+            fails, `BEST_EFFORT` to push all of them and report every failure at the end
     """
     # We want to tune down some logs, even when push_aab() isn't called from the command line
     main_logging.init()
 
-    aabs_metadata_per_paths = extract_aabs_metadata(aabs)
+    aabs_metadata_per_paths = extract_aabs_metadata(
+        aabs, metadata_cache_dir=metadata_cache_dir, use_bundletool=use_bundletool, jobs=jobs
+    )
 
     update_aab_kwargs = {
         kwarg_name: kwarg_value
@@ -49,10 +82,23 @@ async def push_aab(
     # Each distinct product must be uploaded in different "edit"/transaction, so we split them
     # by package name here.
     aabs_by_package_name = metadata_by_package_name(aabs_metadata_per_paths)
-    for package_name, extracted_aabs in aabs_by_package_name.items():
-        with GooglePlayEdit.transaction(secret, package_name, contact_server=contact_server,
-                                        dry_run=dry_run) as edit:
-            edit.update_aab(extracted_aabs, **update_aab_kwargs)
+
+    upload_journal = None if upload_journal_file is None else UploadJournal(upload_journal_file)
+    with open_upload_tracer(upload_trace_file) as upload_tracer:
+        def _push_to_google_play(package_name, extracted_aabs, aborted):
+            with GooglePlayEdit.transaction(secret, package_name, contact_server=contact_server,
+                                            dry_run=dry_run, upload_jobs=upload_jobs,
+                                            upload_chunk_size=upload_chunk_size,
+                                            upload_tracer=upload_tracer, upload_journal=upload_journal) as edit:
+                edit.update_aab(extracted_aabs, **update_aab_kwargs)
+                raise_if_aborted(package_name, aborted)
+
+        # Edits are blocking calls, each package name gets its own thread
+        await run_per_package_name(
+            aabs_by_package_name,
+            lambda *args: asyncio.to_thread(_push_to_google_play, *args),
+            package_failure_policy,
+        )
 
 
 def main():
@@ -72,6 +118,14 @@ def main():
         config.rollout_percentage,
         config.dry_run,
         config.contact_server,
+        metadata_cache_dir=config.metadata_cache_dir,
+        use_bundletool=config.use_bundletool,
+        jobs=config.jobs,
+        upload_jobs=config.upload_jobs,
+        upload_chunk_size=config.upload_chunk_size,
+        upload_trace_file=config.upload_trace_file,
+        upload_journal_file=config.upload_journal_file,
+        package_failure_policy=config.package_failure_policy,
     ))
 
 
@@ -4,12 +4,31 @@ import asyncio
 import argparse
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+
 from mozapkpublisher.common import main_logging
-from mozapkpublisher.common.apk import add_apk_checks_arguments, extract_and_check_apks_metadata
+from mozapkpublisher.common.apk import (
+    add_apk_checks_arguments,
+    extract_and_check_apks_metadata,
+    iter_checked_apks_metadata,
+)
 from mozapkpublisher.common.store import GooglePlayEdit
-from mozapkpublisher.common.utils import add_push_arguments, metadata_by_package_name, check_push_arguments
+from mozapkpublisher.common.upload_journal import UploadJournal
+from mozapkpublisher.common.upload_trace import open_upload_tracer
+from mozapkpublisher.common.utils import (
+    add_push_arguments,
+    check_push_arguments,
+    collect_results_in_order,
+    FAIL_FAST,
+    metadata_by_package_name,
+    raise_if_aborted,
+    run_per_package_name,
+)
 from mozapkpublisher.common.exceptions import WrongArgumentGiven
 from mozapkpublisher.sgs_api import SamsungGalaxyStore
+from mozapkpublisher.sgs_api.content_id_cache import ContentIdCache
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +50,15 @@ async def push_apk(
     submit=False,
     sgs_service_account_id=None,
     sgs_access_token=None,
+    sgs_content_id_cache_file=None,
+    jobs=1,
+    metadata_cache_dir=None,
+    upload_jobs=1,
+    upload_chunk_size=None,
+    upload_trace_file=None,
+    upload_journal_file=None,
+    package_failure_policy=FAIL_FAST,
+    pipeline=False,
 ):
     """
     Args:
@@ -49,10 +77,70 @@ async def push_apk(
         skip_check_multiple_locales (bool): skip check to ensure all APKs have more than one locale
         skip_check_ordered_version_codes (bool): skip check to ensure that ensures all APKs have different version codes
             and that the x86 version code > the arm version code
+        sgs_content_id_cache_file (str): file where the content IDs of the package names on the samsung galaxy store
+            are cached. `None` disables the cache
+        jobs (int): number of processes used to extract the metadata of the APKs in parallel
+        metadata_cache_dir (str): directory where extracted metadata is cached. `None` disables the cache
+        upload_jobs (int): number of APKs uploaded in parallel within a Google Play edit
+        upload_chunk_size (int): size in bytes of the chunks of resumable uploads to Google Play. `None` uses
+            the default of googleapiclient
+        upload_trace_file (str): file where events of the uploads to Google Play are appended as JSON lines.
+            `None` disables tracing
+        upload_journal_file (str): file where ongoing edits and uploads are recorded, so that a rerun resumes
+            them. `None` disables the journal
+        package_failure_policy (str): `FAIL_FAST` to stop pushing other package names as soon as one fails,
+            `BEST_EFFORT` to push all of them and report every failure at the end
+        pipeline (bool): `True` to upload each APK to Google Play as soon as it's extracted and passes its own
+            checks. Edits are only committed once every APK is uploaded and the checks across APKs pass
     """
     # We want to tune down some logs, even when push_apk() isn't called from the command line
     main_logging.init()
 
+    update_app_kwargs = {
+        kwarg_name: kwarg_value
+        for kwarg_name, kwarg_value in (
+            ('track', track),
+            ('rollout_percentage', rollout_percentage)
+        )
+        if kwarg_value
+    }
+
+    upload_journal = None if upload_journal_file is None else UploadJournal(upload_journal_file)
+
+    # Shared by both ways of pushing to Google Play
+    open_google_play_edit = partial(
+        GooglePlayEdit.transaction, secret, contact_server=contact_server, dry_run=dry_run, upload_jobs=upload_jobs,
+        upload_chunk_size=upload_chunk_size, upload_journal=upload_journal,
+    )
+
+    if pipeline:
+        if store != "google":
+            raise WrongArgumentGiven("Pipelined pushes are only supported by the google store")
+        if package_failure_policy != FAIL_FAST:
+            raise WrongArgumentGiven("Pipelined pushes only support the {} package failure policy".format(FAIL_FAST))
+
+        checked_apks_metadata = iter_checked_apks_metadata(
+            apks,
+            expected_package_names,
+            skip_checks_fennec,
+            skip_check_multiple_locales,
+            skip_check_same_locales,
+            skip_check_ordered_version_codes,
+            jobs=jobs,
+            metadata_cache_dir=metadata_cache_dir,
+        )
+        with open_upload_tracer(upload_trace_file) as upload_tracer:
+            await asyncio.to_thread(
+                _push_pipelined_to_google_play,
+                apks,
+                checked_apks_metadata,
+                partial(open_google_play_edit, upload_tracer=upload_tracer),
+                expected_package_names,
+                upload_jobs,
+                update_app_kwargs,
+            )
+        return
+
     apks_metadata_per_paths = extract_and_check_apks_metadata(
         apks,
         expected_package_names,
@@ -60,6 +148,8 @@ async def push_apk(
         skip_check_multiple_locales,
         skip_check_same_locales,
         skip_check_ordered_version_codes,
+        jobs=jobs,
+        metadata_cache_dir=metadata_cache_dir,
     )
 
     # Each distinct product must be uploaded in different "edit"/transaction, so we split them
@@ -67,36 +157,83 @@ async def push_apk(
     apks_by_package_name = metadata_by_package_name(apks_metadata_per_paths)
 
     if store == "google":
-        update_app_kwargs = {
-            kwarg_name: kwarg_value
-            for kwarg_name, kwarg_value in (
-                ('track', track),
-                ('rollout_percentage', rollout_percentage)
-            )
-            if kwarg_value
-        }
+        with open_upload_tracer(upload_trace_file) as upload_tracer:
+            def _push_to_google_play(package_name, extracted_apks, aborted):
+                with open_google_play_edit(package_name, upload_tracer=upload_tracer) as edit:
+                    edit.update_app(extracted_apks, **update_app_kwargs)
+                    raise_if_aborted(package_name, aborted)
 
-        for package_name, extracted_apks in apks_by_package_name.items():
-            with GooglePlayEdit.transaction(secret, package_name, contact_server=contact_server,
-                                            dry_run=dry_run) as edit:
-                edit.update_app(extracted_apks, **update_app_kwargs)
+            # Edits are blocking calls, each package name gets its own thread
+            await run_per_package_name(
+                apks_by_package_name,
+                lambda *args: asyncio.to_thread(_push_to_google_play, *args),
+                package_failure_policy,
+            )
     elif store == "samsung":
         if not (sgs_service_account_id and sgs_access_token):
             raise RuntimeError("You must provided an account id and access token for the samsung galaxy store")
 
-        async with SamsungGalaxyStore(sgs_service_account_id, sgs_access_token, dry_run=dry_run) as sgs:
-            for package_name, apks in apks_by_package_name.items():
-                await sgs.upload_apks(package_name, apks, rollout_percentage, submit=submit)
+        content_id_cache = None if sgs_content_id_cache_file is None else ContentIdCache(sgs_content_id_cache_file)
+        async with SamsungGalaxyStore(
+            sgs_service_account_id, sgs_access_token, dry_run=dry_run, content_id_cache=content_id_cache
+        ) as sgs:
+            await run_per_package_name(
+                apks_by_package_name,
+                lambda package_name, apks, aborted: sgs.upload_apks(
+                    package_name, apks, rollout_percentage, submit=submit, aborted=aborted
+                ),
+                package_failure_policy,
+            )
     else:
         raise WrongArgumentGiven("Unkown target store: {}".format(store))
 
 
+def _push_pipelined_to_google_play(
+    apks, checked_apks_metadata, open_google_play_edit, expected_package_names, upload_jobs, update_app_kwargs
+):
+    # Every edit is opened upfront, since APKs are uploaded in whatever order they get extracted.
+    # If anything fails, edits are left uncommitted and Google Play discards them.
+    with ExitStack() as stack:
+        edits = {
+            package_name: stack.enter_context(open_google_play_edit(package_name))
+            for package_name in expected_package_names
+        }
+
+        apks_metadata = {}
+        with ThreadPoolExecutor(max_workers=max(1, upload_jobs)) as executor:
+            uploads = []
+            try:
+                for apk, metadata in checked_apks_metadata:
+                    apks_metadata[apk] = metadata
+                    uploads.append((apk, executor.submit(
+                        edits[metadata['package_name']].upload_apk, apk, version_code=metadata['version_code']
+                    )))
+
+                collect_results_in_order(executor, uploads, 'Could not upload "{}"')
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+
+        apks_by_package_name = metadata_by_package_name({apk: apks_metadata[apk] for apk in apks})
+        for package_name, extracted_apks in apks_by_package_name.items():
+            version_codes = [metadata['version_code'] for _, metadata in extracted_apks]
+            edits[package_name].update_track(version_codes=version_codes, **update_app_kwargs)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Upload APKs on the Google Play Store.')
     add_push_arguments(parser)
     add_apk_checks_arguments(parser)
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Upload each APK as soon as it is extracted and passes its own checks, instead of waiting '
+                             'for all APKs to be checked. Nothing is committed unless every check passes. Only '
+                             'supported by the google store, with the fail-fast package failure policy')
     config = parser.parse_args()
     check_push_arguments(parser, config)
+    if config.pipeline and config.store != 'google':
+        parser.error('--pipeline is only supported by --store=google')
+    if config.pipeline and config.package_failure_policy != FAIL_FAST:
+        parser.error('--pipeline only supports --package-failure-policy={}'.format(FAIL_FAST))
 
     asyncio.run(push_apk(
         config.apks,
@@ -114,6 +251,15 @@ def main():
         submit=config.submit,
         sgs_service_account_id=config.sgs_service_account_id,
         sgs_access_token=config.sgs_access_token,
+        sgs_content_id_cache_file=config.sgs_content_id_cache_file,
+        jobs=config.jobs,
+        metadata_cache_dir=config.metadata_cache_dir,
+        upload_jobs=config.upload_jobs,
+        upload_chunk_size=config.upload_chunk_size,
+        upload_trace_file=config.upload_trace_file,
+        upload_journal_file=config.upload_journal_file,
+        package_failure_policy=config.package_failure_policy,
+        pipeline=config.pipeline,
     ))
 
 
@@ -1,15 +1,25 @@
-from typing import Dict, Any, List
+from collections import Counter
+from typing import Callable, Dict, Any, List, Optional
+from .content_id_cache import ContentIdCache
 from .content_info import AppContentInfo
-from .utils import raise_for_status_with_message
-from .error import SgsUploadException, SgsContentInfoException, SgsUpdateException
+from .utils import create_client_session, raise_for_status_with_message
+from .retry import IDEMPOTENT_METHODS, RETRIABLE_STATUSES, RetryPolicy
+from .error import (
+    SgsAuthenticationException, SgsContentInfoException, SgsException, SgsUpdateException, SgsUploadException,
+)
 from urllib.parse import urljoin
 
 import aiohttp
+import asyncio
 import logging
 import os.path
+import time
 
 BASE_DEVAPI_URL = "https://devapi.samsungapps.com/"
 BASE_SELLER_URL = "https://seller.samsungapps.com/"
+DEFAULT_CONCURRENCY_LIMIT = 8
+# Upload sessions are valid 24h, they're renewed a bit before in case the clocks disagree
+UPLOAD_SESSION_LIFETIME = 23 * 60 * 60
 logger = logging.getLogger(__name__)
 
 
@@ -18,9 +28,32 @@ class SamsungGalaxyStore:
     High level wrapper to make actions on application on the samsung galaxy store
     """
 
-    def __init__(self, service_account_id: str, access_token: str, dry_run: bool = False):
-        self.api = SamsungGalaxyApi(service_account_id, access_token)
+    def __init__(
+        self,
+        service_account_id: str,
+        access_token: str,
+        dry_run: bool = False,
+        concurrency_limit: int = DEFAULT_CONCURRENCY_LIMIT,
+        content_id_cache: Optional[ContentIdCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        session_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.api = SamsungGalaxyApi(
+            service_account_id, access_token, retry_policy=retry_policy, session=session, session_options=session_options
+        )
         self._dry_run = dry_run
+        self._concurrency_limit = concurrency_limit
+        self._content_id_cache = content_id_cache
+        self._apps = None
+        # Filled as content infos get fetched, so each app is looked up at most once per run
+        self._content_id_by_package_name: Dict[str, str] = {}
+        self._indexed_content_ids = set()
+        self._content_id_lock = asyncio.Lock()
+        # Shared by every upload of the run, see `_get_upload_session_id()`
+        self._upload_session_id = None
+        self._upload_session_expiry = 0
+        self._upload_session_lock = asyncio.Lock()
 
     async def __aenter__(self) -> "SamsungGalaxyStore":
         await self.api.__aenter__()
@@ -29,19 +62,21 @@ class SamsungGalaxyStore:
     async def __aexit__(self, *args: Any) -> None:
         await self.api.__aexit__(*args)
 
-    async def upload_apks(self, package_name, apks, rollout_rate, submit=False):
+    async def upload_apks(self, package_name, apks, rollout_rate, submit=False, aborted=None):
         """
         Upload the APKs passed as arguments. The app to be updated will be infered from the package name.
         If the rollout_rate is not None, all new apks will be added to a staged rollout with that rate.
 
+        If `aborted` (a `threading.Event`) is set once the APKs are uploaded, the app isn't updated.
+        Once the update started, cancelling this coroutine waits for the update to complete.
+
         Notes: The app needs to be in the `FOR_SALE` status and needs to not be in the middle of an update.
         """
         if self._dry_run:
             logger.warning('No APKs were uploaded since `dry_run` was `True`')
             return
 
-        content_id = await self.infer_content_id_from_package_name(package_name)
-        content_info = await self.api.get_content_info(content_id)
+        content_id, content_info = await self._get_content_id_and_info(package_name)
 
         if len(content_info) != 1 or content_info[0].status != "FOR_SALE":
             raise SgsUpdateException(
@@ -54,11 +89,24 @@ class SamsungGalaxyStore:
         last_binary = max((binary for binary in current_info.binary_list), key=lambda binary: int(binary["binarySeq"]))
         last_binary_id = int(last_binary["binarySeq"])
 
-        for apk in apks:
-            fd, metadata = apk
+        semaphore = asyncio.Semaphore(self._concurrency_limit)
 
+        async def _upload(fd, metadata):
             file_name = "{}-{}-{}.apk".format(metadata["package_name"], metadata["architecture"], metadata["version_name"])
-            file_key = await self.upload_file(fd.name, file_name)
+            async with semaphore:
+                return await self.upload_file(fd.name, file_name)
+
+        # Uploads are independent from each other, only binaries have to be added in order
+        uploads = [asyncio.create_task(_upload(fd, metadata)) for fd, metadata in apks]
+        try:
+            file_keys = await asyncio.gather(*uploads)
+        except BaseException:
+            for upload in uploads:
+                upload.cancel()
+            await asyncio.gather(*uploads, return_exceptions=True)
+            raise
+
+        for (fd, metadata), file_key in zip(apks, file_keys):
             new_binary = {
                 "fileName": os.path.basename(fd.name),
                 "versionCode": metadata["version_code"],
@@ -74,6 +122,19 @@ class SamsungGalaxyStore:
             current_info.add_binary(new_binary)
             last_binary_id += 1
 
+        if aborted is not None and aborted.is_set():
+            raise SgsUpdateException(f"Not updating {package_name}, since pushing another package name failed")
+
+        # From here on, the app gets modified. Stopping halfway would leave it in the middle of an
+        # update, which must then be cancelled by hand. Hence, a cancellation waits for the end.
+        update = asyncio.ensure_future(self._update_app(content_id, current_info, apks, rollout_rate, submit))
+        try:
+            await asyncio.shield(update)
+        except asyncio.CancelledError:
+            await update
+            raise
+
+    async def _update_app(self, content_id, current_info, apks, rollout_rate, submit):
         await self.api.update_content_info(current_info)
 
         if rollout_rate is not None:
@@ -85,44 +146,198 @@ class SamsungGalaxyStore:
                     "The API didn't return a content info with the UPDATING status. Unable to create a rollout"
                 )
 
+            new_version_codes = {apk["version_code"] for (_, apk) in apks}
             new_binaries = [
                 binary["binarySeq"]
                 for binary in new_content_info.binary_list
-                if binary["versionCode"] in (apk["version_code"] for (_, apk) in apks)
+                if binary["versionCode"] in new_version_codes
             ]
-            for new_bin in new_binaries:
-                await self.api.add_binary_to_staged_rollout(content_id, new_bin)
+            await self._add_binaries_to_staged_rollout(content_id, new_binaries)
 
             await self.api.enable_staged_rollout(content_id, rollout_rate)
 
         if submit:
             await self.api.submit_app(content_id)
 
+    async def _add_binaries_to_staged_rollout(self, content_id, binary_seqs):
+        """
+        Add the binaries to the staged rollout, at most `concurrency_limit` at a time. All of them
+        are attempted, then every failure is reported at once.
+        """
+        semaphore = asyncio.Semaphore(self._concurrency_limit)
+
+        async def _add(binary_seq):
+            async with semaphore:
+                await self.api.add_binary_to_staged_rollout(content_id, binary_seq)
+
+        results = await asyncio.gather(*(_add(binary_seq) for binary_seq in binary_seqs), return_exceptions=True)
+
+        failures = []
+        for binary_seq, result in zip(binary_seqs, results):
+            if not isinstance(result, BaseException):
+                continue
+            if not isinstance(result, Exception):
+                # e.g.: the task got cancelled
+                raise result
+            logger.error(f"Couldn't add binary {binary_seq} to the staged rollout of {content_id}: {result!r}")
+            failures.append((binary_seq, result))
+
+        if failures:
+            raise SgsUpdateException(
+                "Couldn't add the following binaries to the staged rollout of {}: {}".format(
+                    content_id, ", ".join(f"{binary_seq} ({error!r})" for binary_seq, error in failures)
+                )
+            ) from failures[0][1]
+
     async def upload_file(self, file, name):
         """
         Uploads a file to the samsung galaxy store and returns its file key
         """
-        session_id = (await self.api.create_upload_session_id())["sessionId"]
-        file_upload = await self.api.upload_file(session_id, file, name)
+        session_id = await self._get_upload_session_id()
+        try:
+            file_upload = await self.api.upload_file(session_id, file, name)
+        except SgsAuthenticationException:
+            logger.warning("Upload session was rejected, retrying with a new one")
+            session_id = await self._get_upload_session_id(rejected_session_id=session_id)
+            file_upload = await self.api.upload_file(session_id, file, name)
         return file_upload["fileKey"]
 
-    async def infer_content_id_from_package_name(self, package_name):
+    async def _get_upload_session_id(self, rejected_session_id=None):
+        """
+        Returns the upload session ID shared by every upload. It's created on the first upload, then
+        renewed when it's about to expire or when samsung rejects it.
+        """
+        async with self._upload_session_lock:
+            # Concurrent uploads rejected with the same session only renew it once
+            if (
+                self._upload_session_id is None
+                or self._upload_session_id == rejected_session_id
+                or time.monotonic() >= self._upload_session_expiry
+            ):
+                self._upload_session_id = (await self.api.create_upload_session_id())["sessionId"]
+                self._upload_session_expiry = time.monotonic() + UPLOAD_SESSION_LIFETIME
+            return self._upload_session_id
+
+    async def _get_content_id_and_info(self, package_name):
+        """
+        Returns the content ID of the package name along with its content info. A cached content ID
+        that doesn't lead to the package name anymore (e.g.: the app was deleted) is looked up again.
+        """
+        content_id = await self.infer_content_id_from_package_name(package_name)
+        if self._content_id_cache is None:
+            return content_id, await self.api.get_content_info(content_id)
+
+        try:
+            content_info = await self.api.get_content_info(content_id)
+        except SgsContentInfoException as e:
+            reason = repr(e)
+        except aiohttp.ClientResponseError as e:
+            if not 400 <= e.status < 500:
+                raise
+            reason = repr(e)
+        else:
+            if _has_binary_with_package_name(content_info, package_name):
+                return content_id, content_info
+            reason = "no binary has this package name"
+
+        logger.warning(f"Cached content ID {content_id} doesn't match {package_name} anymore ({reason}), looking it up again")
+        self._content_id_cache.invalidate(package_name)
+        content_id = await self.infer_content_id_from_package_name(package_name, use_cache=False)
+        return content_id, await self.api.get_content_info(content_id)
+
+    async def infer_content_id_from_package_name(self, package_name, use_cache=True):
         """
         Returns the content ID related to the package name provided. This is possible
         because samsung doesn't allow reusing package names between different applications.
+
+        The content ID comes from the `content_id_cache` when there's one, unless `use_cache` is False.
         """
-        apps = await self.api.app_list()
-        for app in apps:
-            content_info = await self.api.get_content_info(app["contentId"])
+        if use_cache and self._content_id_cache is not None:
+            content_id = self._content_id_cache.get(package_name)
+            if content_id is not None:
+                logger.info(f"Using cached content ID {content_id} of {package_name}")
+                return content_id
+
+        # Package names pushed concurrently wait for each other, so that apps aren't looked up twice
+        errors = {}
+        async with self._content_id_lock:
+            if package_name not in self._content_id_by_package_name:
+                errors = await self._index_content_ids(package_name)
+
+        try:
+            content_id = self._content_id_by_package_name[package_name]
+        except KeyError:
+            message = f"Couldn't find a content ID for the following package name {package_name}."
+            if errors:
+                message += " These apps couldn't be looked up: {}".format(
+                    ", ".join(f"{content_id} ({_describe_error(error)})" for content_id, error in errors.items())
+                )
+            raise SgsUpdateException(message)
 
-            binaries = content_info[0].binary_list
-            for binary in binaries:
-                if binary["packageName"] == package_name:
-                    return app["contentId"]
+        if self._content_id_cache is not None:
+            self._content_id_cache.set(package_name, content_id)
+        return content_id
 
-        raise SgsUpdateException(
-            f"Couldn't find a content ID for the following package name {package_name}."
-        )
+    async def _index_content_ids(self, package_name):
+        """
+        Fetch the content info of the apps not indexed yet, at most `concurrency_limit` at a time,
+        until one of them has a binary with the given package name.
+
+        Apps whose content info can't be fetched are skipped, since they're likely unrelated to the
+        package name. Their errors are returned by content ID, so they can be reported if no app matches.
+        """
+        if self._apps is None:
+            self._apps = await self.api.app_list()
+
+        semaphore = asyncio.Semaphore(self._concurrency_limit)
+        errors = {}
+
+        async def _index(content_id):
+            async with semaphore:
+                # Lookups waiting for their turn aren't cancelled yet when a match is found
+                if package_name in self._content_id_by_package_name:
+                    return
+
+                try:
+                    content_info = await self.api.get_content_info(content_id)
+                except (SgsException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Could not look up the content info of {content_id}, skipping it: {_describe_error(e)}")
+                    errors[content_id] = e
+                    return
+
+                for binary in content_info[0].binary_list:
+                    self._content_id_by_package_name.setdefault(binary["packageName"], content_id)
+                self._indexed_content_ids.add(content_id)
+
+        content_ids = dict.fromkeys(app["contentId"] for app in self._apps)
+        tasks = [
+            asyncio.create_task(_index(content_id))
+            for content_id in content_ids
+            if content_id not in self._indexed_content_ids
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                await task
+                if package_name in self._content_id_by_package_name:
+                    break
+        finally:
+            # Lookups still pending aren't needed anymore
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return errors
+
+
+def _describe_error(error):
+    # SgsException doesn't pass its message to Exception, so repr() would lose it
+    if isinstance(error, SgsException):
+        return f"{type(error).__name__}: {error.message}"
+    return repr(error)
+
+
+def _has_binary_with_package_name(content_info, package_name):
+    return any(binary["packageName"] == package_name for binary in content_info[0].binary_list)
 
 
 class SamsungGalaxyApi:
@@ -130,16 +345,40 @@ class SamsungGalaxyApi:
     A low level wrapper around the samsung galaxy API. You should probably use the `SamsungGalaxyStore` wrapper around this instead
     """
 
-    def __init__(self, service_account_id: str, access_token: str):
+    def __init__(
+        self,
+        service_account_id: str,
+        access_token: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        session_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        The API must be used as an async context manager (`async with`), which creates its HTTP session
+        with `create_client_session(**session_options)`, unless a `session` is given.
+        """
         self._service_account_id = service_account_id
         self._access_token = access_token
-        self._client = aiohttp.ClientSession()
+        # A given session belongs to the caller. Otherwise, one is created when entering the context,
+        # because aiohttp sessions must be created in the event loop that uses them.
+        self._client = session
+        self._owns_client = session is None
+        self._session_options = {} if session_options is None else session_options
+        self._retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        # Number of retries per endpoint (e.g.: "GET /seller/contentInfo"), to see where samsung struggles
+        self.retry_counts: Counter = Counter()
 
     async def __aenter__(self) -> "SamsungGalaxyApi":
+        if self._client is None:
+            self._client = create_client_session(**self._session_options)
         return self
 
     async def __aexit__(self, *args: Any) -> None:
-        await self._client.close()
+        if self.retry_counts:
+            logger.info(f"Retries per samsung endpoint: {dict(self.retry_counts)}")
+        if self._owns_client and self._client is not None:
+            await self._client.close()
+            self._client = None
 
     def _default_headers(self) -> Dict[str, str]:
         """
@@ -158,12 +397,48 @@ class SamsungGalaxyApi:
         route: str,
         *,
         base_url: str = BASE_DEVAPI_URL,
+        retriable: Optional[bool] = None,
+        data_factory: Optional[Callable[[], Any]] = None,
         **kwargs: Any,
     ) -> Any:
+        """
+        Send a request, retrying it according to the retry policy if it's `retriable`. By default, only
+        requests with an idempotent method are. A body that can't be sent twice (e.g.: a form with a file)
+        must be given as a `data_factory`, which is called before each attempt.
+        """
+        if self._client is None:
+            raise RuntimeError(
+                f"{type(self).__name__} has no HTTP session. Use it with `async with` or give it a `session`"
+            )
+
         headers = self._default_headers()
         url = urljoin(base_url, route)
+        if retriable is None:
+            retriable = method in IDEMPOTENT_METHODS
+
+        retries = 0
+        while True:
+            if data_factory is not None:
+                kwargs["data"] = data_factory()
 
-        response = await self._client.request(method, url, headers=headers, **kwargs)
+            retry_after = None
+            try:
+                response = await self._client.request(method, url, headers=headers, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not retriable or retries >= self._retry_policy.max_retries:
+                    raise
+                reason = repr(e)
+            else:
+                if not retriable or retries >= self._retry_policy.max_retries or response.status not in RETRIABLE_STATUSES:
+                    break
+                reason = f"status {response.status}"
+                retry_after = response.headers.get("Retry-After")
+                response.release()
+
+            retries += 1
+            self.retry_counts[f"{method} {route}"] += 1
+            delay = await self._retry_policy.wait(retries - 1, retry_after)
+            logger.warning(f"{method} {route} failed ({reason}), retried after {delay:.1f}s ({retries}/{self._retry_policy.max_retries})")
 
         await raise_for_status_with_message(response)
 
@@ -208,14 +483,18 @@ class SamsungGalaxyApi:
         """
         original_file_size = os.path.getsize(file_path)
 
-        form = aiohttp.FormData()
         with open(file_path, "rb") as file:
-            form.add_field("file", file, filename=name)
-            form.add_field("sessionId", session_id)
-
-            # This API uses a different base URL for some reason
+            def _create_form():
+                # A form can only be sent once, retries need a new one
+                file.seek(0)
+                form = aiohttp.FormData()
+                form.add_field("file", file, filename=name)
+                form.add_field("sessionId", session_id)
+                return form
+
+            # This API uses a different base URL for some reason. Uploading again only creates another file key.
             result = await self._request(
-                "POST", "/galaxyapi/fileUpload", base_url=BASE_SELLER_URL, data=form
+                "POST", "/galaxyapi/fileUpload", base_url=BASE_SELLER_URL, retriable=True, data_factory=_create_form
             )
 
         # Since they don't respond with a checksum, best we can do is validate that the size matches what we expect
@@ -297,8 +576,9 @@ class SamsungGalaxyApi:
             "binarySeq": binary_seq,
         }
 
+        # Despite being a PUT, adding a binary twice isn't a no-op, so it's never retried
         return await self._request(
-            "PUT", "/seller/v2/content/stagedRolloutBinary", json=data
+            "PUT", "/seller/v2/content/stagedRolloutBinary", retriable=False, json=data
         )
 
     async def submit_app(self, content_id: str):
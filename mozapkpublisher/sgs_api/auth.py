@@ -1,9 +1,9 @@
-from typing import cast, List
+from typing import cast, List, Optional
 
 import aiohttp
 import jwt
 import time
-from .utils import raise_for_status_with_message
+from .utils import create_client_session, raise_for_status_with_message
 
 
 def create_jwt_for_auth(
@@ -25,18 +25,25 @@ def create_jwt_for_auth(
     )
 
 
-async def create_access_token(jwt: str) -> str:
+async def create_access_token(jwt: str, session: Optional[aiohttp.ClientSession] = None) -> str:
+    """
+    Exchange the JWT for an access token. A `session` created by `create_client_session` can be given,
+    so the connection gets reused by the following calls. Otherwise, a session is opened for this call only.
+    """
+    if session is None:
+        async with create_client_session() as session:
+            return await create_access_token(jwt, session)
+
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {jwt}",
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            "https://devapi.samsungapps.com/auth/accessToken", headers=headers
-        ) as resp:
-            await raise_for_status_with_message(resp)
+    async with session.post(
+        "https://devapi.samsungapps.com/auth/accessToken", headers=headers
+    ) as resp:
+        await raise_for_status_with_message(resp)
 
-            result = await resp.json()
+        result = await resp.json()
 
-            return cast(str, result["createdItem"]["accessToken"])
+        return cast(str, result["createdItem"]["accessToken"])
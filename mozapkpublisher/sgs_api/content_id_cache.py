@@ -0,0 +1,70 @@
+from typing import Dict, Any, Optional
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# Bump this whenever the layout of the cache changes, so older caches are ignored
+_CACHE_FORMAT_VERSION = 1
+
+
+class ContentIdCache:
+    """
+    On-disk cache of the content ID of each package name on the samsung galaxy store.
+    Entries expire after `ttl` seconds. Content IDs basically never change, this only avoids
+    keeping a stale entry forever if one ever does.
+    """
+
+    def __init__(self, cache_path: str, ttl: float = DEFAULT_TTL):
+        self._cache_path = cache_path
+        self._ttl = ttl
+        self._entries = self._load()
+
+    def get(self, package_name: str) -> Optional[str]:
+        entry = self._entries.get(package_name)
+        if entry is None or time.time() - entry["cached_at"] > self._ttl:
+            return None
+        return entry["content_id"]
+
+    def set(self, package_name: str, content_id: str) -> None:
+        self._entries[package_name] = {"content_id": content_id, "cached_at": time.time()}
+        self._save()
+
+    def invalidate(self, package_name: str) -> None:
+        if self._entries.pop(package_name, None) is not None:
+            self._save()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self._cache_path) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('Ignoring corrupted content ID cache "{}"'.format(self._cache_path))
+            return {}
+
+        if cache.get("version") != _CACHE_FORMAT_VERSION:
+            logger.warning('Ignoring content ID cache "{}" written in another format'.format(self._cache_path))
+            return {}
+        return cache["entries"]
+
+    def _save(self) -> None:
+        cache = {"version": _CACHE_FORMAT_VERSION, "entries": self._entries}
+        # Write then rename, so that concurrent runs never read a partial cache
+        fd, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._cache_path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(temporary_path, self._cache_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
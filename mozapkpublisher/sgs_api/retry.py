@@ -0,0 +1,73 @@
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import asyncio
+import datetime
+import random
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_MAX_RETRY_AFTER = 120.0
+
+# Methods that can be sent again without changing the outcome
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+RETRIABLE_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class RetryPolicy:
+    """
+    How requests to the samsung API are retried after a rate limit (429), a server error (5xx) or
+    a connection error.
+
+    Retries wait an exponential backoff with full jitter, unless the response tells how long to
+    wait with `Retry-After`. Waits are capped by `max_backoff` and `max_retry_after` respectively.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        max_retry_after: float = DEFAULT_MAX_RETRY_AFTER,
+    ):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+
+    def get_delay(self, retries: int, retry_after: Optional[str] = None) -> float:
+        """
+        Return how many seconds to wait before the retry that follows `retries` earlier ones
+        """
+        delay = _parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, self.max_retry_after)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** retries))
+
+    async def wait(self, retries: int, retry_after: Optional[str] = None) -> float:
+        delay = self.get_delay(retries, retry_after)
+        await _sleep(delay)
+        return delay
+
+
+def _parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an HTTP date
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+async def _sleep(delay: float) -> None:
+    await asyncio.sleep(delay)
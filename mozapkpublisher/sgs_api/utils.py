@@ -2,6 +2,30 @@ import aiohttp
 import json
 from .error import SgsAuthenticationException, SgsAuthorizationException
 
+# Uploads go to seller.samsungapps.com and everything else to devapi.samsungapps.com, each host gets its own pool
+DEFAULT_LIMIT_PER_HOST = 8
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_DNS_CACHE_TTL = 5 * 60
+# No read should stall for minutes, but uploading a big APK may take a while
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30 * 60, connect=30, sock_read=5 * 60)
+
+
+def create_client_session(
+    limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+    keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+    ttl_dns_cache: int = DEFAULT_DNS_CACHE_TTL,
+    timeout: aiohttp.ClientTimeout = DEFAULT_TIMEOUT,
+) -> aiohttp.ClientSession:
+    """
+    Create an HTTP session suited to the samsung API. It must be called from a running event loop.
+    The session can be shared between `create_access_token` and `SamsungGalaxyApi`, so they reuse
+    the same connections.
+    """
+    connector = aiohttp.TCPConnector(
+        limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout, ttl_dns_cache=ttl_dns_cache
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
 
 async def raise_for_status_with_message(resp: aiohttp.ClientResponse) -> None:
     """
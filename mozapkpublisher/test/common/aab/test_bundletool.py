@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from mozapkpublisher.common.aab import bundletool
+from mozapkpublisher.common.aab.bundletool import BundletoolWorker
+
+
+# Speaks the same protocol as BundletoolWorker.java, without needing java nor bundletool
+FAKE_WORKER = '''
+import os
+import sys
+import time
+
+sentinel, starts_file = sys.argv[1:]
+with open(starts_file, 'a') as f:
+    f.write('started\\n')
+
+for line in sys.stdin:
+    args = line.rstrip('\\n').split('\\0')
+    if args[0] == 'crash':
+        sys.exit(3)
+    if args[0] == 'crash-once':
+        if not os.path.exists(args[1]):
+            open(args[1], 'w').close()
+            sys.exit(3)
+    if args[0] == 'hang':
+        time.sleep(60)
+    print('\\n'.join(args))
+    print(sentinel, 1 if args[0] == 'fail' else 0, flush=True)
+'''
+
+
+@pytest.fixture
+def starts_file(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        starts_file = os.path.join(temp_dir, 'starts')
+
+        def _get_worker_command(self):
+            return [sys.executable, '-c', FAKE_WORKER, self._sentinel, starts_file]
+
+        monkeypatch.setattr(BundletoolWorker, '_get_worker_command', _get_worker_command)
+        yield starts_file
+
+
+def _count_starts(starts_file):
+    if not os.path.exists(starts_file):
+        return 0
+    with open(starts_file) as f:
+        return len(f.readlines())
+
+
+def test_get_worker_command(monkeypatch):
+    monkeypatch.setenv('BUNDLETOOL_PATH', '/path/to/bundletool.jar')
+    worker = BundletoolWorker()
+    worker._sentinel = 'SENTINEL'
+    assert worker._get_worker_command() == [
+        'java', '-cp', '/path/to/bundletool.jar', bundletool._WORKER_SOURCE, 'SENTINEL',
+    ]
+    assert os.path.exists(bundletool._WORKER_SOURCE)
+
+
+def test_worker_starts_once(starts_file):
+    with BundletoolWorker() as worker:
+        assert _count_starts(starts_file) == 0
+        assert worker.run(['dump', 'manifest', '--bundle=a.aab']) == 'dump\nmanifest\n--bundle=a.aab'
+        assert worker.run(['dump', 'manifest', '--bundle=b.aab']) == 'dump\nmanifest\n--bundle=b.aab'
+
+    assert _count_starts(starts_file) == 1
+    assert worker._process is None
+
+
+def test_worker_restarts_after_crash(starts_file):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        marker = os.path.join(temp_dir, 'crashed')
+        with BundletoolWorker() as worker:
+            assert worker.run(['crash-once', marker]) == 'crash-once\n{}'.format(marker)
+            assert worker.run(['dump']) == 'dump'
+
+    assert _count_starts(starts_file) == 2
+
+
+def test_worker_gives_up_after_second_crash(starts_file):
+    with BundletoolWorker() as worker:
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            worker.run(['crash'])
+        assert exc_info.value.returncode == 3
+
+        # The next command gets a fresh worker
+        assert worker.run(['dump']) == 'dump'
+
+    assert _count_starts(starts_file) == 3
+
+
+def test_worker_does_not_retry_failed_commands(starts_file):
+    with BundletoolWorker() as worker:
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            worker.run(['fail', '--bundle=a.aab'])
+        assert exc_info.value.returncode == 1
+        assert exc_info.value.output == 'fail\n--bundle=a.aab'
+
+        assert worker.run(['dump']) == 'dump'
+
+    assert _count_starts(starts_file) == 1
+
+
+def test_worker_times_out(starts_file):
+    with BundletoolWorker(timeout=0.5) as worker:
+        with pytest.raises(subprocess.TimeoutExpired):
+            worker.run(['hang'])
+        assert worker._process is None
+
+        assert worker.run(['dump']) == 'dump'
+
+    assert _count_starts(starts_file) == 2
+
+
+@pytest.mark.parametrize('arg', ('multi\nline', 'nul\0char'))
+def test_worker_rejects_unsendable_arguments(starts_file, arg):
+    with BundletoolWorker() as worker:
+        with pytest.raises(ValueError):
+            worker.run(['dump', arg])
+
+    assert _count_starts(starts_file) == 0
+
+
+@pytest.mark.skipif(
+    shutil.which('java') is None or 'BUNDLETOOL_PATH' not in os.environ,
+    reason='requires java and BUNDLETOOL_PATH',
+)
+def test_worker_reports_bundletool_failures():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        missing_aab = os.path.join(temp_dir, 'missing.aab')
+        with BundletoolWorker() as worker:
+            with pytest.raises(subprocess.CalledProcessError) as exc_info:
+                worker.run(['dump', 'manifest', '--bundle={}'.format(missing_aab)])
+            assert exc_info.value.returncode == 1
+            process = worker._process
+
+            with pytest.raises(subprocess.CalledProcessError) as exc_info:
+                worker.run(['unknown-command'])
+            assert exc_info.value.returncode == 2
+
+            # Failed commands leave the JVM running
+            assert worker._process is process
@@ -0,0 +1,229 @@
+import os
+import pytest
+import shutil
+
+from tempfile import NamedTemporaryFile
+from unittest.mock import MagicMock
+from xml.etree import ElementTree
+from zipfile import ZipFile
+
+from mozapkpublisher.common.aab import extractor
+from mozapkpublisher.common.aab.bundletool import BundletoolWorker
+from mozapkpublisher.common.aab.extractor import extract_metadata, _extract_metadata_from_manifest
+from mozapkpublisher.common.exceptions import BadAab
+
+
+ANDROID_NAMESPACE_URI = 'http://schemas.android.com/apk/res/android'
+
+MANIFEST = '''<manifest xmlns:android="http://schemas.android.com/apk/res/android" android:compileSdkVersion="34" \
+android:versionCode="2016000000" android:versionName="120.0" package="org.mozilla.firefox">
+  <uses-sdk android:minSdkVersion="21" android:targetSdkVersion="34"/>
+  <application android:name="org.mozilla.fenix.FenixApplication"/>
+</manifest>
+'''
+
+
+def _varint(value):
+    if value < 0:
+        value += 1 << 64
+    encoded = b''
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded += bytes([byte | 0x80])
+        else:
+            return encoded + bytes([byte])
+
+
+def _field(field_number, value):
+    if isinstance(value, int):
+        return _varint(field_number << 3) + _varint(value)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return _varint(field_number << 3 | 2) + _varint(len(value)) + value
+
+
+def _attribute(name, value='', namespace_uri=ANDROID_NAMESPACE_URI, compiled_item=b''):
+    attribute = _field(1, namespace_uri) if namespace_uri else b''
+    attribute += _field(2, name)
+    if value:
+        attribute += _field(3, value)
+    if compiled_item:
+        attribute += _field(6, compiled_item)
+    return _field(4, attribute)
+
+
+def _element(name, *fields):
+    return _field(1, _field(3, name) + b''.join(fields))
+
+
+def _text(text):
+    return _field(2, text)
+
+
+def _proto_manifest(version_code_attribute=None):
+    if version_code_attribute is None:
+        version_code_attribute = _attribute('versionCode', '2016000000')
+
+    return _element(
+        'manifest',
+        _attribute('compileSdkVersion', '34'),
+        version_code_attribute,
+        _attribute('versionName', '120.0'),
+        _attribute('package', 'org.mozilla.firefox', namespace_uri=''),
+        _field(5, _text('\n  ')),
+        _field(5, _element('uses-sdk', _attribute('minSdkVersion', '21'), _attribute('targetSdkVersion', '34'))),
+        _field(5, _element('application', _attribute('name', 'org.mozilla.fenix.FenixApplication'))),
+    )
+
+
+def _create_aab(aab_file, manifest, architectures=('arm64-v8a', 'armeabi-v7a')):
+    with ZipFile(aab_file, 'w') as aab_zip:
+        # An empty BundleConfig is enough for bundletool to accept the AAB
+        aab_zip.writestr('BundleConfig.pb', b'')
+        if manifest is not None:
+            aab_zip.writestr('base/manifest/AndroidManifest.xml', manifest)
+        aab_zip.writestr('base/dex/classes.dex', b'dex')
+        for architecture in architectures:
+            aab_zip.writestr(f'base/lib/{architecture}/libxul.so', b'so')
+
+
+EXPECTED_METADATA = {
+    'package_name': 'org.mozilla.firefox',
+    'version_code': '2016000000',
+    'version_name': '120.0',
+    'api_level': 21,
+    'architectures': ('arm64-v8a', 'armeabi-v7a'),
+}
+
+
+def test_extract_metadata(monkeypatch):
+    check_output_mock = MagicMock()
+    monkeypatch.setattr(extractor.subprocess, 'check_output', check_output_mock)
+
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest())
+        assert extract_metadata(aab.name) == EXPECTED_METADATA
+
+    check_output_mock.assert_not_called()
+
+
+@pytest.mark.parametrize('compiled_item, expected_version_code', (
+    (_field(7, _field(6, 2016000000)), '2016000000'),
+    (_field(7, _field(6, -1)), '-1'),
+    (_field(7, _field(7, 0x78)), '0x78'),
+    (_field(2, _field(1, '2016000000')), '2016000000'),
+    (_field(3, _field(1, '2016000000')), '2016000000'),
+))
+def test_extract_metadata_from_compiled_attribute(compiled_item, expected_version_code):
+    manifest = _proto_manifest(_attribute('versionCode', compiled_item=compiled_item))
+
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, manifest)
+        assert extract_metadata(aab.name)['version_code'] == expected_version_code
+
+
+def test_extract_metadata_without_native_libraries():
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest(), architectures=())
+        assert extract_metadata(aab.name)['architectures'] == ()
+
+
+def test_extract_metadata_with_bundletool(monkeypatch):
+    check_output_mock = MagicMock(return_value=MANIFEST)
+    monkeypatch.setattr(extractor.subprocess, 'check_output', check_output_mock)
+    monkeypatch.setenv('BUNDLETOOL_PATH', '/path/to/bundletool.jar')
+
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest())
+        assert extract_metadata(aab.name, use_bundletool=True) == EXPECTED_METADATA
+
+    check_output_mock.assert_called_once()
+    cmd = check_output_mock.call_args[0][0]
+    assert cmd[:5] == ['java', '-jar', '/path/to/bundletool.jar', 'dump', 'manifest']
+    assert cmd[5].startswith('--bundle=')
+    assert len(cmd) == 6
+
+
+def test_extract_metadata_with_bundletool_worker(monkeypatch):
+    check_output_mock = MagicMock()
+    monkeypatch.setattr(extractor.subprocess, 'check_output', check_output_mock)
+    worker = MagicMock()
+    worker.run.return_value = MANIFEST
+
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest())
+        assert extract_metadata(aab.name, use_bundletool=True, bundletool_worker=worker) == EXPECTED_METADATA
+
+    check_output_mock.assert_not_called()
+    worker.run.assert_called_once()
+    args = worker.run.call_args[0][0]
+    assert args[:2] == ['dump', 'manifest']
+    assert args[2].startswith('--bundle=')
+
+
+def test_extract_metadata_with_bad_bundletool_output(monkeypatch):
+    monkeypatch.setattr(extractor.subprocess, 'check_output', MagicMock(return_value='not xml'))
+
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest())
+        with pytest.raises(BadAab, match=aab.name):
+            extract_metadata(aab.name, use_bundletool=True)
+
+
+@pytest.mark.parametrize('manifest', (
+    None,
+    b'\xff',
+    _field(1, b'\x1a\x05abc'),
+    _element('application'),
+    b'',
+))
+def test_extract_metadata_from_bad_manifest(manifest):
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, manifest)
+        with pytest.raises(BadAab, match=aab.name):
+            extract_metadata(aab.name)
+
+
+def test_extract_metadata_from_bad_zip():
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        aab.write(b'not a zip')
+        aab.flush()
+        with pytest.raises(BadAab, match=aab.name):
+            extract_metadata(aab.name)
+
+
+def test_extract_metadata_from_manifest_with_codename_min_sdk():
+    manifest = ElementTree.fromstring(
+        '<manifest xmlns:android="http://schemas.android.com/apk/res/android" android:versionCode="1" '
+        'package="org.mozilla.focus"><uses-sdk android:minSdkVersion="VanillaIceCream"/></manifest>'
+    )
+    with pytest.raises(BadAab, match='/path/to/focus.aab.*VanillaIceCream'):
+        _extract_metadata_from_manifest(manifest, '/path/to/focus.aab')
+
+
+def test_extract_metadata_from_manifest_without_uses_sdk():
+    manifest = ElementTree.fromstring(
+        '<manifest xmlns:android="http://schemas.android.com/apk/res/android" android:versionCode="1" '
+        'package="org.mozilla.focus"/>'
+    )
+    assert _extract_metadata_from_manifest(manifest, '/path/to/focus.aab') == {
+        'package_name': 'org.mozilla.focus',
+        'version_code': '1',
+        'version_name': None,
+        'api_level': None,
+    }
+
+
+@pytest.mark.skipif(
+    shutil.which('java') is None or 'BUNDLETOOL_PATH' not in os.environ,
+    reason='requires java and BUNDLETOOL_PATH',
+)
+def test_extract_metadata_with_real_bundletool_worker():
+    with NamedTemporaryFile(suffix='.aab') as aab:
+        _create_aab(aab, _proto_manifest())
+        with BundletoolWorker() as worker:
+            assert extract_metadata(aab.name, use_bundletool=True, bundletool_worker=worker) == EXPECTED_METADATA
+            # The JVM survives commands, so it can run the next ones
+            assert extract_metadata(aab.name, use_bundletool=True, bundletool_worker=worker) == EXPECTED_METADATA
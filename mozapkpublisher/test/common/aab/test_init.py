@@ -1,7 +1,15 @@
 import argparse
+import logging
 import tempfile
+import threading
 
-from mozapkpublisher.common.aab import add_aab_checks_arguments
+import pytest
+
+from unittest.mock import MagicMock
+
+import mozapkpublisher.common.aab as aab
+from mozapkpublisher.common.aab import add_aab_checks_arguments, extract_aabs_metadata
+from mozapkpublisher.common.exceptions import BadAab
 
 
 def test_add_aab_checks_arguments():
@@ -11,3 +19,95 @@ def test_add_aab_checks_arguments():
     with tempfile.NamedTemporaryFile('wb') as f:
         config = parser.parse_args([f.name])
         assert config.aabs[0].name == f.name
+        assert config.use_bundletool is False
+        assert config.jobs == 1
+
+        config = parser.parse_args([f.name, '--use-bundletool', '--jobs', '4'])
+        assert config.use_bundletool is True
+        assert config.jobs == 4
+
+
+def test_extract_aabs_metadata_shares_bundletool_worker(monkeypatch):
+    worker_class_mock = MagicMock()
+    worker = worker_class_mock.return_value.__enter__.return_value
+    monkeypatch.setattr(aab, 'BundletoolWorker', worker_class_mock)
+    extract_metadata_mock = MagicMock(side_effect=lambda aab_path, *args: {'path': aab_path})
+    monkeypatch.setattr(aab, 'extract_metadata', extract_metadata_mock)
+
+    aabs = [MagicMock(), MagicMock()]
+    aabs[0].name = '/path/to/a.aab'
+    aabs[1].name = '/path/to/b.aab'
+    assert extract_aabs_metadata(aabs, use_bundletool=True) == {
+        aabs[0]: {'path': '/path/to/a.aab'},
+        aabs[1]: {'path': '/path/to/b.aab'},
+    }
+
+    worker_class_mock.assert_called_once_with()
+    assert [call.args for call in extract_metadata_mock.call_args_list] == [
+        ('/path/to/a.aab', True, worker),
+        ('/path/to/b.aab', True, worker),
+    ]
+    worker_class_mock.return_value.__exit__.assert_called_once()
+
+
+def test_extract_aabs_metadata_without_bundletool(monkeypatch):
+    worker_class_mock = MagicMock()
+    monkeypatch.setattr(aab, 'BundletoolWorker', worker_class_mock)
+    extract_metadata_mock = MagicMock(return_value={})
+    monkeypatch.setattr(aab, 'extract_metadata', extract_metadata_mock)
+
+    aab_file = MagicMock()
+    aab_file.name = '/path/to/a.aab'
+    extract_aabs_metadata([aab_file])
+
+    worker_class_mock.assert_not_called()
+    extract_metadata_mock.assert_called_once_with('/path/to/a.aab', False, None)
+
+
+def _create_aabs(count):
+    aabs = []
+    for i in range(count):
+        aab_file = MagicMock()
+        aab_file.name = '/path/to/{}.aab'.format(i)
+        aabs.append(aab_file)
+    return aabs
+
+
+def test_extract_aabs_metadata_in_parallel(monkeypatch):
+    worker_class_mock = MagicMock(side_effect=lambda: MagicMock())
+    monkeypatch.setattr(aab, 'BundletoolWorker', worker_class_mock)
+
+    # Every extraction waits for the others, which only completes if they run concurrently
+    barrier = threading.Barrier(3, timeout=5)
+    used_workers = []
+
+    def _extract_metadata(aab_path, use_bundletool, bundletool_worker):
+        used_workers.append(bundletool_worker)
+        barrier.wait()
+        return {'path': aab_path}
+
+    monkeypatch.setattr(aab, 'extract_metadata', _extract_metadata)
+
+    aabs = _create_aabs(3)
+    aabs_metadata = extract_aabs_metadata(aabs, use_bundletool=True, jobs=5)
+    assert list(aabs_metadata.keys()) == aabs
+    assert [metadata['path'] for metadata in aabs_metadata.values()] == [aab_file.name for aab_file in aabs]
+
+    # Never more workers than AABs, and a worker is never used by 2 threads at the same time
+    assert worker_class_mock.call_count == 3
+    assert len(set(id(worker) for worker in used_workers)) == 3
+
+
+def test_extract_aabs_metadata_in_parallel_names_failing_aab(monkeypatch, caplog):
+    def _extract_metadata(aab_path, use_bundletool, bundletool_worker):
+        if aab_path == '/path/to/1.aab':
+            raise BadAab('bad')
+        return {'path': aab_path}
+
+    monkeypatch.setattr(aab, 'extract_metadata', _extract_metadata)
+
+    with caplog.at_level(logging.ERROR, logger='mozapkpublisher.common.aab'):
+        with pytest.raises(BadAab):
+            extract_aabs_metadata(_create_aabs(3), jobs=2)
+
+    assert 'Could not extract metadata from "/path/to/1.aab"' in caplog.text
@@ -2,6 +2,7 @@ from mock import Mock
 import pytest
 
 from mozapkpublisher.common.apk.checker import (
+    check_apk,
     cross_check_apks,
     _check_all_apks_have_the_same_firefox_version,
     _check_version_matches_package_name,
@@ -840,3 +841,20 @@ def test_check_all_architectures_and_api_levels_are_present(apks_metadata_per_pa
 def test_bad_check_all_architectures_and_api_levels_are_present(apks_metadata_per_paths):
     with pytest.raises(BadSetOfApks):
         _check_all_architectures_and_api_levels_are_present(apks_metadata_per_paths)
+
+
+@pytest.mark.parametrize('metadata, skip_checks_fennec, skip_check_multiple_locales, expectation', (
+    ({'package_name': 'org.mozilla.firefox', 'firefox_version': '57.0', 'locales': ('en-US', 'fr')}, False, False, None),
+    ({'package_name': 'org.mozilla.firefox', 'firefox_version': '57.0', 'locales': ('en-US',)}, False, True, None),
+    ({'package_name': 'org.mozilla.firefox', 'firefox_version': '59.0a1', 'locales': ('en-US', 'fr')}, True, False, None),
+    ({'package_name': 'org.mozilla.klar', 'locales': ('en-US', 'fr')}, True, False, BadApk),
+    ({'package_name': 'org.mozilla.firefox', 'firefox_version': '59.0a1', 'locales': ('en-US', 'fr')}, False, False, BadApk),
+    ({'package_name': 'org.mozilla.firefox', 'firefox_version': '57.0', 'locales': ('en-US',)}, False, False, NotMultiLocaleApk),
+))
+def test_check_apk(metadata, skip_checks_fennec, skip_check_multiple_locales, expectation):
+    apk = mock_apk('fennec.apk')
+    if expectation is None:
+        check_apk(apk, metadata, ['org.mozilla.firefox'], skip_checks_fennec, skip_check_multiple_locales)
+    else:
+        with pytest.raises(expectation):
+            check_apk(apk, metadata, ['org.mozilla.firefox'], skip_checks_fennec, skip_check_multiple_locales)
@@ -1,15 +1,18 @@
+import io
+import mmap
 import os
 import pytest
 
 import pyaxmlparser
 from configparser import ConfigParser
-from tempfile import NamedTemporaryFile, TemporaryDirectory
+from tempfile import NamedTemporaryFile, TemporaryDirectory, TemporaryFile
 from unittest.mock import MagicMock
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
+from mozapkpublisher.common.apk import extractor
 from mozapkpublisher.common.apk.extractor import extract_metadata, _extract_architecture, _extract_architecture_from_paths, \
     _extract_firefox_version, _extract_firefox_build_id, _extract_value_from_application_ini, _extract_locales, \
-    _get_unique_locales
+    _get_unique_locales, _is_on_local_filesystem, _FileSlice
 from mozapkpublisher.common.exceptions import NoLocaleFound, BadApk
 
 
@@ -27,7 +30,7 @@ override chrome://global/locale/about.dtd chrome://browser/locale/overrides/abou
 '''
 
 
-def _create_apk_with_locale_content(temp_dir, manifest_content):
+def _create_apk_with_locale_content(temp_dir, manifest_content, omni_ja_compression=ZIP_STORED):
     with NamedTemporaryFile('w') as manifest:
         manifest.write(manifest_content)
         manifest.seek(0)
@@ -38,7 +41,7 @@ def _create_apk_with_locale_content(temp_dir, manifest_content):
 
     apk_path = os.path.join(temp_dir, 'fennec.apk')
     with ZipFile(apk_path, 'a') as apk_zip:
-        apk_zip.write(omni_ja_path, 'assets/omni.ja')
+        apk_zip.write(omni_ja_path, 'assets/omni.ja', compress_type=omni_ja_compression)
 
     return apk_path
 
@@ -84,17 +87,30 @@ def _create_apk_with_all_metadata(temp_dir):
     })
 
 
-def test_extract_metadata(monkeypatch):
-    pyaxmlparser_mock = MagicMock()
-    pyaxmlparser_mock.get_package = lambda: 'org.mozilla.firefox'
-    pyaxmlparser_mock.get_min_sdk_version = lambda: 16
-    pyaxmlparser_mock.get_androidversion_code = lambda: '2015523300'
-    pyaxmlparser_mock.get_androidversion_name = lambda: '129.0'
-    monkeypatch.setattr(pyaxmlparser, 'APK', lambda _: pyaxmlparser_mock)
+def _patch_pyaxmlparser(monkeypatch):
+    parsed_files = []
+
+    def fake_apk(apk_file):
+        parsed_files.append(apk_file)
+        pyaxmlparser_mock = MagicMock()
+        pyaxmlparser_mock.get_package = lambda: 'org.mozilla.firefox'
+        pyaxmlparser_mock.get_min_sdk_version = lambda: 16
+        pyaxmlparser_mock.get_androidversion_code = lambda: '2015523300'
+        pyaxmlparser_mock.get_androidversion_name = lambda: '129.0'
+        pyaxmlparser_mock.zip = ZipFile(apk_file)
+        return pyaxmlparser_mock
+
+    monkeypatch.setattr(pyaxmlparser, 'APK', fake_apk)
+    return parsed_files
+
+
+@pytest.mark.parametrize('zero_copy', (True, False, None))
+def test_extract_metadata(monkeypatch, zero_copy):
+    _patch_pyaxmlparser(monkeypatch)
 
     with TemporaryDirectory() as temp_dir:
         apk_file = _create_apk_with_all_metadata(temp_dir)
-        assert extract_metadata(apk_file, True, True) == {
+        assert extract_metadata(apk_file, True, True, zero_copy) == {
             'api_level': 16,
             'architecture': 'x86',
             'firefox_build_id': '20171112125738',
@@ -105,7 +121,7 @@ def test_extract_metadata(monkeypatch):
             'version_name': '129.0',
         }
 
-        assert extract_metadata(apk_file, True, False) == {
+        assert extract_metadata(apk_file, True, False, zero_copy) == {
             'api_level': 16,
             'architecture': 'x86',
             'locales': ('an', 'as', 'bn-IN', 'en-GB', 'en-US'),
@@ -114,7 +130,7 @@ def test_extract_metadata(monkeypatch):
             'version_name': '129.0',
         }
 
-        assert extract_metadata(apk_file, False, True) == {
+        assert extract_metadata(apk_file, False, True, zero_copy) == {
             'api_level': 16,
             'architecture': 'x86',
             'firefox_build_id': '20171112125738',
@@ -124,7 +140,7 @@ def test_extract_metadata(monkeypatch):
             'version_name': '129.0',
         }
 
-        assert extract_metadata(apk_file, False, False) == {
+        assert extract_metadata(apk_file, False, False, zero_copy) == {
             'api_level': 16,
             'architecture': 'x86',
             'package_name': 'org.mozilla.firefox',
@@ -133,6 +149,63 @@ def test_extract_metadata(monkeypatch):
         }
 
 
+def test_extract_metadata_does_not_copy_apk_in_zero_copy_mode(monkeypatch):
+    parsed_files = _patch_pyaxmlparser(monkeypatch)
+    monkeypatch.setattr(extractor.shutil, 'copy', MagicMock(side_effect=AssertionError('APK must not be copied')))
+
+    with TemporaryDirectory() as temp_dir:
+        apk_file = _create_apk_with_architecture_content(temp_dir, architecture='x86')
+        assert extract_metadata(apk_file, False, False, zero_copy=True)['architecture'] == 'x86'
+
+    assert len(parsed_files) == 1
+    assert isinstance(parsed_files[0], mmap.mmap)
+
+
+def test_extract_metadata_parses_apk_central_directory_once(monkeypatch):
+    _patch_pyaxmlparser(monkeypatch)
+    real_get_contents = ZipFile._RealGetContents
+    parsed_central_directories = []
+
+    def fake_get_contents(zip_file):
+        parsed_central_directories.append(zip_file)
+        return real_get_contents(zip_file)
+
+    with TemporaryDirectory() as temp_dir:
+        apk_file = _create_apk_with_all_metadata(temp_dir)
+        monkeypatch.setattr(ZipFile, '_RealGetContents', fake_get_contents)
+        extract_metadata(apk_file, False, True)
+
+    assert len(parsed_central_directories) == 1
+
+
+def test_extract_metadata_empty_apk():
+    with NamedTemporaryFile() as apk_file:
+        with pytest.raises(BadApk, match='is empty'):
+            extract_metadata(apk_file.name, False, False, zero_copy=True)
+
+
+@pytest.mark.parametrize('path, mount_points, expected', ((
+    '/builds/worker/fennec.apk', [('/', 'ext4'), ('/builds', 'nfs4')], False,
+), (
+    '/builds/worker/fennec.apk', [('/', 'nfs'), ('/builds', 'ext4')], True,
+), (
+    '/buildsfoo/fennec.apk', [('/', 'ext4'), ('/builds', 'nfs4')], True,
+), (
+    '/mnt/some share/fennec.apk', [('/', 'ext4'), ('/mnt/some share', 'cifs')], False,
+), (
+    '/tmp/fennec.apk', [], True,
+)))
+def test_is_on_local_filesystem(monkeypatch, path, mount_points, expected):
+    monkeypatch.setattr(extractor, '_read_mount_points', lambda: mount_points)
+    monkeypatch.setattr(extractor.os.path, 'realpath', lambda path: path)
+    assert _is_on_local_filesystem(path) == expected
+
+
+def test_is_on_local_filesystem_without_proc(monkeypatch):
+    monkeypatch.setattr(extractor, '_read_mount_points', MagicMock(side_effect=FileNotFoundError))
+    assert _is_on_local_filesystem('/some/path.apk')
+
+
 @pytest.mark.parametrize('architecture', (('x86', 'armeabi-v7a')))
 def test_get_apk_architecture(architecture):
     with TemporaryDirectory() as temp_dir:
@@ -215,11 +288,35 @@ def test_extract_value_from_application_ini():
     locale autoconfig en-US en-US/locale/en-US/autoconfig/
     ''', ('en-US',)
 )))
-def test_extract_locales(manifest_content, expected_locales):
+@pytest.mark.parametrize('omni_ja_compression', (ZIP_STORED, ZIP_DEFLATED))
+def test_extract_locales(manifest_content, expected_locales, omni_ja_compression):
     with TemporaryDirectory() as temp_dir:
-        apk_file = _create_apk_with_locale_content(temp_dir, manifest_content)
+        apk_file = _create_apk_with_locale_content(temp_dir, manifest_content, omni_ja_compression)
         with ZipFile(apk_file) as apk_zip:
-            assert _extract_locales(apk_zip) == expected_locales
+            assert _extract_locales(apk_zip, '/original/path.apk') == expected_locales
+
+
+def test_extract_locales_does_not_copy_stored_omni_ja(monkeypatch):
+    monkeypatch.setattr(extractor.tempfile, 'SpooledTemporaryFile', MagicMock(side_effect=AssertionError('omni.ja must not be copied')))
+    with TemporaryDirectory() as temp_dir:
+        apk_file = _create_apk_with_locale_content(temp_dir, MANIFEST_PARTIAL_CONTENT, ZIP_STORED)
+        with open(apk_file, 'rb') as f:
+            with ZipFile(f) as apk_zip:
+                assert _extract_locales(apk_zip, '/original/path.apk') == ('an', 'as', 'bn-IN', 'en-GB', 'en-US')
+
+
+def test_file_slice():
+    with TemporaryFile() as f:
+        f.write(b'0123456789')
+        file_slice = _FileSlice(f, 2, 5)
+
+        assert file_slice.read() == b'23456'
+        assert file_slice.read(1) == b''
+        assert file_slice.seek(-2, io.SEEK_END) == 3
+        assert file_slice.read(10) == b'56'
+        assert file_slice.seek(1) == 1
+        assert file_slice.seek(1, io.SEEK_CUR) == 2
+        assert file_slice.read(2) == b'45'
 
 
 def test_bad_extract_locales():
@@ -227,7 +324,7 @@ def test_bad_extract_locales():
         apk_file = _create_apk_with_locale_content(temp_dir, 'non-locale stuff')
         with ZipFile(apk_file) as apk_zip:
             with pytest.raises(NoLocaleFound):
-                _extract_locales(apk_zip)
+                _extract_locales(apk_zip, '/original/path.apk')
 
 
 def test_get_unique_locales():
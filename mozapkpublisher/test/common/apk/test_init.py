@@ -1,7 +1,18 @@
 import argparse
+import pytest
 import tempfile
+import threading
 
-from mozapkpublisher.common.apk import add_apk_checks_arguments
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from mozapkpublisher.common import apk
+from mozapkpublisher.common.apk import (
+    add_apk_checks_arguments,
+    extract_and_check_apks_metadata,
+    iter_checked_apks_metadata,
+)
+from mozapkpublisher.common.exceptions import BadApk
 
 
 def test_add_apk_checks_arguments():
@@ -15,3 +26,119 @@ def test_add_apk_checks_arguments():
         assert config.apks[0].name == f.name
 
     assert config.expected_package_names == ['some.package.name']
+    assert config.jobs == 1
+
+
+@pytest.mark.parametrize('jobs', (1, 3))
+def test_extract_and_check_apks_metadata(monkeypatch, jobs):
+    monkeypatch.setattr(apk, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(apk, 'extract_metadata', lambda path, *args: {'path': path})
+    cross_check_apks_mock = MagicMock()
+    monkeypatch.setattr(apk, 'cross_check_apks', cross_check_apks_mock)
+    apks = [_FakeFile('/path/to/{}.apk'.format(i)) for i in range(4)]
+
+    apks_metadata = extract_and_check_apks_metadata(apks, ['org.mozilla.firefox'], True, False, False, False, jobs=jobs)
+
+    assert list(apks_metadata.items()) == [(apk_, {'path': apk_.name}) for apk_ in apks]
+    cross_check_apks_mock.assert_called_once_with(apks_metadata, ['org.mozilla.firefox'], True, False, False, False)
+
+
+def test_extract_and_check_apks_metadata_keeps_input_order(monkeypatch):
+    last_extracted = threading.Event()
+
+    def fake_extract_metadata(path, *args):
+        # The first APK is the last one to be extracted
+        if path == '/path/to/0.apk':
+            last_extracted.wait()
+        elif path == '/path/to/3.apk':
+            last_extracted.set()
+        return {'path': path}
+
+    monkeypatch.setattr(apk, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(apk, 'extract_metadata', fake_extract_metadata)
+    monkeypatch.setattr(apk, 'cross_check_apks', MagicMock())
+    apks = [_FakeFile('/path/to/{}.apk'.format(i)) for i in range(4)]
+
+    apks_metadata = extract_and_check_apks_metadata(apks, ['org.mozilla.firefox'], True, False, False, False, jobs=4)
+
+    assert list(apks_metadata) == apks
+
+
+def test_extract_and_check_apks_metadata_reports_failing_apk(monkeypatch, caplog):
+    def fake_extract_metadata(path, *args):
+        if path == '/path/to/2.apk':
+            raise BadApk('"{}" is broken'.format(path))
+        return {'path': path}
+
+    monkeypatch.setattr(apk, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(apk, 'extract_metadata', fake_extract_metadata)
+    apks = [_FakeFile('/path/to/{}.apk'.format(i)) for i in range(4)]
+
+    with pytest.raises(BadApk, match='/path/to/2.apk'):
+        extract_and_check_apks_metadata(apks, ['org.mozilla.firefox'], True, False, False, False, jobs=2)
+
+    assert 'Could not extract metadata from "/path/to/2.apk"' in caplog.text
+
+
+def test_extract_and_check_apks_metadata_uses_cache(monkeypatch):
+    extract_metadata_mock = MagicMock(return_value={'locales': ('en-US', 'fr')})
+    monkeypatch.setattr(apk, 'extract_metadata', extract_metadata_mock)
+    monkeypatch.setattr(apk, 'cross_check_apks', MagicMock())
+
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.NamedTemporaryFile() as f:
+        f.write(b'some apk')
+        f.flush()
+
+        for _ in range(2):
+            apks_metadata = extract_and_check_apks_metadata(
+                [f], ['org.mozilla.firefox'], True, False, False, False, metadata_cache_dir=cache_dir
+            )
+            assert apks_metadata == {f: {'locales': ('en-US', 'fr')}}
+
+    extract_metadata_mock.assert_called_once_with(f.name, True, False)
+
+
+def test_iter_checked_apks_metadata_yields_as_soon_as_extracted(monkeypatch):
+    monkeypatch.setattr(apk, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    last_apk_may_finish = threading.Event()
+
+    def fake_extract_metadata(path, *args):
+        if path == '/path/to/0.apk':
+            # Only finishes once another APK was yielded, so yielding can't wait for the whole batch
+            assert last_apk_may_finish.wait(timeout=5)
+        return {'path': path, 'package_name': 'org.mozilla.firefox'}
+
+    monkeypatch.setattr(apk, 'extract_metadata', fake_extract_metadata)
+    check_apk_mock = MagicMock()
+    monkeypatch.setattr(apk, 'check_apk', check_apk_mock)
+    cross_check_apks_mock = MagicMock()
+    monkeypatch.setattr(apk, 'cross_check_apks', cross_check_apks_mock)
+    apks = [_FakeFile('/path/to/{}.apk'.format(i)) for i in range(2)]
+
+    yielded_apks = []
+    for apk_, metadata in iter_checked_apks_metadata(apks, ['org.mozilla.firefox'], True, False, False, False, jobs=2):
+        yielded_apks.append(apk_)
+        check_apk_mock.assert_called_with(apk_, metadata, ['org.mozilla.firefox'], True, False)
+        cross_check_apks_mock.assert_not_called()
+        last_apk_may_finish.set()
+
+    assert yielded_apks == [apks[1], apks[0]]
+    # Checks across APKs see them in the order they were given
+    cross_check_apks_mock.assert_called_once()
+    assert list(cross_check_apks_mock.call_args[0][0].keys()) == apks
+
+
+def test_iter_checked_apks_metadata_stops_on_bad_apk(monkeypatch):
+    monkeypatch.setattr(apk, 'extract_metadata', lambda path, *args: {'package_name': 'org.mozilla.klar'})
+    cross_check_apks_mock = MagicMock()
+    monkeypatch.setattr(apk, 'cross_check_apks', cross_check_apks_mock)
+
+    with pytest.raises(BadApk, match='org.mozilla.klar'):
+        list(iter_checked_apks_metadata([_FakeFile('/path/to/0.apk')], ['org.mozilla.firefox'], True, True, True, True))
+
+    cross_check_apks_mock.assert_not_called()
+
+
+class _FakeFile:
+    def __init__(self, name):
+        self.name = name
@@ -0,0 +1,16 @@
+import pickle
+import pytest
+
+from mozapkpublisher.common.exceptions import BadApk, CheckSumMismatch, NoLocaleFound, NotMultiLocaleApk
+
+
+@pytest.mark.parametrize('error', (
+    BadApk('"/path/to/some.apk" is broken'),
+    CheckSumMismatch('/path/to/some.apk', 'abc', 'def'),
+    NoLocaleFound('/path/to/some.apk', 'assets/omni.ja', 'chrome/chrome.manifest'),
+    NotMultiLocaleApk('/path/to/some.apk', ('en-US',)),
+))
+def test_logged_errors_can_be_pickled(error):
+    unpickled_error = pickle.loads(pickle.dumps(error))
+    assert type(unpickled_error) is type(error)
+    assert str(unpickled_error) == str(error)
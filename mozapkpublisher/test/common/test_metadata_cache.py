@@ -0,0 +1,107 @@
+import argparse
+import os
+
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest.mock import MagicMock
+
+from mozapkpublisher.common.metadata_cache import add_metadata_cache_arguments, MetadataCache, \
+    METADATA_CACHE_DIR_ENV_VAR
+from mozapkpublisher.common.utils import file_sha512sum
+
+
+def _create_file(temp_dir, name, content):
+    path = os.path.join(temp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_add_metadata_cache_arguments(monkeypatch):
+    monkeypatch.delenv(METADATA_CACHE_DIR_ENV_VAR, raising=False)
+    parser = argparse.ArgumentParser()
+    add_metadata_cache_arguments(parser)
+    assert parser.parse_args([]).metadata_cache_dir is None
+    assert parser.parse_args(['--metadata-cache-dir', '/some/dir']).metadata_cache_dir == '/some/dir'
+
+    monkeypatch.setenv(METADATA_CACHE_DIR_ENV_VAR, '/some/other/dir')
+    parser = argparse.ArgumentParser()
+    add_metadata_cache_arguments(parser)
+    assert parser.parse_args([]).metadata_cache_dir == '/some/other/dir'
+
+
+def test_get_or_extract():
+    with TemporaryDirectory() as cache_dir, NamedTemporaryFile() as apk:
+        apk.write(b'some apk')
+        apk.flush()
+        extract = MagicMock(return_value={'version_code': '1', 'locales': ('en-US', 'fr'), 'api_level': 21})
+
+        cache = MetadataCache(cache_dir)
+        assert cache.get_or_extract(apk.name, ('apk', True, False), extract) == extract.return_value
+        extract.assert_called_once_with()
+
+        extract.reset_mock()
+        # A new instance reads what previous ones (e.g.: in other processes) wrote
+        metadata = MetadataCache(cache_dir).get_or_extract(apk.name, ('apk', True, False), extract)
+        assert metadata == {'version_code': '1', 'locales': ('en-US', 'fr'), 'api_level': 21}
+        assert isinstance(metadata['locales'], tuple)
+        extract.assert_not_called()
+
+        # Different flags may lead to different metadata
+        cache.get_or_extract(apk.name, ('apk', False, False), extract)
+        extract.assert_called_once_with()
+
+
+def test_get_or_extract_is_keyed_by_content():
+    with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+        cache = MetadataCache(cache_dir)
+        cache.get_or_extract(_create_file(temp_dir, 'a.aab', b'same content'), ('aab',), lambda: {'version_code': '1'})
+
+        extract = MagicMock()
+        assert cache.get_or_extract(
+            _create_file(temp_dir, 'b.aab', b'same content'), ('aab',), extract
+        ) == {'version_code': '1'}
+        extract.assert_not_called()
+
+        assert cache.get_or_extract(
+            _create_file(temp_dir, 'c.aab', b'other content'), ('aab',), lambda: {'version_code': '2'}
+        ) == {'version_code': '2'}
+
+
+def test_get_or_extract_ignores_corrupted_entries():
+    with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+        cache = MetadataCache(cache_dir)
+        aab = _create_file(temp_dir, 'a.aab', b'content')
+        cache.get_or_extract(aab, ('aab',), lambda: {'version_code': '1'})
+        entry_path = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        with open(entry_path, 'w') as f:
+            f.write('{not json')
+
+        assert cache.get_or_extract(aab, ('aab',), lambda: {'version_code': '2'}) == {'version_code': '2'}
+
+
+def _get_entry_path(cache_dir, file):
+    sha512 = file_sha512sum(file)
+    return next(
+        os.path.join(cache_dir, entry) for entry in os.listdir(cache_dir) if entry.startswith(sha512)
+    )
+
+
+def test_least_recently_used_entries_are_evicted():
+    with TemporaryDirectory() as cache_dir, TemporaryDirectory() as temp_dir:
+        files = [_create_file(temp_dir, '{}.aab'.format(i), str(i).encode()) for i in range(4)]
+        cache = MetadataCache(cache_dir)
+        for i, file in enumerate(files[:3]):
+            cache.get_or_extract(file, ('aab',), lambda: {'version_code': str(i)})
+            os.utime(_get_entry_path(cache_dir, file), (1000 * (i + 1), 1000 * (i + 1)))
+
+        # Using the first file makes the second one the least recently used
+        cache.get_or_extract(files[0], ('aab',), MagicMock())
+
+        entry_size = os.path.getsize(_get_entry_path(cache_dir, files[0]))
+        cache = MetadataCache(cache_dir, max_size=3 * entry_size)
+        cache.get_or_extract(files[3], ('aab',), lambda: {'version_code': '3'})
+
+        assert len(os.listdir(cache_dir)) == 3
+        extract = MagicMock(return_value={'version_code': '1'})
+        cache.get_or_extract(files[1], ('aab',), extract)
+        extract.assert_called_once_with()
@@ -1,5 +1,9 @@
 import argparse
+import hashlib
 import json
+import os
+import tempfile
+import threading
 
 from mock import ANY, patch, Mock
 import pytest
@@ -7,12 +11,15 @@ import random
 
 from httplib2 import Response
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence, HttpRequest, MediaFileUpload
 from unittest.mock import MagicMock
 
 from mozapkpublisher.common import store
-from mozapkpublisher.common.exceptions import WrongArgumentGiven
+from mozapkpublisher.common.exceptions import VersionCodeConflict, WrongArgumentGiven
 from mozapkpublisher.common.store import add_general_google_play_arguments, \
     GooglePlayEdit, _create_google_edit_resource
+from mozapkpublisher.common.upload_journal import UploadJournal
+from mozapkpublisher.common.utils import file_sha256sum
 from mozapkpublisher.test import does_not_raise
 
 
@@ -26,14 +33,71 @@ def test_add_general_google_play_arguments():
     assert config.google_play_credentials_filename == 'credentials.json'
 
 
+@pytest.fixture(autouse=True)
+def media_file_upload_mock(monkeypatch):
+    # MediaFileUpload opens the file right away, while most tests give fake paths
+    media_file_upload_mock = MagicMock()
+    media_file_upload_mock.return_value.size.return_value = 42 * 1000 * 1000
+    monkeypatch.setattr(store, 'MediaFileUpload', media_file_upload_mock)
+    return media_file_upload_mock
+
+
+@pytest.fixture(autouse=True)
+def clear_google_caches(monkeypatch):
+    store._create_google_credentials.cache_clear()
+    monkeypatch.setattr(store, '_services', threading.local())
+    yield
+    store._create_google_credentials.cache_clear()
+
+
 def test_google_edit_resource_for_options_contact(monkeypatch):
     service_mock = MagicMock()
     service_mock.edits.return_value = 'edit resource'
+    from_service_account_file_mock = MagicMock()
+    monkeypatch.setattr(store.service_account.Credentials, 'from_service_account_file', from_service_account_file_mock)
+    build_mock = MagicMock(return_value=service_mock)
+    monkeypatch.setattr(store, 'build', build_mock)
+
+    for _ in range(2):
+        edit_resource = _create_google_edit_resource(True, 'credentials_filename')
+        assert edit_resource == 'edit resource'
+
+    # Credentials and service are reused across transactions
+    from_service_account_file_mock.assert_called_once_with(
+        'credentials_filename', scopes=['https://www.googleapis.com/auth/androidpublisher']
+    )
+    build_mock.assert_called_once_with(
+        serviceName='androidpublisher', version='v3', credentials=from_service_account_file_mock.return_value,
+        cache_discovery=False, static_discovery=True, num_retries=store.NUM_RETRIES,
+    )
+
+
+def test_google_service_is_cached_per_thread(monkeypatch):
     monkeypatch.setattr(store.service_account.Credentials, 'from_service_account_file',
                         lambda *args, **kwargs: MagicMock())
-    monkeypatch.setattr(store, 'build', lambda *args, **kwargs: service_mock)
-    edit_resource = _create_google_edit_resource(True, 'credentials_filename')
-    assert edit_resource == 'edit resource'
+    monkeypatch.setattr(store, 'build', lambda *args, **kwargs: MagicMock())
+
+    main_thread_service = store._get_google_service('credentials_filename')
+    assert store._get_google_service('credentials_filename') is main_thread_service
+    assert store._get_google_service('other_credentials_filename') is not main_thread_service
+
+    other_thread_services = []
+    thread = threading.Thread(
+        target=lambda: other_thread_services.append(store._get_google_service('credentials_filename'))
+    )
+    thread.start()
+    thread.join()
+    assert other_thread_services[0] is not main_thread_service
+
+
+def test_google_service_builds_from_bundled_discovery_document(monkeypatch):
+    monkeypatch.setattr(store.service_account.Credentials, 'from_service_account_file',
+                        lambda *args, **kwargs: MagicMock())
+    # No request should be made to fetch the discovery document
+    monkeypatch.setattr(store.httplib2.Http, 'request', MagicMock(side_effect=AssertionError('network access')))
+
+    service = store._get_google_service('credentials_filename')
+    assert hasattr(service.edits(), 'insert')
 
 
 def test_google_edit_resource_for_options_do_not_contact():
@@ -48,6 +112,9 @@ def edit_resource_mock():
 
     new_transaction_mock.execute = lambda: {'id': random.randint(0, 1000)}
     edit_resource.insert = lambda body, packageName: new_transaction_mock
+    for resource in (edit_resource.apks(), edit_resource.bundles()):
+        resource.upload().next_chunk.return_value = (None, {})
+        resource.upload.reset_mock()
     return edit_resource
 
 
@@ -56,7 +123,7 @@ def test_google_rollout_without_rollout_percentage():
     with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=False,
                                     dry_run=True) as edit:
         with pytest.raises(WrongArgumentGiven):
-            edit._update_track('rollout', [1], None)
+            edit.update_track('rollout', [1], None)
 
 
 @patch.object(store, '_create_google_edit_resource')
@@ -65,7 +132,7 @@ def test_google_valid_rollout_percentage_with_track_rollout(create_edit_resource
     create_edit_resource.return_value = mock_edits_resource
     with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=False,
                                     dry_run=True) as edit:
-        edit._update_track('rollout', [1], 50)
+        edit.update_track('rollout', [1], 50)
 
     raw_tracks_update = mock_edits_resource.tracks().method_calls[0][2]
     assert raw_tracks_update['track'] == 'production'
@@ -85,7 +152,7 @@ def test_google_valid_rollout_percentage_with_real_track(create_edit_resource):
     create_edit_resource.return_value = mock_edits_resource
     with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=False,
                                     dry_run=True) as edit:
-        edit._update_track('beta', [1, 2], 20)
+        edit.update_track('beta', [1, 2], 20)
 
     raw_tracks_update = mock_edits_resource.tracks().method_calls[0][2]
     assert raw_tracks_update['track'] == 'beta'
@@ -124,13 +191,533 @@ def test_google_play_edit_no_commit_transaction(create_edit_resource):
 def test_google_update_app():
     edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
     edit.upload_apk = MagicMock()
-    edit._update_track = MagicMock()
+    edit.update_track = MagicMock()
     apk_mock = Mock()
     apk_mock.name = '/path/to/dummy.apk'
     edit.update_app([(apk_mock, {'version_code': 1})], 'alpha')
 
-    edit.upload_apk.assert_called_once_with(apk_mock)
-    edit._update_track.assert_called_once_with('alpha', [1], None)
+    edit.upload_apk.assert_called_once_with(apk_mock, version_code=1)
+    edit.update_track.assert_called_once_with('alpha', [1], None)
+
+
+def _create_file_mocks(count, extension):
+    files = []
+    for i in range(count):
+        file_mock = Mock()
+        file_mock.name = '/path/to/{}.{}'.format(i, extension)
+        files.append(file_mock)
+    return files
+
+
+@pytest.mark.parametrize('method_name, upload_method_name, extension', (
+    ('update_app', 'upload_apk', 'apk'),
+    ('update_aab', 'upload_aab', 'aab'),
+))
+def test_google_update_uploads_concurrently(method_name, upload_method_name, extension):
+    edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_jobs=3)
+    # Every upload waits for the others, which only completes if they run concurrently
+    barrier = threading.Barrier(3, timeout=5)
+    uploaded_files = []
+
+    def _upload(file, version_code):
+        barrier.wait()
+        uploaded_files.append(file)
+
+    setattr(edit, upload_method_name, _upload)
+    edit.update_track = MagicMock(side_effect=lambda *args: assert_all_uploaded())
+    files = _create_file_mocks(3, extension)
+
+    def assert_all_uploaded():
+        assert sorted(uploaded_files, key=lambda file: file.name) == files
+
+    getattr(edit, method_name)([(file, {'version_code': i}) for i, file in enumerate(files)], 'alpha')
+
+    edit.update_track.assert_called_once_with('alpha', [0, 1, 2], None)
+
+
+def test_google_update_app_does_not_update_track_if_an_upload_fails(caplog):
+    edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_jobs=2)
+    apks = _create_file_mocks(3, 'apk')
+
+    def _upload(apk, version_code):
+        if apk is apks[1]:
+            raise HttpError(Response({'status': '500'}), b'{}')
+
+    edit.upload_apk = _upload
+    edit.update_track = MagicMock()
+
+    with pytest.raises(HttpError):
+        edit.update_app([(apk, {'version_code': i}) for i, apk in enumerate(apks)], 'alpha')
+
+    edit.update_track.assert_not_called()
+    assert 'Could not upload "/path/to/1.apk"' in caplog.text
+
+
+def test_google_play_edit_uses_one_http_per_thread():
+    http_factory = MagicMock(side_effect=lambda: object())
+    edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', http_factory, upload_jobs=2)
+
+    main_thread_http = edit._get_http()
+    assert edit._get_http() is main_thread_http
+
+    other_thread_https = []
+    thread = threading.Thread(target=lambda: other_thread_https.append(edit._get_http()))
+    thread.start()
+    thread.join()
+
+    assert other_thread_https[0] is not main_thread_http
+    assert http_factory.call_count == 2
+
+
+def test_google_play_edit_uses_service_http_by_default(edit_resource_mock):
+    edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+    assert edit._get_http() is None
+
+    apk_mock = Mock()
+    apk_mock.name = '/path/to/dummy.apk'
+    edit.upload_apk(apk_mock)
+    edit_resource_mock.apks().upload().next_chunk.assert_called_once_with(http=None)
+
+
+@pytest.mark.parametrize('contact_server, upload_jobs, request_jobs, expect_http_factory', (
+    (True, 1, 1, False),
+    (True, 4, 1, True),
+    (True, 1, 4, True),
+    (False, 4, 4, False),
+))
+def test_google_play_edit_transaction_http_factory(monkeypatch, contact_server, upload_jobs, request_jobs,
+                                                   expect_http_factory):
+    monkeypatch.setattr(store, '_create_google_edit_resource', lambda *args: MagicMock())
+    create_http_factory_mock = MagicMock()
+    monkeypatch.setattr(store, '_create_authorized_http_factory', create_http_factory_mock)
+
+    with GooglePlayEdit.transaction('credentials.json', 'dummy_package_name', contact_server=contact_server,
+                                    dry_run=True, upload_jobs=upload_jobs, request_jobs=request_jobs) as edit:
+        assert edit._upload_jobs == upload_jobs
+        assert edit._request_jobs == request_jobs
+        if expect_http_factory:
+            create_http_factory_mock.assert_called_once_with('credentials.json')
+            assert edit._http_factory is create_http_factory_mock.return_value
+        else:
+            create_http_factory_mock.assert_not_called()
+            assert edit._http_factory is None
+
+
+def test_create_authorized_http_factory(monkeypatch):
+    credentials = MagicMock()
+    monkeypatch.setattr(store.service_account.Credentials, 'from_service_account_file',
+                        lambda *args, **kwargs: credentials)
+    http_factory = store._create_authorized_http_factory('credentials.json')
+
+    first_http = http_factory()
+    second_http = http_factory()
+    assert first_http.credentials is credentials
+    assert second_http.credentials is credentials
+    assert first_http.http is not second_http.http
+
+
+@pytest.mark.parametrize('kind, upload_method_name, existing_file', (
+    ('apks', 'upload_apk', lambda sha256: {'versionCode': 2015012345, 'binary': {'sha1': 'ab', 'sha256': sha256}}),
+    ('bundles', 'upload_aab', lambda sha256: {'versionCode': 2015012345, 'sha1': 'ab', 'sha256': sha256}),
+    ('bundles', 'upload_aab', lambda sha256: {'versionCode': 2015012345}),
+))
+def test_google_upload_skips_existing_version_codes(edit_resource_mock, kind, upload_method_name, existing_file):
+    resource = getattr(edit_resource_mock, kind)()
+    resource.list().execute.return_value = {kind: [existing_file(hashlib.sha256(b'').hexdigest())]}
+    resource.list.reset_mock()
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+    with tempfile.NamedTemporaryFile() as f:
+        upload = getattr(google_play, upload_method_name)
+        upload(f, version_code='2015012345')
+        upload(f, version_code=2015012345)
+
+    resource.upload.assert_not_called()
+    # Listed only once per edit
+    resource.list.assert_called_once_with(editId=google_play._edit_id, packageName='dummy_package_name')
+
+
+@pytest.mark.parametrize('kind, upload_method_name, existing_file', (
+    ('apks', 'upload_apk', {'versionCode': 2015012345, 'binary': {'sha256': 'cd'}}),
+    ('bundles', 'upload_aab', {'versionCode': 2015012345, 'sha256': 'cd'}),
+))
+def test_google_upload_rejects_existing_version_codes_of_other_files(
+    edit_resource_mock, kind, upload_method_name, existing_file
+):
+    resource = getattr(edit_resource_mock, kind)()
+    resource.list().execute.return_value = {kind: [existing_file]}
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+    with tempfile.NamedTemporaryFile() as f:
+        with pytest.raises(VersionCodeConflict, match='2015012345'):
+            getattr(google_play, upload_method_name)(f, version_code='2015012345')
+
+    resource.upload.assert_not_called()
+
+
+@pytest.mark.parametrize('kind, upload_method_name, existing_file', (
+    ('apks', 'upload_apk', lambda sha256: {'versionCode': 1, 'binary': {'sha256': sha256}}),
+    ('bundles', 'upload_aab', lambda sha256: {'versionCode': 1, 'sha256': sha256}),
+))
+def test_google_upload_skips_existing_hashes(edit_resource_mock, kind, upload_method_name, existing_file):
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b'already uploaded')
+        f.flush()
+        resource = getattr(edit_resource_mock, kind)()
+        resource.list().execute.return_value = {kind: [existing_file(hashlib.sha256(b'already uploaded').hexdigest())]}
+        google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+        getattr(google_play, upload_method_name)(f, version_code='2')
+        resource.upload.assert_not_called()
+
+        f.write(b' and modified')
+        f.flush()
+        getattr(google_play, upload_method_name)(f, version_code='2')
+        resource.upload.assert_called_once()
+
+
+def test_google_upload_apk_without_existing_files(edit_resource_mock):
+    edit_resource_mock.apks().list().execute.return_value = {}
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+    apk_mock = Mock()
+    apk_mock.name = '/path/to/non-existing.apk'
+    google_play.upload_apk(apk_mock, version_code='1')
+    edit_resource_mock.apks().upload.assert_called_once()
+
+
+def _upload_status(resumable_progress, total_size):
+    status = MagicMock()
+    status.resumable_progress = resumable_progress
+    status.total_size = total_size
+    status.progress.return_value = resumable_progress / total_size
+    return status
+
+
+def test_google_upload_in_chunks_with_retries(edit_resource_mock, media_file_upload_mock, monkeypatch, caplog):
+    sleep_mock = MagicMock()
+    monkeypatch.setattr(store.time, 'sleep', sleep_mock)
+    edit_resource_mock.bundles().upload().next_chunk.side_effect = (
+        (_upload_status(10, 42), None),
+        HttpError(Response({'status': '503'}), b'{}'),
+        ConnectionResetError(),
+        (_upload_status(20, 42), None),
+        (None, {'versionCode': 1}),
+    )
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_chunk_size=8 * 1024 * 1024)
+
+    aab_mock = Mock()
+    aab_mock.name = '/path/to/dummy.aab'
+    with caplog.at_level('INFO', logger='mozapkpublisher.common.store'):
+        google_play.upload_aab(aab_mock)
+
+    media_file_upload_mock.assert_called_once_with(
+        '/path/to/dummy.aab', mimetype='application/octet-stream', resumable=True, chunksize=8 * 1024 * 1024
+    )
+    assert edit_resource_mock.bundles().upload().next_chunk.call_count == 5
+    assert sleep_mock.call_count == 2
+    assert '"/path/to/dummy.aab": 10/42 bytes uploaded (24%)' in caplog.text
+    assert 'MB in' in caplog.text
+    assert '42.0 MB' in caplog.text
+    assert '2 retries)' in caplog.text
+
+
+def test_google_upload_is_traced(edit_resource_mock, monkeypatch):
+    monkeypatch.setattr(store.time, 'sleep', MagicMock())
+    request = edit_resource_mock.bundles().upload()
+    request.resumable_uri = 'https://upload.example/session'
+    request.resumable_progress = 0
+
+    def next_chunk(http):
+        if next_chunk.calls == 1:
+            next_chunk.calls += 1
+            raise ConnectionResetError()
+        next_chunk.calls += 1
+        request.resumable_progress += 21
+        return (_upload_status(21, 42), None) if next_chunk.calls < 3 else (None, {'versionCode': 1})
+
+    next_chunk.calls = 0
+    request.next_chunk.side_effect = next_chunk
+    upload_tracer = MagicMock()
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_tracer=upload_tracer)
+
+    aab_mock = Mock()
+    aab_mock.name = '/path/to/dummy.aab'
+    google_play.upload_aab(aab_mock)
+
+    events = [(args[0], kwargs) for args, kwargs in upload_tracer.record.call_args_list]
+    assert [event for event, _ in events] == [
+        'upload_started', 'chunk_uploaded', 'chunk_failed', 'chunk_uploaded', 'upload_finished',
+    ]
+    for _, fields in events:
+        assert fields['package_name'] == 'dummy_package_name'
+        assert fields['edit_id'] == 1
+        assert fields['file'] == '/path/to/dummy.aab'
+    assert events[1][1]['resumable_uri'] == 'https://upload.example/session'
+    assert events[1][1]['start_offset'] == 0
+    assert events[1][1]['end_offset'] == 21
+    assert events[2][1]['error'] == 'ConnectionResetError()'
+    assert events[3][1]['retries'] == 1
+    assert events[3][1]['end_offset'] == 42 * 1000 * 1000
+    assert events[4][1]['retries'] == 1
+
+
+def test_google_upload_failure_is_traced(edit_resource_mock):
+    edit_resource_mock.apks().upload().next_chunk.side_effect = HttpError(Response({'status': '400'}), b'{}')
+    upload_tracer = MagicMock()
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_tracer=upload_tracer)
+
+    apk_mock = Mock()
+    apk_mock.name = '/path/to/dummy.apk'
+    with pytest.raises(HttpError):
+        google_play.upload_apk(apk_mock)
+
+    assert [args[0] for args, _ in upload_tracer.record.call_args_list] == [
+        'upload_started', 'chunk_failed', 'upload_failed',
+    ]
+
+
+@pytest.fixture
+def upload_journal():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield UploadJournal(os.path.join(temp_dir, 'journal.json'))
+
+
+def test_google_play_edit_transaction_reuses_journaled_edit(upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 'journaled-edit-id')
+    edit_resource = MagicMock()
+
+    with patch.object(store, '_create_google_edit_resource', return_value=edit_resource):
+        with pytest.raises(ConnectionResetError):
+            with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=True, dry_run=False,
+                                            upload_journal=upload_journal) as edit:
+                assert edit._edit_id == 'journaled-edit-id'
+                raise ConnectionResetError()
+
+    edit_resource.get.assert_called_once_with(editId='journaled-edit-id', packageName='dummy_package_name')
+    edit_resource.insert.assert_not_called()
+    edit_resource.commit.assert_not_called()
+    # Nothing was committed, a rerun may still reuse it
+    assert upload_journal.get_edit_id('dummy_package_name') == 'journaled-edit-id'
+
+
+def test_google_play_edit_transaction_does_not_journal_dry_runs(upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 'journaled-edit-id')
+
+    with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=False, dry_run=True,
+                                    upload_journal=upload_journal) as edit:
+        assert edit._edit_id == 'fake-transaction-id'
+        assert edit._upload_journal is None
+        edit.update_track('beta', [1])
+
+    assert upload_journal.get_edit_id('dummy_package_name') == 'journaled-edit-id'
+
+
+@pytest.mark.parametrize('update', (
+    lambda edit: edit.update_track('beta', [1]),
+    lambda edit: edit.update_listings('en-GB', 'Firefox', 'Long description', 'Short'),
+    lambda edit: edit.update_whats_new('en-GB', '1', 'New feature'),
+))
+def test_google_play_edit_stops_journaling_once_changes_are_staged(edit_resource_mock, upload_journal, update):
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    update(google_play)
+    assert upload_journal.get_edit_id('dummy_package_name') is None
+
+    # Uploads still work, they're just not journaled anymore
+    with tempfile.NamedTemporaryFile(suffix='.aab') as aab:
+        google_play.upload_aab(aab)
+    assert upload_journal.get_edit_id('dummy_package_name') is None
+
+
+def test_google_play_edit_transaction_replaces_gone_journaled_edit(upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 'journaled-edit-id')
+    edit_resource = MagicMock()
+    edit_resource.get().execute.side_effect = HttpError(Response({'status': '404'}), b'{}')
+    edit_resource.insert().execute.return_value = {'id': 'new-edit-id'}
+
+    with patch.object(store, '_create_google_edit_resource', return_value=edit_resource):
+        with GooglePlayEdit.transaction(None, 'dummy_package_name', contact_server=True, dry_run=False,
+                                        upload_journal=upload_journal) as edit:
+            assert edit._edit_id == 'new-edit-id'
+            assert upload_journal.get_edit_id('dummy_package_name') == 'new-edit-id'
+
+    # Committed edits can't be reused
+    assert upload_journal.get_edit_id('dummy_package_name') is None
+
+
+def test_google_upload_records_progress_in_journal(edit_resource_mock, upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    request = edit_resource_mock.bundles().upload()
+    request.resumable_uri = 'https://upload.example/session'
+    request.resumable_progress = 21
+    recorded_uploads = []
+
+    def next_chunk(http):
+        recorded_uploads.append(upload_journal.get_upload('dummy_package_name', file_sha256))
+        return (_upload_status(21, 42), None) if len(recorded_uploads) == 1 else (None, {'versionCode': 1})
+
+    request.next_chunk.side_effect = next_chunk
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    with tempfile.NamedTemporaryFile(suffix='.aab') as aab:
+        file_sha256 = hashlib.sha256(b'').hexdigest()
+        google_play.upload_aab(aab)
+
+    assert recorded_uploads == [None, {
+        'file': aab.name,
+        'resumable_uri': 'https://upload.example/session',
+        'resumable_progress': 21,
+    }]
+    assert upload_journal.get_upload('dummy_package_name', file_sha256) is None
+
+
+def test_google_upload_hashes_file_once(monkeypatch, edit_resource_mock, upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    edit_resource_mock.bundles().list().execute.return_value = {'bundles': [{'versionCode': 1, 'sha256': 'other'}]}
+    edit_resource_mock.bundles().upload().next_chunk.return_value = (None, {'versionCode': 2})
+    file_sha256sum_mock = MagicMock(wraps=store.file_sha256sum)
+    monkeypatch.setattr(store, 'file_sha256sum', file_sha256sum_mock)
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    with tempfile.NamedTemporaryFile(suffix='.aab') as aab:
+        google_play.upload_aab(aab, version_code='2')
+
+    # Used by both the duplicate check and the journal
+    file_sha256sum_mock.assert_called_once_with(aab.name)
+
+
+def test_google_upload_resumes_from_journal(edit_resource_mock, upload_journal):
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    request = edit_resource_mock.bundles().upload()
+    resumed_from = []
+    request.next_chunk.side_effect = lambda http: (
+        resumed_from.append((request.resumable_uri, request.resumable_progress)) or (None, {'versionCode': 1})
+    )
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    with tempfile.NamedTemporaryFile(suffix='.aab') as aab:
+        upload_journal.set_upload(
+            'dummy_package_name', hashlib.sha256(b'').hexdigest(), aab.name, 'https://upload.example/session', 21
+        )
+        google_play.upload_aab(aab)
+
+    assert resumed_from == [('https://upload.example/session', 21)]
+    assert request._in_error_state is True
+
+
+def test_google_upload_resumes_from_what_google_play_has(edit_resource_mock, upload_journal, monkeypatch):
+    monkeypatch.setattr(store, 'MediaFileUpload', MediaFileUpload)
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    http = HttpMockSequence([
+        # Google Play got more than what the journal says
+        ({'status': '308', 'range': 'bytes=0-29'}, ''),
+        ({'status': '200'}, '{"versionCode": 1}'),
+    ])
+
+    def upload(editId, packageName, media_body):
+        return HttpRequest(
+            http, lambda resp, content: json.loads(content), 'https://upload.example/start', method='POST',
+            resumable=media_body,
+        )
+
+    edit_resource_mock.apks().upload.side_effect = upload
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    with tempfile.NamedTemporaryFile(suffix='.apk') as apk:
+        apk.write(b'0' * 42)
+        apk.flush()
+        upload_journal.set_upload(
+            'dummy_package_name', file_sha256sum(apk.name), apk.name, 'https://upload.example/session', 21
+        )
+        assert google_play.upload_apk(apk) is None
+
+    (status_uri, status_method, _, status_headers), (chunk_uri, _, chunk_body, chunk_headers) = http.request_sequence
+    assert (status_uri, status_method) == ('https://upload.example/session', 'PUT')
+    assert status_headers['Content-Range'] == 'bytes */42'
+    assert chunk_uri == 'https://upload.example/session'
+    assert chunk_headers['Content-Range'] == 'bytes 30-41/42'
+    assert len(chunk_body.read()) == 12
+
+
+def test_google_upload_restarts_expired_session(edit_resource_mock, upload_journal, monkeypatch):
+    sleep_mock = MagicMock()
+    monkeypatch.setattr(store.time, 'sleep', sleep_mock)
+    upload_journal.set_edit_id('dummy_package_name', 1)
+    request = edit_resource_mock.apks().upload()
+    resumed_from = []
+
+    def next_chunk(http):
+        resumed_from.append((request.resumable_uri, request.resumable_progress))
+        if len(resumed_from) == 1:
+            raise HttpError(Response({'status': '404'}), b'{}')
+        return None, {'versionCode': 1}
+
+    request.next_chunk.side_effect = next_chunk
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', upload_journal=upload_journal)
+
+    with tempfile.NamedTemporaryFile(suffix='.apk') as apk:
+        upload_journal.set_upload(
+            'dummy_package_name', hashlib.sha256(b'').hexdigest(), apk.name, 'https://upload.example/session', 21
+        )
+        google_play.upload_apk(apk)
+
+    assert resumed_from == [('https://upload.example/session', 21), (None, 0)]
+    sleep_mock.assert_not_called()
+
+
+def test_google_upload_gives_up_after_too_many_retries(edit_resource_mock, monkeypatch):
+    monkeypatch.setattr(store.time, 'sleep', MagicMock())
+    edit_resource_mock.apks().upload().next_chunk.side_effect = HttpError(Response({'status': '500'}), b'{}')
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+    apk_mock = Mock()
+    apk_mock.name = '/path/to/dummy.apk'
+    with pytest.raises(HttpError):
+        google_play.upload_apk(apk_mock)
+
+    assert edit_resource_mock.apks().upload().next_chunk.call_count == store.NUM_RETRIES + 1
+
+
+def test_google_upload_gives_each_chunk_its_own_retries(edit_resource_mock, monkeypatch, caplog):
+    monkeypatch.setattr(store.time, 'sleep', MagicMock())
+    server_error = HttpError(Response({'status': '500'}), b'{}')
+    edit_resource_mock.apks().upload().next_chunk.side_effect = (
+        [server_error] * store.NUM_RETRIES + [(_upload_status(21, 42), None)]
+        + [server_error] * store.NUM_RETRIES + [(None, {'versionCode': 1})]
+    )
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
+
+    apk_mock = Mock()
+    apk_mock.name = '/path/to/dummy.apk'
+    with caplog.at_level('INFO', logger='mozapkpublisher.common.store'):
+        google_play.upload_apk(apk_mock)
+
+    assert '{} retries)'.format(2 * store.NUM_RETRIES) in caplog.text
+
+
+def _rate_limit_error(reason):
+    return HttpError(Response({'status': '403'}), json.dumps({
+        'error': {'errors': [{'reason': reason}]},
+    }).encode())
+
+
+@pytest.mark.parametrize('error, is_retriable', (
+    (_rate_limit_error('rateLimitExceeded'), True),
+    (_rate_limit_error('userRateLimitExceeded'), True),
+    (_rate_limit_error('forbidden'), False),
+    (HttpError(Response({'status': '500'}), b'{}'), True),
+    (HttpError(Response({'status': '503'}), b'{}'), True),
+    (HttpError(Response({'status': '429'}), b'{}'), True),
+    (HttpError(Response({'status': '400'}), b'{}'), False),
+    (HttpError(Response({'status': '403'}), b'{}'), False),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (ValueError(), False),
+))
+def test_is_retriable_upload_error(error, is_retriable):
+    assert store._is_retriable_upload_error(error) == is_retriable
 
 
 def test_google_get_track_status(edit_resource_mock):
@@ -167,9 +754,9 @@ def test_google_get_track_status(edit_resource_mock):
 
 
 def test_google_upload_apk_returns_files_metadata(edit_resource_mock):
-    edit_resource_mock.apks().upload().execute.return_value = {
+    edit_resource_mock.apks().upload().next_chunk.return_value = (None, {
         'binary': {'sha1': '1234567890abcdef1234567890abcdef12345678'}, 'versionCode': 2015012345
-    }
+    })
     edit_resource_mock.apks().upload.reset_mock()
 
     google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
@@ -179,13 +766,16 @@ def test_google_upload_apk_returns_files_metadata(edit_resource_mock):
     edit_resource_mock.apks().upload.assert_called_once_with(
         editId=google_play._edit_id,
         packageName='dummy_package_name',
-        media_body='/path/to/dummy.apk',
+        media_body=store.MediaFileUpload.return_value,
+    )
+    store.MediaFileUpload.assert_called_once_with(
+        '/path/to/dummy.apk', mimetype='application/octet-stream', resumable=True
     )
 
 
 @pytest.mark.parametrize('http_status_code', (400, 403))
 def test_google_upload_apk_errors_out(edit_resource_mock, http_status_code):
-    edit_resource_mock.apks().upload().execute.side_effect = HttpError(
+    edit_resource_mock.apks().upload().next_chunk.side_effect = HttpError(
         # XXX status is presented as a string by googleapiclient
         resp=Response({'status': str(http_status_code)}),
         # XXX content must be bytes
@@ -218,7 +808,7 @@ def test_google_upload_apk_does_not_error_out_when_apk_is_already_published(edit
     # https://github.com/googleapis/google-api-python-client/blob/ffea1a7fe9d381d23ab59048263c631cc2b45323/googleapiclient/errors.py#L41
     content_bytes = json.dumps(content).encode('ascii')
 
-    edit_resource_mock.apks().upload().execute.side_effect = HttpError(
+    edit_resource_mock.apks().upload().next_chunk.side_effect = HttpError(
         # XXX status is presented as a string by googleapiclient
         resp=Response({'status': '403'}),
         content=content_bytes,
@@ -234,7 +824,7 @@ def test_google_upload_apk_does_not_error_out_when_apk_is_already_published(edit
 def test_google_update_track(edit_resource_mock):
     google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
 
-    google_play._update_track('alpha', ['2015012345', '2015012347'])
+    google_play.update_track('alpha', ['2015012345', '2015012347'])
     edit_resource_mock.tracks().update.assert_called_once_with(
         editId=google_play._edit_id,
         packageName='dummy_package_name',
@@ -249,7 +839,7 @@ def test_google_update_track(edit_resource_mock):
     )
 
     edit_resource_mock.tracks().update.reset_mock()
-    google_play._update_track('production', ['2015012345', '2015012347'], rollout_percentage=1)
+    google_play.update_track('production', ['2015012345', '2015012347'], rollout_percentage=1)
     edit_resource_mock.tracks().update.assert_called_once_with(
         editId=google_play._edit_id,
         packageName='dummy_package_name',
@@ -271,7 +861,7 @@ def test_google_update_track_should_refuse_wrong_percentage(edit_resource_mock,
     google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
 
     with pytest.raises(WrongArgumentGiven):
-        google_play._update_track('production', ['2015012345', '2015012347'], invalid_percentage)
+        google_play.update_track('production', ['2015012345', '2015012347'], invalid_percentage)
 
 
 def test_google_update_listings(edit_resource_mock):
@@ -308,22 +898,59 @@ def test_google_update_whats_new(edit_resource_mock):
     )
 
 
+@pytest.mark.parametrize('request_jobs', (1, 4))
+def test_google_update_listings_bulk(edit_resource_mock, request_jobs):
+    http_factory = MagicMock(side_effect=lambda: object())
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', http_factory, request_jobs=request_jobs)
+
+    def update(editId, packageName, language, body):
+        if language == 'fr':
+            raise HttpError(Response({'status': '400'}), b'{}')
+        return MagicMock()
+
+    edit_resource_mock.listings().update.side_effect = update
+    listings = {
+        language: {'title': 'Firefox', 'full_description': 'Long description', 'short_description': 'Short'}
+        for language in ('en-GB', 'fr', 'de', 'it')
+    }
+    failures = google_play.update_listings_bulk(listings)
+
+    assert list(failures) == ['fr']
+    assert isinstance(failures['fr'], HttpError)
+    assert sorted(call[1]['language'] for call in edit_resource_mock.listings().update.call_args_list) == [
+        'de', 'en-GB', 'fr', 'it',
+    ]
+
+
+def test_google_update_whats_new_bulk(edit_resource_mock):
+    google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name', MagicMock(), request_jobs=2)
+
+    failures = google_play.update_whats_new_bulk('2015012345', {'en-GB': 'New feature', 'fr': 'Nouveauté'})
+
+    assert failures == {}
+    edit_resource_mock.apklistings().update.assert_any_call(
+        editId=1, packageName='dummy_package_name', language='fr', apkVersionCode='2015012345',
+        body={'recentChanges': 'Nouveauté'},
+    )
+    assert edit_resource_mock.apklistings().update.call_count == 2
+
+
 def test_google_update_aab():
     edit = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
     edit.upload_aab = MagicMock()
-    edit._update_track = MagicMock()
+    edit.update_track = MagicMock()
     aab_mock = Mock()
     aab_mock.name = '/path/to/dummy.aab'
     edit.update_aab([(aab_mock, {'version_code': 1})], 'alpha')
 
-    edit.upload_aab.assert_called_once_with(aab_mock)
-    edit._update_track.assert_called_once_with('alpha', [1], None)
+    edit.upload_aab.assert_called_once_with(aab_mock, version_code=1)
+    edit.update_track.assert_called_once_with('alpha', [1], None)
 
 
 def test_google_upload_aab_returns_files_metadata(edit_resource_mock):
-    edit_resource_mock.bundles().upload().execute.return_value = {
+    edit_resource_mock.bundles().upload().next_chunk.return_value = (None, {
         'binary': {'sha1': '1234567890abcdef1234567890abcdef12345678'}, 'versionCode': 2015012345
-    }
+    })
     edit_resource_mock.bundles().upload.reset_mock()
 
     google_play = GooglePlayEdit(edit_resource_mock, 1, 'dummy_package_name')
@@ -333,14 +960,16 @@ def test_google_upload_aab_returns_files_metadata(edit_resource_mock):
     edit_resource_mock.bundles().upload.assert_called_once_with(
         editId=google_play._edit_id,
         packageName='dummy_package_name',
-        media_body='/path/to/dummy.aab',
-        media_mime_type='application/octet-stream',
+        media_body=store.MediaFileUpload.return_value,
+    )
+    store.MediaFileUpload.assert_called_once_with(
+        '/path/to/dummy.aab', mimetype='application/octet-stream', resumable=True
     )
 
 
 @pytest.mark.parametrize('http_status_code', (400, 403))
 def test_google_upload_aab_errors_out(edit_resource_mock, http_status_code):
-    edit_resource_mock.bundles().upload().execute.side_effect = HttpError(
+    edit_resource_mock.bundles().upload().next_chunk.side_effect = HttpError(
         # XXX status is presented as a string by googleapiclient
         resp=Response({'status': str(http_status_code)}),
         # XXX content must be bytes
@@ -371,7 +1000,7 @@ def test_google_upload_aab_does_not_error_out_when_aab_is_already_published(edit
     # https://github.com/googleapis/google-api-python-client/blob/ffea1a7fe9d381d23ab59048263c631cc2b45323/googleapiclient/errors.py#L41
     content_bytes = json.dumps(content).encode('ascii')
 
-    edit_resource_mock.bundles().upload().execute.side_effect = HttpError(
+    edit_resource_mock.bundles().upload().next_chunk.side_effect = HttpError(
         # XXX status is presented as a string by googleapiclient
         resp=Response({'status': '403'}),
         content=content_bytes,
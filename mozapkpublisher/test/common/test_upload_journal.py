@@ -0,0 +1,69 @@
+import json
+import os
+
+from tempfile import TemporaryDirectory
+
+from mozapkpublisher.common.upload_journal import UploadJournal
+
+
+def test_upload_journal_persists_edits_and_uploads():
+    with TemporaryDirectory() as temp_dir:
+        journal_path = os.path.join(temp_dir, 'journal.json')
+        journal = UploadJournal(journal_path)
+        assert journal.get_edit_id('org.mozilla.fenix') is None
+        assert journal.get_upload('org.mozilla.fenix', 'sha256') is None
+
+        journal.set_edit_id('org.mozilla.fenix', 'edit-1')
+        journal.set_upload('org.mozilla.fenix', 'sha256', 'fenix.aab', 'https://upload.example/session', 1024)
+
+        journal = UploadJournal(journal_path)
+        assert journal.get_edit_id('org.mozilla.fenix') == 'edit-1'
+        assert journal.get_upload('org.mozilla.fenix', 'sha256') == {
+            'file': 'fenix.aab',
+            'resumable_uri': 'https://upload.example/session',
+            'resumable_progress': 1024,
+        }
+
+        journal.forget_upload('org.mozilla.fenix', 'sha256')
+        assert UploadJournal(journal_path).get_upload('org.mozilla.fenix', 'sha256') is None
+
+        journal.forget_edit('org.mozilla.fenix')
+        assert UploadJournal(journal_path).get_edit_id('org.mozilla.fenix') is None
+        # No temporary file is left behind
+        assert os.listdir(temp_dir) == ['journal.json']
+
+
+def test_upload_journal_drops_uploads_of_previous_edit():
+    with TemporaryDirectory() as temp_dir:
+        journal = UploadJournal(os.path.join(temp_dir, 'journal.json'))
+        journal.set_edit_id('org.mozilla.fenix', 'edit-1')
+        journal.set_upload('org.mozilla.fenix', 'sha256', 'fenix.aab', 'https://upload.example/session', 1024)
+
+        journal.set_edit_id('org.mozilla.fenix', 'edit-1')
+        assert journal.get_upload('org.mozilla.fenix', 'sha256') is not None
+
+        journal.set_edit_id('org.mozilla.fenix', 'edit-2')
+        assert journal.get_upload('org.mozilla.fenix', 'sha256') is None
+
+
+def test_upload_journal_ignores_unreadable_journals():
+    with TemporaryDirectory() as temp_dir:
+        journal_path = os.path.join(temp_dir, 'journal.json')
+        with open(journal_path, 'w') as f:
+            f.write('not json')
+        assert UploadJournal(journal_path).get_edit_id('org.mozilla.fenix') is None
+
+        with open(journal_path, 'w') as f:
+            json.dump({'version': 0, 'edits': {'org.mozilla.fenix': {'edit_id': 'edit-1', 'uploads': {}}}}, f)
+        assert UploadJournal(journal_path).get_edit_id('org.mozilla.fenix') is None
+
+
+def test_upload_journal_ignores_uploads_of_forgotten_edits():
+    with TemporaryDirectory() as temp_dir:
+        journal_path = os.path.join(temp_dir, 'journal.json')
+        journal = UploadJournal(journal_path)
+        journal.set_upload('org.mozilla.fenix', 'sha256', 'fenix.aab', 'https://upload.example/session', 1024)
+        journal.forget_upload('org.mozilla.fenix', 'sha256')
+
+        assert journal.get_upload('org.mozilla.fenix', 'sha256') is None
+        assert not os.path.exists(journal_path)
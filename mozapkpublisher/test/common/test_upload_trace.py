@@ -0,0 +1,38 @@
+import json
+import os
+import threading
+
+from tempfile import TemporaryDirectory
+
+from mozapkpublisher.common.upload_trace import open_upload_tracer
+
+
+def test_open_upload_tracer_disabled():
+    with open_upload_tracer(None) as upload_tracer:
+        assert upload_tracer is None
+
+
+def test_upload_tracer_appends_json_lines():
+    with TemporaryDirectory() as temp_dir:
+        trace_file_path = os.path.join(temp_dir, 'trace.jsonl')
+        with open_upload_tracer(trace_file_path) as upload_tracer:
+            upload_tracer.record('upload_started', file='a.aab', size=42)
+        with open_upload_tracer(trace_file_path) as upload_tracer:
+            threads = [
+                threading.Thread(target=upload_tracer.record, args=('chunk_uploaded',), kwargs={'file': str(i)})
+                for i in range(10)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        with open(trace_file_path) as f:
+            events = [json.loads(line) for line in f]
+
+    assert len(events) == 11
+    assert events[0]['event'] == 'upload_started'
+    assert events[0]['file'] == 'a.aab'
+    assert events[0]['size'] == 42
+    assert isinstance(events[0]['timestamp'], float)
+    assert sorted(event['file'] for event in events[1:]) == sorted(str(i) for i in range(10))
@@ -1,10 +1,29 @@
+import argparse
+import asyncio
+import hashlib
+import pytest
 import requests
 import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import NamedTemporaryFile
 from unittest.mock import MagicMock
 
-from mozapkpublisher.common.utils import load_json_url, file_sha512sum, metadata_by_package_name
+from mozapkpublisher.common.exceptions import PushAborted, PushFailed
+from mozapkpublisher.common.utils import (
+    add_push_arguments,
+    collect_results_in_order,
+    BEST_EFFORT,
+    CONTENT_ID_CACHE_FILE_ENV_VAR,
+    FAIL_FAST,
+    file_sha256sum,
+    file_sha512sum,
+    load_json_url,
+    metadata_by_package_name,
+    raise_if_aborted,
+    run_per_package_name,
+)
 
 apk_x86 = NamedTemporaryFile()
 apk_arm = NamedTemporaryFile()
@@ -27,6 +46,65 @@ def test_file_sha512sum():
 ed2aabf90f1f8a5983082a0b88194fe81bc850d3019fd9eca9328584227c84'
 
 
+def test_file_sha256sum():
+    with tempfile.NamedTemporaryFile() as temp_file:
+        temp_file.write(b'known sha256')
+        temp_file.flush()
+
+        assert file_sha256sum(temp_file.name) == hashlib.sha256(b'known sha256').hexdigest()
+
+
+def test_collect_results_in_order():
+    release_first = threading.Event()
+
+    def _work(value):
+        if value == 1:
+            release_first.wait()
+        else:
+            release_first.set()
+        return value * 10
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(_work, value) for value in (1, 2)]
+        assert collect_results_in_order(executor, zip((apk_arm, apk_x86), futures), 'Failed "{}"') == [10, 20]
+
+
+def test_collect_results_in_order_cancels_on_first_failure(caplog):
+    release_first = threading.Event()
+
+    def _work(value):
+        if value == 'first':
+            release_first.wait(timeout=5)
+            raise ValueError(value)
+        if value == 'second':
+            raise ValueError(value)
+        return value
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        shutdown = executor.shutdown
+        first_done_at_shutdown = []
+
+        def _shutdown(*args, **kwargs):
+            first_done_at_shutdown.append(futures[0].done())
+            shutdown(*args, **kwargs)
+            release_first.set()
+
+        executor.shutdown = _shutdown
+        futures = [executor.submit(_work, value) for value in ('first', 'second', 'third')]
+        files = [MagicMock() for _ in futures]
+        for file, name in zip(files, ('a.apk', 'b.apk', 'c.apk')):
+            file.name = name
+
+        with pytest.raises(ValueError, match='first'):
+            collect_results_in_order(executor, zip(files, futures), 'Failed "{}"')
+
+    # Queued futures got cancelled without waiting for the running ones
+    assert first_done_at_shutdown == [False]
+    # The failure reported is the first one in input order, not the first to happen
+    assert 'Failed "a.apk"' in caplog.text
+    assert 'Failed "b.apk"' not in caplog.text
+
+
 def test_metadata_by_package_name():
     one_package_apks_metadata = {
         apk_arm: {'package_name': 'org.mozilla.firefox'},
@@ -64,3 +142,120 @@ def test_metadata_by_package_name():
     two_package_metadata = metadata_by_package_name(two_package_apks_metadata)
     assert len(two_package_metadata.keys()) == 2
     assert expected_two_package_metadata == two_package_metadata
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('failure_policy', (FAIL_FAST, BEST_EFFORT))
+async def test_run_per_package_name_runs_concurrently(failure_policy):
+    started = []
+    all_started = asyncio.Event()
+
+    async def _push(package_name, files, aborted):
+        started.append((package_name, files))
+        if len(started) == 2:
+            all_started.set()
+        # Only completes if every package name is being pushed at the same time
+        await asyncio.wait_for(all_started.wait(), timeout=5)
+        assert not aborted.is_set()
+
+    await run_per_package_name({'org.mozilla.fenix': ['a.apk'], 'org.mozilla.focus': ['b.apk']}, _push, failure_policy)
+
+    assert sorted(started) == [('org.mozilla.fenix', ['a.apk']), ('org.mozilla.focus', ['b.apk'])]
+
+
+@pytest.mark.asyncio
+async def test_run_per_package_name_fail_fast():
+    error = ValueError('upload failed')
+    cancelled = []
+    aborted_events = []
+
+    async def _push(package_name, files, aborted):
+        aborted_events.append(aborted)
+        if package_name == 'org.mozilla.fenix':
+            raise error
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(package_name)
+            raise
+
+    with pytest.raises(ValueError) as exc_info:
+        await run_per_package_name({'org.mozilla.fenix': [], 'org.mozilla.focus': []}, _push, FAIL_FAST)
+
+    assert exc_info.value is error
+    assert cancelled == ['org.mozilla.focus']
+    assert all(aborted.is_set() for aborted in aborted_events)
+
+
+@pytest.mark.asyncio
+async def test_run_per_package_name_best_effort():
+    fenix_error = ValueError('upload failed')
+    focus_error = RuntimeError('commit failed')
+    pushed = []
+
+    async def _push(package_name, files, aborted):
+        if package_name == 'org.mozilla.fenix':
+            raise fenix_error
+        if package_name == 'org.mozilla.focus':
+            await asyncio.sleep(0)
+            raise focus_error
+        await asyncio.sleep(0.01)
+        pushed.append(package_name)
+
+    with pytest.raises(PushFailed) as exc_info:
+        await run_per_package_name(
+            {'org.mozilla.fenix': [], 'org.mozilla.focus': [], 'org.mozilla.klar': []}, _push, BEST_EFFORT
+        )
+
+    assert exc_info.value.failures == {'org.mozilla.fenix': fenix_error, 'org.mozilla.focus': focus_error}
+    assert 'org.mozilla.fenix' in str(exc_info.value)
+    assert pushed == ['org.mozilla.klar']
+
+
+def test_raise_if_aborted():
+    aborted = MagicMock()
+    aborted.is_set.return_value = False
+    raise_if_aborted('org.mozilla.fenix', aborted)
+
+    aborted.is_set.return_value = True
+    with pytest.raises(PushAborted, match='org.mozilla.fenix'):
+        raise_if_aborted('org.mozilla.fenix', aborted)
+
+
+def test_add_push_arguments_upload_chunk_size():
+    parser = argparse.ArgumentParser()
+    add_push_arguments(parser)
+
+    assert parser.parse_args(['alpha']).upload_chunk_size is None
+    assert parser.parse_args(['alpha', '--upload-chunk-size', '8']).upload_chunk_size == 8 * 1024 * 1024
+    with pytest.raises(SystemExit):
+        parser.parse_args(['alpha', '--upload-chunk-size', '0'])
+
+
+def test_add_push_arguments_upload_trace_file():
+    parser = argparse.ArgumentParser()
+    add_push_arguments(parser)
+
+    assert parser.parse_args(['alpha']).upload_trace_file is None
+    assert parser.parse_args(['alpha', '--upload-trace-file', 'trace.jsonl']).upload_trace_file == 'trace.jsonl'
+
+
+def test_add_push_arguments_upload_journal_file():
+    parser = argparse.ArgumentParser()
+    add_push_arguments(parser)
+
+    assert parser.parse_args(['alpha']).upload_journal_file is None
+    assert parser.parse_args(['alpha', '--upload-journal-file', 'journal.json']).upload_journal_file == 'journal.json'
+
+
+def test_add_push_arguments_sgs_content_id_cache_file(monkeypatch):
+    monkeypatch.delenv(CONTENT_ID_CACHE_FILE_ENV_VAR, raising=False)
+    parser = argparse.ArgumentParser()
+    add_push_arguments(parser)
+    assert parser.parse_args(['alpha']).sgs_content_id_cache_file is None
+    assert parser.parse_args(['alpha', '--sgs-content-id-cache-file', 'ids.json']).sgs_content_id_cache_file == 'ids.json'
+
+    monkeypatch.setenv(CONTENT_ID_CACHE_FILE_ENV_VAR, 'other_ids.json')
+    parser = argparse.ArgumentParser()
+    add_push_arguments(parser)
+    assert parser.parse_args(['alpha']).sgs_content_id_cache_file == 'other_ids.json'
@@ -1,11 +1,17 @@
+import asyncio
 import copy
 import os
 import pytest
+import tempfile
+import threading
 
 from aioresponses import aioresponses
+from unittest.mock import AsyncMock
 from mozapkpublisher.push_apk import push_apk
-from mozapkpublisher.sgs_api.error import SgsUpdateException
-from ..sgs.common import basic_auth_headers
+from mozapkpublisher.sgs_api import SamsungGalaxyStore
+from mozapkpublisher.sgs_api.content_id_cache import ContentIdCache
+from mozapkpublisher.sgs_api.error import SgsAuthenticationException, SgsUpdateException, SgsUploadException
+from ..sgs.common import basic_auth_headers, fake_sgs_api
 import mozapkpublisher
 
 
@@ -183,6 +189,17 @@ UPDATED_FOCUS_CONTENT_INFO["binaryList"].append(
 )
 
 
+class _AnyContentUpdateOf:
+    def __init__(self, content_id):
+        self._content_id = content_id
+
+    def __eq__(self, content):
+        return content["contentId"] == self._content_id
+
+
+ANY_CONTENT_UPDATE_OF_FOCUS = _AnyContentUpdateOf("000003397900")
+
+
 def setup_default_sgs_api(responses):
     responses.get(
         "https://devapi.samsungapps.com/seller/contentList",
@@ -297,7 +314,7 @@ class ExpectedFormData:
         return self
 
 
-async def run_push_apk(monkeypatch, rollout_rate=None, submit=False):
+async def run_push_apk(monkeypatch, rollout_rate=None, submit=False, sgs_content_id_cache_file=None):
     file = os.path.join(os.path.dirname(__file__), "../", "data", "blob")
     monkeypatch.setattr(
         mozapkpublisher.push_apk, "extract_and_check_apks_metadata", fake_apk_metadata
@@ -319,6 +336,7 @@ async def run_push_apk(monkeypatch, rollout_rate=None, submit=False):
         submit=submit,
         sgs_service_account_id="service_account_id",
         sgs_access_token="access_token",
+        sgs_content_id_cache_file=sgs_content_id_cache_file,
     )
 
 
@@ -541,3 +559,289 @@ async def test_update_with_content_id_missing(responses, monkeypatch):
 
     with pytest.raises(SgsUpdateException, match="Couldn't find a content ID"):
         await run_push_apk(monkeypatch)
+
+
+@pytest.fixture
+def content_id_cache_file():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "content_ids.json")
+
+
+@pytest.mark.asyncio
+async def test_update_with_stale_cached_content_id(responses, monkeypatch, content_id_cache_file):
+    # Points to Firefox instead of Focus
+    ContentIdCache(content_id_cache_file).set("org.mozilla.focus", "000002975732")
+    setup_default_sgs_api(responses)
+    responses.get(
+        "https://devapi.samsungapps.com/seller/contentInfo?contentId=000002975732",
+        status=200,
+        payload=[FIREFOX_CONTENT_INFO],
+    )
+
+    await run_push_apk(monkeypatch, sgs_content_id_cache_file=content_id_cache_file)
+
+    responses.assert_called_with(
+        url="https://devapi.samsungapps.com/seller/contentList",
+        method="GET",
+        headers=basic_auth_headers(),
+    )
+    responses.assert_called_with(
+        url="https://devapi.samsungapps.com/seller/contentUpdate",
+        method="POST",
+        headers=basic_auth_headers(),
+        json=ANY_CONTENT_UPDATE_OF_FOCUS,
+    )
+    assert ContentIdCache(content_id_cache_file).get("org.mozilla.focus") == "000003397900"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, payload", (
+    # The app got deleted
+    (404, {}),
+    # The API doesn't know about the content ID anymore
+    (200, []),
+))
+async def test_update_with_cached_content_id_of_deleted_app(
+    responses, monkeypatch, content_id_cache_file, status, payload
+):
+    ContentIdCache(content_id_cache_file).set("org.mozilla.focus", "000000000001")
+    setup_default_sgs_api(responses)
+    responses.get(
+        "https://devapi.samsungapps.com/seller/contentInfo?contentId=000000000001",
+        status=status,
+        payload=payload,
+    )
+
+    await run_push_apk(monkeypatch, sgs_content_id_cache_file=content_id_cache_file)
+
+    responses.assert_called_with(
+        url="https://devapi.samsungapps.com/seller/contentUpdate",
+        method="POST",
+        headers=basic_auth_headers(),
+        json=ANY_CONTENT_UPDATE_OF_FOCUS,
+    )
+    assert ContentIdCache(content_id_cache_file).get("org.mozilla.focus") == "000003397900"
+
+
+@pytest.mark.asyncio
+async def test_upload_apks_uploads_concurrently():
+    apks = []
+    for i, architecture in enumerate(("armeabi-v7a", "arm64-v8a", "x86", "x86_64")):
+        fd = tempfile.NamedTemporaryFile(suffix=".apk")
+        apks.append((fd, {
+            "package_name": "org.mozilla.focus",
+            "api_level": 21,
+            "version_code": str(390842050 + i),
+            "version_name": "137.1",
+            "architecture": architecture,
+        }))
+
+    uploads = {"current": 0, "max": 0}
+
+    async def upload_file(file, name):
+        uploads["current"] += 1
+        uploads["max"] = max(uploads["max"], uploads["current"])
+        # The first APKs take the longest to upload
+        await asyncio.sleep(0.04 if "armeabi-v7a" in name else 0.01)
+        uploads["current"] -= 1
+        uploads[name] = f"key-{file}"
+        return uploads[name]
+
+    updated_content_infos = []
+
+    async def update_content_info(content_info):
+        updated_content_infos.append(content_info)
+
+    async with SamsungGalaxyStore("service_account_id", "access_token", concurrency_limit=3) as sgs:
+        fake_sgs_api(sgs, {"000003397900": "org.mozilla.focus"})
+        sgs.upload_file = upload_file
+        sgs.api.update_content_info = update_content_info
+        await sgs.upload_apks("org.mozilla.focus", apks, None)
+
+    assert uploads["max"] == 3
+    new_binaries = updated_content_infos[0].binary_list[2:]
+    assert [binary["binarySeq"] for binary in new_binaries] == [306, 307, 308, 309]
+    assert [binary["versionCode"] for binary in new_binaries] == [metadata["version_code"] for _, metadata in apks]
+    assert [binary["filekey"] for binary in new_binaries] == [f"key-{fd.name}" for fd, _ in apks]
+    for fd, _ in apks:
+        fd.close()
+
+
+@pytest.mark.asyncio
+async def test_upload_apks_stops_uploading_after_a_failure():
+    apks = [
+        (tempfile.NamedTemporaryFile(suffix=".apk"), {
+            "package_name": "org.mozilla.focus",
+            "api_level": 21,
+            "version_code": str(390842050 + i),
+            "version_name": "137.1",
+            "architecture": architecture,
+        })
+        for i, architecture in enumerate(("armeabi-v7a", "arm64-v8a"))
+    ]
+    cancelled = []
+
+    async def upload_file(file, name):
+        if "armeabi-v7a" in name:
+            raise SgsUploadException("upload failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        fake_sgs_api(sgs, {"000003397900": "org.mozilla.focus"})
+        sgs.upload_file = upload_file
+        with pytest.raises(SgsUploadException):
+            await sgs.upload_apks("org.mozilla.focus", apks, None)
+
+    assert cancelled == ["org.mozilla.focus-arm64-v8a-137.1.apk"]
+    for fd, _ in apks:
+        fd.close()
+
+
+def _focus_apk():
+    return (tempfile.NamedTemporaryFile(suffix=".apk"), {
+        "package_name": "org.mozilla.focus",
+        "api_level": 21,
+        "version_code": "390842050",
+        "version_name": "137.1",
+        "architecture": "arm64-v8a",
+    })
+
+
+@pytest.mark.asyncio
+async def test_upload_apks_does_not_update_app_once_aborted():
+    update_content_info = AsyncMock()
+    aborted = threading.Event()
+    aborted.set()
+
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        fake_sgs_api(sgs, {"000003397900": "org.mozilla.focus"})
+        sgs.upload_file = AsyncMock(return_value="key")
+        sgs.api.update_content_info = update_content_info
+        with pytest.raises(SgsUpdateException, match="Not updating org.mozilla.focus"):
+            await sgs.upload_apks("org.mozilla.focus", [_focus_apk()], None, aborted=aborted)
+
+    update_content_info.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_upload_apks_is_not_cancelled_while_updating_app():
+    updating = asyncio.Event()
+
+    async def update_content_info(content_info):
+        updating.set()
+        await asyncio.sleep(0.01)
+
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        fake_sgs_api(sgs, {"000003397900": "org.mozilla.focus"})
+        sgs.upload_file = AsyncMock(return_value="key")
+        sgs.api.update_content_info = update_content_info
+        sgs.api.submit_app = AsyncMock()
+
+        push = asyncio.ensure_future(sgs.upload_apks("org.mozilla.focus", [_focus_apk()], None, submit=True))
+        await updating.wait()
+        push.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await push
+
+        # The update went through before the cancellation got raised
+        sgs.api.submit_app.assert_awaited_once_with("000003397900")
+
+
+def fake_upload_api(sgs, rejected_session_ids=()):
+    session_ids = iter(range(1, 100))
+    uploads = []
+
+    async def create_upload_session_id():
+        return {"sessionId": str(next(session_ids))}
+
+    async def upload_file(session_id, file_path, name):
+        await asyncio.sleep(0)
+        uploads.append((session_id, name))
+        if session_id in rejected_session_ids:
+            raise SgsAuthenticationException("Invalid session")
+        return {"fileKey": f"key-{name}"}
+
+    sgs.api.create_upload_session_id = create_upload_session_id
+    sgs.api.upload_file = upload_file
+    return uploads
+
+
+@pytest.mark.asyncio
+async def test_upload_file_reuses_upload_session():
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        uploads = fake_upload_api(sgs)
+        file_keys = await asyncio.gather(*(sgs.upload_file("/path/to/file", name) for name in ("a.apk", "b.apk")))
+        assert file_keys == ["key-a.apk", "key-b.apk"]
+        assert await sgs.upload_file("/path/to/file", "c.apk") == "key-c.apk"
+
+    assert uploads == [("1", "a.apk"), ("1", "b.apk"), ("1", "c.apk")]
+
+
+@pytest.mark.asyncio
+async def test_upload_file_renews_expired_upload_session(monkeypatch):
+    monkeypatch.setattr(mozapkpublisher.sgs_api.time, "monotonic", lambda: 0)
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        uploads = fake_upload_api(sgs)
+        await sgs.upload_file("/path/to/file", "a.apk")
+
+        monkeypatch.setattr(
+            mozapkpublisher.sgs_api.time, "monotonic", lambda: mozapkpublisher.sgs_api.UPLOAD_SESSION_LIFETIME
+        )
+        await sgs.upload_file("/path/to/file", "b.apk")
+
+    assert uploads == [("1", "a.apk"), ("2", "b.apk")]
+
+
+@pytest.mark.asyncio
+async def test_upload_file_renews_rejected_upload_session():
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        uploads = fake_upload_api(sgs, rejected_session_ids=("1",))
+        file_keys = await asyncio.gather(*(sgs.upload_file("/path/to/file", name) for name in ("a.apk", "b.apk")))
+        assert file_keys == ["key-a.apk", "key-b.apk"]
+
+    # Both uploads were rejected, but only one new session was created
+    assert sorted(uploads) == [("1", "a.apk"), ("1", "b.apk"), ("2", "a.apk"), ("2", "b.apk")]
+
+
+@pytest.mark.asyncio
+async def test_upload_file_gives_up_after_second_rejection():
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        uploads = fake_upload_api(sgs, rejected_session_ids=("1", "2"))
+        with pytest.raises(SgsAuthenticationException):
+            await sgs.upload_file("/path/to/file", "a.apk")
+
+    assert uploads == [("1", "a.apk"), ("2", "a.apk")]
+
+
+@pytest.mark.parametrize("failing_binary_seqs", ((), ("307",), ("306", "308")))
+@pytest.mark.asyncio
+async def test_add_binaries_to_staged_rollout_concurrently(failing_binary_seqs):
+    additions = {"current": 0, "max": 0, "binary_seqs": []}
+
+    async def add_binary_to_staged_rollout(content_id, binary_seq):
+        additions["current"] += 1
+        additions["max"] = max(additions["max"], additions["current"])
+        await asyncio.sleep(0.01)
+        additions["current"] -= 1
+        additions["binary_seqs"].append(binary_seq)
+        if binary_seq in failing_binary_seqs:
+            raise SgsUpdateException(f"binary {binary_seq} rejected")
+
+    binary_seqs = ["306", "307", "308", "309"]
+    async with SamsungGalaxyStore("service_account_id", "access_token", concurrency_limit=2) as sgs:
+        sgs.api.add_binary_to_staged_rollout = add_binary_to_staged_rollout
+        if failing_binary_seqs:
+            with pytest.raises(SgsUpdateException) as exc_info:
+                await sgs._add_binaries_to_staged_rollout("000003397900", binary_seqs)
+            for binary_seq in failing_binary_seqs:
+                assert f"binary {binary_seq} rejected" in exc_info.value.message
+        else:
+            await sgs._add_binaries_to_staged_rollout("000003397900", binary_seqs)
+
+    # Every binary is attempted, even after a failure
+    assert sorted(additions["binary_seqs"]) == binary_seqs
+    assert additions["max"] == 2
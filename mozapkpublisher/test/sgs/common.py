@@ -1,3 +1,23 @@
+import asyncio
+import copy
+
+from mozapkpublisher.sgs_api.content_info import AppContentInfo
+from mozapkpublisher.sgs_api.error import SgsContentInfoException
+
+# The parts of a content info that SamsungGalaxyStore reads, for an app with 2 binaries
+FAKE_CONTENT_INFO = {
+    "contentId": "000003397900",
+    "contentStatus": "FOR_SALE",
+    "defaultLanguageCode": "ENG",
+    "paid": "N",
+    "publicationType": "03",
+    "binaryList": [
+        {"binarySeq": "304", "versionCode": "390842046", "packageName": "org.mozilla.focus", "iapSdk": "N", "gms": "Y"},
+        {"binarySeq": "305", "versionCode": "390842048", "packageName": "org.mozilla.focus", "iapSdk": "N", "gms": "Y"},
+    ],
+}
+
+
 def basic_auth_headers():
     headers = {
         "service-account-id": "service_account_id",
@@ -5,3 +25,32 @@ def basic_auth_headers():
         "User-Agent": "mozapkpublisher",
     }
     return headers
+
+
+def fake_sgs_api(store, package_names_per_content_id, failing_content_ids=()):
+    lookups = {"current": 0, "max": 0, "content_ids": []}
+
+    async def app_list():
+        return [{"contentId": content_id} for content_id in package_names_per_content_id]
+
+    async def get_content_info(content_id):
+        lookups["content_ids"].append(content_id)
+        lookups["current"] += 1
+        lookups["max"] = max(lookups["max"], lookups["current"])
+        try:
+            # Let other lookups start, so concurrency can be observed
+            await asyncio.sleep(0.01)
+        finally:
+            lookups["current"] -= 1
+
+        if content_id in failing_content_ids:
+            raise SgsContentInfoException(f"{content_id} is broken")
+        content_info = copy.deepcopy(FAKE_CONTENT_INFO)
+        content_info["contentId"] = content_id
+        for binary in content_info["binaryList"]:
+            binary["packageName"] = package_names_per_content_id[content_id]
+        return [AppContentInfo(content_info)]
+
+    store.api.app_list = app_list
+    store.api.get_content_info = get_content_info
+    return lookups
@@ -8,11 +8,13 @@ import time
 from contextlib import nullcontext as does_not_raise
 
 from .common import basic_auth_headers
+from mozapkpublisher.sgs_api import SamsungGalaxyApi
 from mozapkpublisher.sgs_api.auth import create_jwt_for_auth, create_access_token
 from mozapkpublisher.sgs_api.error import (
     SgsAuthenticationException,
     SgsAuthorizationException,
 )
+from mozapkpublisher.sgs_api.utils import create_client_session
 
 
 @pytest.fixture
@@ -87,6 +89,32 @@ async def test_create_token(rsa_keypair, status, response, expectation, response
         assert token == "jambonBeurre"
 
 
+@pytest.mark.asyncio
+async def test_create_token_with_shared_session(rsa_keypair, responses_mock):
+    _, private_key = rsa_keypair
+    jwt = create_jwt_for_auth("abc-123", ["publishing"], private_key)
+    responses_mock.post(
+        "https://devapi.samsungapps.com/auth/accessToken",
+        status=200,
+        payload={"ok": True, "createdItem": {"accessToken": "jambonBeurre"}},
+    )
+    responses_mock.get(
+        "https://devapi.samsungapps.com/auth/checkAccessToken",
+        status=200,
+        payload={"ok": True},
+    )
+
+    async with create_client_session() as session:
+        token = await create_access_token(jwt, session)
+        assert not session.closed
+
+        async with SamsungGalaxyApi("abc-123", token, session=session) as sgs:
+            assert await sgs.check_access_token() == {"ok": True}
+
+        # The session belongs to the caller
+        assert not session.closed
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "status,response,expectation",
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from .common import fake_sgs_api
+from mozapkpublisher.sgs_api import SamsungGalaxyStore
+from mozapkpublisher.sgs_api.content_id_cache import ContentIdCache
+from mozapkpublisher.sgs_api.error import SgsUpdateException
+
+
+@pytest.mark.asyncio
+async def test_infer_content_id_looks_up_apps_concurrently():
+    package_names_per_content_id = {str(i): f"org.mozilla.app{i}" for i in range(10)}
+    async with SamsungGalaxyStore("service_account_id", "access_token", concurrency_limit=3) as sgs:
+        lookups = fake_sgs_api(sgs, package_names_per_content_id)
+        assert await sgs.infer_content_id_from_package_name("org.mozilla.app9") == "9"
+
+    assert lookups["max"] == 3
+    assert sorted(lookups["content_ids"], key=int) == list(package_names_per_content_id)
+
+
+@pytest.mark.asyncio
+async def test_infer_content_id_stops_at_first_match():
+    package_names_per_content_id = {str(i): f"org.mozilla.app{i}" for i in range(10)}
+    async with SamsungGalaxyStore("service_account_id", "access_token", concurrency_limit=1) as sgs:
+        lookups = fake_sgs_api(sgs, package_names_per_content_id)
+        assert await sgs.infer_content_id_from_package_name("org.mozilla.app1") == "1"
+
+    assert lookups["content_ids"] == ["0", "1"]
+
+
+@pytest.mark.asyncio
+async def test_infer_content_id_skips_apps_that_cannot_be_looked_up():
+    package_names_per_content_id = {str(i): f"org.mozilla.app{i}" for i in range(5)}
+    async with SamsungGalaxyStore("service_account_id", "access_token", concurrency_limit=5) as sgs:
+        fake_sgs_api(sgs, package_names_per_content_id, failing_content_ids=("1", "3"))
+        assert await sgs.infer_content_id_from_package_name("org.mozilla.app4") == "4"
+
+        with pytest.raises(SgsUpdateException) as exc_info:
+            await sgs.infer_content_id_from_package_name("org.mozilla.app3")
+
+    assert "Couldn't find a content ID" in exc_info.value.message
+    assert "3 (SgsContentInfoException: 3 is broken)" in exc_info.value.message
+
+
+@pytest.mark.asyncio
+async def test_infer_content_id_reuses_index():
+    package_names_per_content_id = {"1": "org.mozilla.firefox", "2": "org.mozilla.focus", "3": "org.mozilla.klar"}
+    async with SamsungGalaxyStore("service_account_id", "access_token") as sgs:
+        lookups = fake_sgs_api(sgs, package_names_per_content_id)
+        results = await asyncio.gather(*(
+            sgs.infer_content_id_from_package_name(package_name)
+            for package_name in ("org.mozilla.klar", "org.mozilla.firefox", "org.mozilla.focus")
+        ))
+        assert results == ["3", "1", "2"]
+
+        with pytest.raises(SgsUpdateException, match="Couldn't find a content ID"):
+            await sgs.infer_content_id_from_package_name("org.mozilla.fenix")
+
+    # Every app was looked up once, despite 4 lookups
+    assert sorted(lookups["content_ids"]) == ["1", "2", "3"]
+
+
+@pytest.fixture
+def content_id_cache_file():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "content_ids.json")
+
+
+@pytest.mark.asyncio
+async def test_infer_content_id_uses_cache(content_id_cache_file):
+    ContentIdCache(content_id_cache_file).set("org.mozilla.focus", "2")
+    package_names_per_content_id = {"1": "org.mozilla.firefox", "2": "org.mozilla.focus"}
+    async with SamsungGalaxyStore(
+        "service_account_id", "access_token", content_id_cache=ContentIdCache(content_id_cache_file)
+    ) as sgs:
+        lookups = fake_sgs_api(sgs, package_names_per_content_id)
+        assert await sgs.infer_content_id_from_package_name("org.mozilla.focus") == "2"
+        assert lookups["content_ids"] == []
+
+        assert await sgs.infer_content_id_from_package_name("org.mozilla.firefox") == "1"
+
+    assert ContentIdCache(content_id_cache_file).get("org.mozilla.firefox") == "1"
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+import pytest
+
+from mozapkpublisher.sgs_api import content_id_cache
+from mozapkpublisher.sgs_api.content_id_cache import ContentIdCache
+
+
+@pytest.fixture
+def cache_path():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "content_ids.json")
+
+
+def test_content_id_cache_persists_entries(cache_path):
+    cache = ContentIdCache(cache_path)
+    assert cache.get("org.mozilla.focus") is None
+
+    cache.set("org.mozilla.focus", "000003397900")
+    assert ContentIdCache(cache_path).get("org.mozilla.focus") == "000003397900"
+
+    cache.invalidate("org.mozilla.focus")
+    assert ContentIdCache(cache_path).get("org.mozilla.focus") is None
+
+
+def test_content_id_cache_expires_entries(cache_path, monkeypatch):
+    monkeypatch.setattr(content_id_cache.time, "time", lambda: 1000)
+    ContentIdCache(cache_path, ttl=60).set("org.mozilla.focus", "000003397900")
+
+    monkeypatch.setattr(content_id_cache.time, "time", lambda: 1060)
+    assert ContentIdCache(cache_path, ttl=60).get("org.mozilla.focus") == "000003397900"
+
+    monkeypatch.setattr(content_id_cache.time, "time", lambda: 1061)
+    assert ContentIdCache(cache_path, ttl=60).get("org.mozilla.focus") is None
+
+
+@pytest.mark.parametrize("content", ("not json", '{"version": 0, "entries": {}}'))
+def test_content_id_cache_ignores_unreadable_cache(cache_path, content):
+    with open(cache_path, "w") as f:
+        f.write(content)
+
+    cache = ContentIdCache(cache_path)
+    assert cache.get("org.mozilla.focus") is None
+    cache.set("org.mozilla.focus", "000003397900")
+    assert ContentIdCache(cache_path).get("org.mozilla.focus") == "000003397900"
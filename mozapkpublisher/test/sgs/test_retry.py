@@ -0,0 +1,98 @@
+import aiohttp
+import pytest
+
+from unittest.mock import AsyncMock
+from yarl import URL
+
+from mozapkpublisher.sgs_api import retry, SamsungGalaxyApi
+from mozapkpublisher.sgs_api.retry import RetryPolicy
+
+CONTENT_LIST_URL = "https://devapi.samsungapps.com/seller/contentList"
+CONTENT_SUBMIT_URL = "https://devapi.samsungapps.com/seller/contentSubmit"
+FILE_UPLOAD_URL = "https://seller.samsungapps.com/galaxyapi/fileUpload"
+STAGED_ROLLOUT_BINARY_URL = "https://devapi.samsungapps.com/seller/v2/content/stagedRolloutBinary"
+
+
+@pytest.fixture
+def sleep_mock(monkeypatch):
+    sleep_mock = AsyncMock()
+    monkeypatch.setattr(retry, "_sleep", sleep_mock)
+    return sleep_mock
+
+
+@pytest.mark.parametrize(
+    "retries, retry_after, expected_min, expected_max",
+    (
+        (0, None, 0, 1),
+        (3, None, 0, 8),
+        (10, None, 0, 30),
+        (0, "5", 5, 5),
+        (0, "1000", 120, 120),
+        (0, "Wed, 21 Oct 2015 07:28:00 GMT", 0, 0),
+        (2, "not a delay", 0, 4),
+    ),
+)
+def test_retry_policy_get_delay(retries, retry_after, expected_min, expected_max):
+    assert expected_min <= RetryPolicy().get_delay(retries, retry_after) <= expected_max
+
+
+@pytest.mark.asyncio
+async def test_request_retries_idempotent_requests(sgs, responses_mock, sleep_mock):
+    responses_mock.get(CONTENT_LIST_URL, status=503, payload={})
+    responses_mock.get(CONTENT_LIST_URL, status=429, headers={"Retry-After": "7"}, payload={})
+    responses_mock.get(CONTENT_LIST_URL, exception=aiohttp.ServerDisconnectedError())
+    responses_mock.get(CONTENT_LIST_URL, status=200, payload=[{"contentId": "000003397900"}])
+
+    assert await sgs.app_list() == [{"contentId": "000003397900"}]
+    assert sleep_mock.call_count == 3
+    assert sleep_mock.call_args_list[1].args == (7.0,)
+    assert sgs.retry_counts == {"GET /seller/contentList": 3}
+
+
+@pytest.mark.asyncio
+async def test_request_gives_up_after_max_retries(responses_mock, sleep_mock):
+    responses_mock.get(CONTENT_LIST_URL, status=500, payload={}, repeat=True)
+    async with SamsungGalaxyApi("service_account_id", "access_token", RetryPolicy(max_retries=2)) as sgs:
+        with pytest.raises(aiohttp.ClientResponseError) as exc_info:
+            await sgs.app_list()
+
+    assert exc_info.value.status == 500
+    assert sleep_mock.call_count == 2
+    assert sgs.retry_counts == {"GET /seller/contentList": 2}
+
+
+@pytest.mark.asyncio
+async def test_request_does_not_retry_non_idempotent_requests(sgs, responses_mock, sleep_mock):
+    responses_mock.post(CONTENT_SUBMIT_URL, status=503, payload={})
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await sgs.submit_app("000003397900")
+
+    sleep_mock.assert_not_called()
+    assert sgs.retry_counts == {}
+
+
+@pytest.mark.asyncio
+async def test_add_binary_to_staged_rollout_is_not_retried(sgs, responses_mock, sleep_mock):
+    responses_mock.put(STAGED_ROLLOUT_BINARY_URL, status=503, payload={})
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await sgs.add_binary_to_staged_rollout("000003397900", "3")
+
+    sleep_mock.assert_not_called()
+    assert sgs.retry_counts == {}
+
+
+@pytest.mark.asyncio
+async def test_upload_file_is_retried_with_a_new_form(sgs, responses_mock, sleep_mock, tmp_path):
+    apk = tmp_path / "app.apk"
+    apk.write_bytes(b"apk content")
+    responses_mock.post(FILE_UPLOAD_URL, exception=aiohttp.ClientConnectionError())
+    responses_mock.post(FILE_UPLOAD_URL, status=200, payload={"fileKey": "abc", "fileSize": 11})
+
+    assert (await sgs.upload_file("789", str(apk), "app.apk"))["fileKey"] == "abc"
+
+    forms = [call.kwargs["data"] for call in responses_mock.requests[("POST", URL(FILE_UPLOAD_URL))]]
+    assert len(forms) == 2
+    assert forms[0] is not forms[1]
+    assert sgs.retry_counts == {"POST /galaxyapi/fileUpload": 1}
@@ -0,0 +1,46 @@
+import aiohttp
+import pytest
+
+from mozapkpublisher.sgs_api import SamsungGalaxyApi, SamsungGalaxyStore
+from mozapkpublisher.sgs_api.utils import create_client_session
+
+
+@pytest.mark.asyncio
+async def test_create_client_session():
+    timeout = aiohttp.ClientTimeout(total=60, connect=5, sock_read=10)
+    async with create_client_session(limit_per_host=4, ttl_dns_cache=60, timeout=timeout) as session:
+        assert isinstance(session.connector, aiohttp.TCPConnector)
+        assert session.connector.limit_per_host == 4
+        assert session.timeout == timeout
+
+
+@pytest.mark.asyncio
+async def test_api_creates_its_session_lazily():
+    api = SamsungGalaxyApi("service_account_id", "access_token")
+    assert api._client is None
+
+    async with api:
+        session = api._client
+        assert isinstance(session, aiohttp.ClientSession)
+        assert not session.closed
+
+    assert session.closed
+    assert api._client is None
+
+
+@pytest.mark.asyncio
+async def test_api_is_configured_with_session_options():
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with SamsungGalaxyStore(
+        "service_account_id", "access_token", session_options={"limit_per_host": 2, "timeout": timeout}
+    ) as sgs:
+        assert sgs.api._client.connector.limit_per_host == 2
+        assert sgs.api._client.timeout == timeout
+
+
+@pytest.mark.asyncio
+async def test_api_without_session_raises_a_clear_error():
+    api = SamsungGalaxyApi("service_account_id", "access_token")
+
+    with pytest.raises(RuntimeError, match="async with"):
+        await api.app_list()
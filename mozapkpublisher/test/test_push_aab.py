@@ -51,7 +51,8 @@ def patch_store_transaction(monkeypatch_, patch_target):
     mock_edit = create_autospec(patch_target)
 
     @contextmanager
-    def fake_transaction(_, __, *, contact_server, dry_run):
+    def fake_transaction(_, __, *, contact_server, dry_run, upload_jobs=1, upload_chunk_size=None,
+                         upload_tracer=None, upload_journal=None):
         yield mock_edit
 
     monkeypatch_.setattr(patch_target, 'transaction', fake_transaction)
@@ -109,6 +110,14 @@ def test_main_google(monkeypatch):
             None,
             True,
             True,
+            metadata_cache_dir=None,
+            use_bundletool=False,
+            jobs=1,
+            upload_jobs=1,
+            upload_chunk_size=None,
+            upload_trace_file=None,
+            upload_journal_file=None,
+            package_failure_policy='fail-fast',
         )
 
 
@@ -7,12 +7,15 @@ import mozapkpublisher
 import os
 import pytest
 import sys
+import threading
 
 from unittest.mock import create_autospec, MagicMock
 
 from tempfile import NamedTemporaryFile
 
 from mozapkpublisher.common import store
+from mozapkpublisher.common.exceptions import BadSetOfApks, PushFailed, WrongArgumentGiven
+from mozapkpublisher.common.utils import BEST_EFFORT
 from mozapkpublisher.push_apk import (
     push_apk,
     main,
@@ -76,7 +79,8 @@ def patch_store_transaction(monkeypatch_, patch_target):
     mock_edit = create_autospec(patch_target)
 
     @contextmanager
-    def fake_transaction(_, __, *, contact_server, dry_run):
+    def fake_transaction(_, __, *, contact_server, dry_run, upload_jobs=1, upload_chunk_size=None,
+                         upload_tracer=None, upload_journal=None):
         yield mock_edit
 
     monkeypatch_.setattr(patch_target, 'transaction', fake_transaction)
@@ -95,6 +99,121 @@ async def test_google(monkeypatch):
     ], 'rollout', 50)
 
 
+@pytest.mark.asyncio
+async def test_google_pushes_each_package_name_in_its_own_edit(monkeypatch):
+    mock_metadata = {
+        apk_arm: {'package_name': 'org.mozilla.fenix', 'version_code': '0'},
+        apk_x86: {'package_name': 'org.mozilla.focus', 'version_code': '1'},
+    }
+    monkeypatch.setattr('mozapkpublisher.push_apk.extract_and_check_apks_metadata', lambda *args, **kwargs: mock_metadata)
+    edits = {}
+    # Both edits must be open at the same time for either to complete
+    barrier = threading.Barrier(2, timeout=5)
+
+    @contextmanager
+    def fake_transaction(_, package_name, *, contact_server, dry_run, upload_jobs=1, upload_chunk_size=None,
+                         upload_tracer=None, upload_journal=None):
+        edits[package_name] = MagicMock()
+        if package_name == 'org.mozilla.focus':
+            edits[package_name].update_app.side_effect = ValueError('upload failed')
+        barrier.wait()
+        yield edits[package_name]
+
+    monkeypatch.setattr(store.GooglePlayEdit, 'transaction', fake_transaction)
+
+    with pytest.raises(PushFailed) as exc_info:
+        await push_apk(APKS, credentials, [], 'alpha', contact_server=False, package_failure_policy=BEST_EFFORT)
+
+    assert list(exc_info.value.failures.keys()) == ['org.mozilla.focus']
+    edits['org.mozilla.fenix'].update_app.assert_called_once_with([(apk_arm, mock_metadata[apk_arm])], track='alpha')
+    edits['org.mozilla.focus'].update_app.assert_called_once_with([(apk_x86, mock_metadata[apk_x86])], track='alpha')
+
+
+def patch_pipelined_transactions(monkeypatch_):
+    edits = {}
+    committed = []
+
+    @contextmanager
+    def fake_transaction(_, package_name, *, contact_server, dry_run, upload_jobs=1, upload_chunk_size=None,
+                         upload_tracer=None, upload_journal=None):
+        edits[package_name] = create_autospec(store.GooglePlayEdit)
+        yield edits[package_name]
+        committed.append(package_name)
+
+    monkeypatch_.setattr(store.GooglePlayEdit, 'transaction', fake_transaction)
+    return edits, committed
+
+
+@pytest.mark.asyncio
+async def test_google_pipeline_uploads_while_extracting(monkeypatch):
+    edits, committed = patch_pipelined_transactions(monkeypatch)
+    events = []
+
+    def fake_iter_checked_apks_metadata(*args, **kwargs):
+        # APKs come in the order they're extracted, which isn't the one they were given in
+        for apk, version_code in ((apk_arm, '0'), (apk_x86, '1')):
+            events.append('extracted {}'.format(version_code))
+            yield apk, {'package_name': 'org.mozilla.firefox', 'version_code': version_code}
+        events.append('cross-checked')
+
+    monkeypatch.setattr('mozapkpublisher.push_apk.iter_checked_apks_metadata', fake_iter_checked_apks_metadata)
+
+    await push_apk(APKS, credentials, ['org.mozilla.firefox'], 'production', rollout_percentage=10,
+                   contact_server=False, pipeline=True)
+
+    edit = edits['org.mozilla.firefox']
+    assert sorted(call.args[0].name for call in edit.upload_apk.call_args_list) == sorted([apk_arm.name, apk_x86.name])
+    # Version codes follow the order APKs were given
+    edit.update_track.assert_called_once_with(version_codes=['1', '0'], track='production', rollout_percentage=10)
+    assert events[-1] == 'cross-checked'
+    assert committed == ['org.mozilla.firefox']
+
+
+@pytest.mark.asyncio
+async def test_google_pipeline_abandons_edits_when_checks_fail(monkeypatch):
+    edits, committed = patch_pipelined_transactions(monkeypatch)
+
+    def fake_iter_checked_apks_metadata(*args, **kwargs):
+        yield apk_arm, {'package_name': 'org.mozilla.firefox', 'version_code': '0'}
+        raise BadSetOfApks('APKs are not sane')
+
+    monkeypatch.setattr('mozapkpublisher.push_apk.iter_checked_apks_metadata', fake_iter_checked_apks_metadata)
+
+    with pytest.raises(BadSetOfApks):
+        await push_apk(APKS, credentials, ['org.mozilla.firefox', 'org.mozilla.fenix'], 'production',
+                       contact_server=False, pipeline=True)
+
+    # Both edits were opened upfront, neither is committed
+    assert sorted(edits.keys()) == ['org.mozilla.fenix', 'org.mozilla.firefox']
+    edits['org.mozilla.firefox'].update_track.assert_not_called()
+    assert committed == []
+
+
+@pytest.mark.asyncio
+async def test_pipeline_is_only_supported_by_google(monkeypatch):
+    with pytest.raises(WrongArgumentGiven):
+        await push_apk(APKS, None, ['org.mozilla.firefox'], 'production', store='samsung', pipeline=True)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_rejects_best_effort(monkeypatch):
+    with pytest.raises(WrongArgumentGiven):
+        await push_apk(APKS, credentials, ['org.mozilla.firefox'], 'production', contact_server=False,
+                       package_failure_policy=BEST_EFFORT, pipeline=True)
+
+
+def test_main_pipeline_rejects_best_effort(monkeypatch):
+    file = os.path.join(os.path.dirname(__file__), 'data', 'blob')
+    monkeypatch.setattr(sys, 'argv', [
+        'script', '--secret', file, 'alpha', file, '--expected-package-name=org.mozilla.fennec_aurora',
+        '--pipeline', '--package-failure-policy', BEST_EFFORT,
+    ])
+
+    with pytest.raises(SystemExit) as exception:
+        main()
+    assert exception.value.code == 2
+
+
 @pytest.mark.asyncio
 async def test_push_apk_tunes_down_logs(monkeypatch):
     main_logging_mock = MagicMock()
@@ -143,7 +262,16 @@ def test_main_google(monkeypatch):
             False,
             submit=False,
             sgs_service_account_id=None,
-            sgs_access_token=None
+            sgs_access_token=None,
+            sgs_content_id_cache_file=None,
+            jobs=1,
+            metadata_cache_dir=None,
+            upload_jobs=1,
+            upload_chunk_size=None,
+            upload_trace_file=None,
+            upload_journal_file=None,
+            package_failure_policy='fail-fast',
+            pipeline=False,
         )
 
 
@@ -179,7 +307,16 @@ def test_main_samsung(monkeypatch):
             False,
             submit=True,
             sgs_service_account_id='123',
-            sgs_access_token='456'
+            sgs_access_token='456',
+            sgs_content_id_cache_file=None,
+            jobs=1,
+            metadata_cache_dir=None,
+            upload_jobs=1,
+            upload_chunk_size=None,
+            upload_trace_file=None,
+            upload_journal_file=None,
+            package_failure_policy='fail-fast',
+            pipeline=False,
         )
 
 